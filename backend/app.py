@@ -1,13 +1,94 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
+import cProfile
+import gzip
+import os
 import sys
 import pandas as pd
 import numpy as np
 import json
 from datetime import datetime, timedelta
 import time
+from functools import partial
+
+from backtest_engine import run_backtest_arrays
+from batched_backtest import batched_backtest
+from execution import ExecutionError, build_execution_model, run_execution_backtest
+from indicators import INDICATOR_FUNCTIONS, indicator_cache, price_fingerprint
+from instrumentation import observe_request, profile_summary, render_metrics, stage, start_recording, stop_recording
+from jobs import job_manager
+from market_data import MarketDataError, bar_dates, generate_stock_data, to_records
+from montecarlo import DEFAULT_BINS, DEFAULT_PATHS, DEFAULT_PERCENTILES, METHODS, backtest_samples, run_montecarlo
+from optimizers import SEARCH_METHODS, ParamSpace, expand_param_range, run_search
+from parallel_search import ParallelSearchError, WorkerPool, resolve_workers
+from portfolio import run_portfolio_backtest
+from price_series import PriceSeries, PriceSeriesError, to_price_series
+from price_store import DEFAULT_INTERVAL, PriceStoreError, price_store
+from result_store import DEFAULT_LIST_LIMIT, ResultStoreError, evaluation_keys, result_key, result_store
+from serialization import (
+    columnar, columnar_to_legacy, columnar_to_records, dumps, get_response_format, json_response, raw_json_response
+)
+from shared_store import SharedStoreError
+from stock_universe import DEFAULT_PAGE_SIZE, stock_universe
+from strategies import STRATEGIES, IndicatorRows, StrategyError, get_strategy, strategy_signal_rows
+from streaming import StreamingError, StreamingSession, session_store as stream_sessions
+from walkforward import DEFAULT_TEST_SIZE, DEFAULT_TRAIN_SIZE, run_walkforward
 
 app = Flask(__name__)
 
+# 請求內容（含price_data）的大小上限，超過時返回413；可透過環境變數 MAX_REQUEST_MB 設定
+app.config['MAX_CONTENT_LENGTH'] = int(float(os.environ.get('MAX_REQUEST_MB', '64')) * 1024 * 1024)
+
+# 回應的gzip壓縮等級（0為不壓縮）與最小壓縮大小，可透過環境變數 GZIP_LEVEL、GZIP_MIN_BYTES 設定
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '5'))
+GZIP_MIN_BYTES = int(os.environ.get('GZIP_MIN_BYTES', '1024'))
+GZIP_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/plain', 'text/html', 'text/csv')
+
+# 背景優化任務每評估多少組參數回報一次進度
+PROGRESS_CHUNK_SIZE = 100
+
+# 批量產生模擬數據時一次最多的股票數
+MAX_BULK_SYMBOLS = 5000
+
+# 上傳的二進位價格數據格式錯誤
+@app.errorhandler(PriceSeriesError)
+def handle_price_series_error(e):
+    return jsonify({'error': str(e)}), 400
+
+# 共用的狀態資料庫（背景任務、串流會話）無法開啟
+@app.errorhandler(SharedStoreError)
+def handle_shared_store_error(e):
+    return jsonify({'error': str(e)}), 500
+
+# 請求內容超過 MAX_CONTENT_LENGTH
+@app.errorhandler(413)
+def handle_request_too_large(e):
+    limit_mb = app.config['MAX_CONTENT_LENGTH'] / 1024 / 1024
+    return jsonify({'error': f'請求內容超過上限 {limit_mb:g} MB，請改用symbol讀取本地價格資料庫或縮短資料期間'}), 413
+
+# 用戶端支援時以gzip壓縮回應（串流回應與過小的回應不壓縮）
+# 最先註冊，在其他after_request處理完成後最後執行
+@app.after_request
+def compress_response(response):
+    if (
+        GZIP_LEVEL <= 0
+        or response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in GZIP_MIMETYPES
+        or 'gzip' not in request.headers.get('Accept-Encoding', '').lower()
+    ):
+        return response
+    
+    body = response.get_data()
+    if len(body) < GZIP_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
 # 設定CORS允許跨域請求
 @app.after_request
 def after_request(response):
@@ -16,38 +97,83 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
+# 請求計時：記錄各階段耗時，?profile=1 時同時以cProfile分析（未開啟時不建立分析器）
+@app.before_request
+def start_request_timing():
+    g.stage_recorder = start_recording()
+    if request.args.get('profile') == '1':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+# 輸出 Server-Timing 標頭並記錄延遲指標；開啟分析時以 {'response': 原回應, 'profile': 摘要} 取代JSON回應
+@app.after_request
+def finish_request_timing(response):
+    recorder = g.pop('stage_recorder', None)
+    if recorder is None:
+        return response
+    
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        if response.is_json:
+            payload = {'response': response.get_json(), 'profile': profile_summary(profiler)}
+            response.set_data(dumps(payload))
+    
+    elapsed = recorder.elapsed()
+    response.headers['Server-Timing'] = recorder.server_timing(elapsed)
+    
+    # 以路由規則區分端點，請求內容中的策略類型作為標籤
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    data = g.pop('request_data', None)
+    strategy = data.get('strategy') if isinstance(data, dict) else None
+    observe_request(endpoint, request.method, response.status_code, strategy_label(strategy), elapsed, recorder)
+    return response
+
+# 延遲指標的策略標籤：只使用策略註冊表中的名稱，其他值（含非字串）記為other，避免標籤數量無限增長
+def strategy_label(strategy):
+    if not isinstance(strategy, dict):
+        return ''
+    strategy_type = strategy.get('type', '')
+    if isinstance(strategy_type, str) and (strategy_type in STRATEGIES or strategy_type == ''):
+        return strategy_type
+    return 'other'
+
+@app.teardown_request
+def stop_request_timing(exc):
+    stop_recording()
+
+# Prometheus格式的延遲指標
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 # 搜索股票
+# 從共用的股票清單索引中搜尋代碼、名稱、別名與產業，依相符程度排序；page與page_size分頁，總數放在 X-Total-Count 標頭
 @app.route('/api/stocks/search', methods=['GET'])
 def search_stocks():
     query = request.args.get('query', '')
     if not query:
         return jsonify({'error': '請提供搜索關鍵字'}), 400
     
-    # 這裡模擬搜索結果，實際應用中可以連接到更完整的股票數據庫
-    # 台灣股票代碼通常是數字加上.TW
-    taiwan_stocks = [
-        {'symbol': '2330.TW', 'name': '台積電', 'exchange': 'TAI', 'industry': '半導體'},
-        {'symbol': '2317.TW', 'name': '鴻海', 'exchange': 'TAI', 'industry': '電子零組件'},
-        {'symbol': '2412.TW', 'name': '中華電信', 'exchange': 'TAI', 'industry': '電信服務'},
-        {'symbol': '2454.TW', 'name': '聯發科', 'exchange': 'TAI', 'industry': '半導體'},
-        {'symbol': '2882.TW', 'name': '國泰金', 'exchange': 'TAI', 'industry': '金融業'},
-        {'symbol': '2881.TW', 'name': '富邦金', 'exchange': 'TAI', 'industry': '金融業'},
-        {'symbol': '1301.TW', 'name': '台塑', 'exchange': 'TAI', 'industry': '塑膠工業'},
-        {'symbol': '2303.TW', 'name': '聯電', 'exchange': 'TAI', 'industry': '半導體'},
-        {'symbol': '2308.TW', 'name': '台達電', 'exchange': 'TAI', 'industry': '電子零組件'},
-        {'symbol': '2002.TW', 'name': '中鋼', 'exchange': 'TAI', 'industry': '鋼鐵業'},
-        {'symbol': '0050.TW', 'name': '元大台灣50', 'exchange': 'TAI', 'industry': 'ETF'},
-        {'symbol': '0056.TW', 'name': '元大高股息', 'exchange': 'TAI', 'industry': 'ETF'},
-    ]
-    
-    # 根據查詢過濾股票
-    results = [stock for stock in taiwan_stocks if 
-               query.lower() in stock['symbol'].lower() or 
-               query.lower() in stock['name'].lower()]
+    try:
+        page = int(request.args.get('page', 1))
+        page_size = int(request.args.get('page_size', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'page與page_size必須為整數'}), 400
     
-    return jsonify(results)
+    total, results = stock_universe.search(query, page, page_size)
+    response = jsonify(results)
+    response.headers['X-Total-Count'] = str(total)
+    response.headers['Access-Control-Expose-Headers'] = 'X-Total-Count'
+    return response
+
+# 查詢參數或請求內容中的布林旗標（1/true）
+def is_true(value):
+    return str(value).lower() in ('1', 'true')
 
 # 獲取股票數據
+# 以向量化的模擬數據產生器依 range 與 interval 產生K線（每檔股票固定種子，可用seed/end參數重現）
+# 預設返回舊版的逐列格式，format=columnar時返回欄式格式
 @app.route('/api/stocks/data', methods=['GET'])
 def get_stock_data():
     symbol = request.args.get('symbol', '')
@@ -60,199 +186,328 @@ def get_stock_data():
     try:
         # 模擬股票數據
         # 在實際應用中，這裡會使用Yahoo Finance API獲取真實數據
-        dates = pd.date_range(end=datetime.now(), periods=365).tolist()
-        
-        # 生成模擬價格數據
-        base_price = 500  # 假設基礎價格
-        if '2330' in symbol:  # 台積電
-            base_price = 500
-        elif '2317' in symbol:  # 鴻海
-            base_price = 120
-        elif '2412' in symbol:  # 中華電信
-            base_price = 110
-        
-        # 生成隨機價格波動
-        np.random.seed(42)  # 固定隨機種子以獲得可重複的結果
-        price_changes = np.random.normal(0, 1, len(dates)) * base_price * 0.01
-        
-        # 計算價格序列
-        closes = [base_price]
-        for change in price_changes:
-            closes.append(closes[-1] * (1 + change))
-        closes = closes[1:]  # 移除初始價格
-        
-        # 生成其他價格數據
-        price_data = []
-        for i, date in enumerate(dates):
-            close = closes[i]
-            price_data.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'open': close * (1 - np.random.random() * 0.01),
-                'high': close * (1 + np.random.random() * 0.015),
-                'low': close * (1 - np.random.random() * 0.015),
-                'close': close,
-                'volume': int(np.random.random() * 10000000 + 5000000),
-            })
+        series = generate_stock_data(
+            symbol, range_period, interval, request.args.get('end'), request.args.get('seed')
+        )
         
-        # 股票信息
-        stock_info = {
-            'symbol': symbol,
-            'name': next((stock['name'] for stock in [
-                {'symbol': '2330.TW', 'name': '台積電'},
-                {'symbol': '2317.TW', 'name': '鴻海'},
-                {'symbol': '2412.TW', 'name': '中華電信'},
-                {'symbol': '2454.TW', 'name': '聯發科'},
-                {'symbol': '0050.TW', 'name': '元大台灣50'}
-            ] if stock['symbol'] == symbol), '未知'),
-            'exchange': 'TAI',
-            'currency': 'TWD',
-            'regularMarketPrice': closes[-1],
-            'previousClose': closes[-2],
-        }
-        
-        return jsonify({
-            'stock_info': stock_info,
-            'price_data': price_data
+        # store=1時寫入本地價格資料庫（每個K線週期分開保存），之後的回測與優化可直接以股票代碼與interval引用
+        # 模擬數據不覆蓋既有的K線（例如匯入的真實價格）；以seed參數產生的數據不是該股票的數據，不寫入
+        if is_true(request.args.get('store')) and request.args.get('seed') is None:
+            try:
+                price_store.write(symbol, series.to_frame(), interval, overwrite=False)
+            except (OSError, PriceStoreError) as e:
+                app.logger.warning(f'寫入本地價格資料庫失敗: {e}')
+        
+        return json_response({
+            'stock_info': build_stock_info(symbol, series),
+            'price_data': series.to_columnar() if request.args.get('format') == 'columnar' else to_records(series)
         })
-            
+    
+    except MarketDataError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'獲取股票數據時發生錯誤: {str(e)}'}), 500
 
+# 批量產生多檔股票的模擬數據，以NDJSON串流輸出（每行一檔股票），不需一次保存所有股票的數據
+# GET以逗號分隔的symbols查詢參數，POST以JSON傳入symbols列表，未提供時產生整個股票清單；store=1時同時寫入本地價格資料庫
+@app.route('/api/stocks/data/bulk', methods=['GET', 'POST'])
+def get_bulk_stock_data():
+    params = (get_request_data() or {}) if request.method == 'POST' else request.args.to_dict()
+    symbols = params.get('symbols') or stock_universe.symbols()
+    if isinstance(symbols, str):
+        symbols = [symbol.strip() for symbol in symbols.split(',') if symbol.strip()]
+    
+    if not isinstance(symbols, list) or not symbols:
+        return jsonify({'error': '請提供股票代碼列表'}), 400
+    if len(symbols) > MAX_BULK_SYMBOLS:
+        return jsonify({'error': f'一次最多產生 {MAX_BULK_SYMBOLS} 檔股票'}), 400
+    
+    range_period = params.get('range', '1y')
+    interval = params.get('interval', '1d')
+    end = params.get('end')
+    legacy = params.get('format') == 'legacy'
+    store = is_true(params.get('store'))
+    
+    # 先檢查股票代碼、期間與週期，錯誤時在開始串流前返回（串流開始後只能中斷回應）
+    invalid = [symbol for symbol in symbols if not isinstance(symbol, str) or not symbol]
+    if invalid:
+        return jsonify({'error': f'股票代碼必須為非空字串: {invalid[0]!r}'}), 400
+    try:
+        bar_dates(range_period, interval, end)
+        if store:
+            for symbol in symbols:
+                price_store.validate(symbol, interval)
+    except (MarketDataError, PriceStoreError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def generate():
+        for symbol in symbols:
+            series = generate_stock_data(symbol, range_period, interval, end)
+            if store:
+                price_store.write(symbol, series.to_frame(), interval, overwrite=False)
+            body = dumps({
+                'symbol': symbol,
+                'stock_info': build_stock_info(symbol, series),
+                'price_data': to_records(series) if legacy else series.to_columnar(),
+            })
+            yield (body if isinstance(body, bytes) else body.encode()) + b'\n'
+    
+    return app.response_class(generate(), mimetype='application/x-ndjson')
+
+# 股票基本信息：名稱與交易所取自共用的股票清單
+def build_stock_info(symbol, series):
+    stock = stock_universe.get(symbol) or {}
+    closes = series.close
+    return {
+        'symbol': symbol,
+        'name': stock.get('name', '未知'),
+        'exchange': stock.get('exchange', 'TAI'),
+        'currency': 'TWD',
+        'regularMarketPrice': float(closes[-1]) if len(closes) else None,
+        'previousClose': float(closes[-2]) if len(closes) > 1 else None,
+    }
+
+# 從CSV匯入價格數據到本地資料庫（multipart表單：symbol與file，選填interval，預設為日線）
+@app.route('/api/stocks/import', methods=['POST'])
+def import_stock_data():
+    symbol = request.form.get('symbol', '')
+    interval = request.form.get('interval', DEFAULT_INTERVAL)
+    file = request.files.get('file')
+    
+    if not symbol or file is None:
+        return jsonify({'error': '請提供股票代碼和CSV檔案'}), 400
+    
+    try:
+        price_store.import_csv(symbol, file.stream, interval)
+        return jsonify(price_store.info(symbol, interval))
+    except PriceStoreError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'匯入價格數據時發生錯誤: {str(e)}'}), 500
+
+# 列出本地資料庫中的股票、K線週期與日期範圍
+@app.route('/api/stocks/store', methods=['GET'])
+def list_stored_stocks():
+    return jsonify([price_store.info(symbol, interval) for symbol, interval in price_store.entries()])
+
 # 計算技術指標
 @app.route('/api/indicators/calculate', methods=['POST'])
 def calculate_indicators():
-    data = request.json
+    data = get_request_data()
     
-    if not data or 'price_data' not in data or 'indicators' not in data:
+    if not data or not has_price_source(data) or ('indicators' not in data and 'strategy' not in data):
         return jsonify({'error': '請提供價格數據和指標參數'}), 400
     
     try:
-        # 將價格數據轉換為DataFrame
-        df = pd.DataFrame(data['price_data'])
-        df['date'] = pd.to_datetime(df['date'])
-        df.set_index('date', inplace=True)
+        # 將價格數據轉換為DataFrame（或從本地價格資料庫讀取）
+        df = load_price_frame(data)
+        
+        # 請求的指標，加上strategy（選填）在策略註冊表中宣告使用的指標
+        indicators = [(indicator.get('type', ''), indicator.get('params', {})) for indicator in data.get('indicators', [])]
+        if 'strategy' in data:
+            strategy = get_strategy(data['strategy'].get('type', ''))
+            indicators.extend(strategy.indicators(strategy.resolve_params(data['strategy'].get('params', {}))))
         
-        # 計算請求的技術指標
-        results = {}
+        # 計算技術指標（經由指標快取，同一價格序列只計算一次）
+        values = {}
         
-        for indicator in data['indicators']:
-            indicator_type = indicator.get('type', '')
-            params = indicator.get('params', {})
+        with stage('indicators'):
+            indicator_rows = IndicatorRows(df)
             
-            if indicator_type == 'ma':
-                # 移動平均線
-                length = params.get('length', 20)
-                results[f'ma_{length}'] = df['close'].rolling(window=length).mean().to_dict()
-                
-            elif indicator_type == 'ema':
-                # 指數移動平均線
-                length = params.get('length', 20)
-                results[f'ema_{length}'] = df['close'].ewm(span=length, adjust=False).mean().to_dict()
-                
-            elif indicator_type == 'rsi':
-                # 相對強弱指標
-                length = params.get('length', 14)
-                delta = df['close'].diff()
-                gain = (delta.where(delta > 0, 0)).rolling(window=length).mean()
-                loss = (-delta.where(delta < 0, 0)).rolling(window=length).mean()
-                rs = gain / loss
-                rsi = 100 - (100 / (1 + rs))
-                results['rsi'] = rsi.to_dict()
-                
-            elif indicator_type == 'macd':
-                # MACD
-                fast = params.get('fast', 12)
-                slow = params.get('slow', 26)
-                signal = params.get('signal', 9)
-                
-                ema_fast = df['close'].ewm(span=fast, adjust=False).mean()
-                ema_slow = df['close'].ewm(span=slow, adjust=False).mean()
-                macd_line = ema_fast - ema_slow
-                signal_line = macd_line.ewm(span=signal, adjust=False).mean()
-                histogram = macd_line - signal_line
-                
-                results['macd'] = macd_line.to_dict()
-                results['macd_signal'] = signal_line.to_dict()
-                results['macd_histogram'] = histogram.to_dict()
-                
-            elif indicator_type == 'bollinger':
-                # 布林帶
-                length = params.get('length', 20)
-                std = params.get('std', 2)
-                
-                middle = df['close'].rolling(window=length).mean()
-                std_dev = df['close'].rolling(window=length).std()
-                upper = middle + std_dev * std
-                lower = middle - std_dev * std
-                
-                results['bollinger_upper'] = upper.to_dict()
-                results['bollinger_middle'] = middle.to_dict()
-                results['bollinger_lower'] = lower.to_dict()
-                
-            elif indicator_type == 'kd':
-                # 隨機指標KD
-                k_period = params.get('k', 9)
-                d_period = params.get('d', 3)
-                
-                low_min = df['low'].rolling(window=k_period).min()
-                high_max = df['high'].rolling(window=k_period).max()
+            for indicator_type, params in indicators:
+                if indicator_type not in INDICATOR_FUNCTIONS:
+                    continue
                 
-                # 計算%K
-                k = 100 * ((df['close'] - low_min) / (high_max - low_min))
-                # 計算%D
-                d = k.rolling(window=d_period).mean()
+                arrays = indicator_rows.arrays(indicator_type, params)
                 
-                results['stoch_k'] = k.to_dict()
-                results['stoch_d'] = d.to_dict()
+                if indicator_type in ('ma', 'ema'):
+                    # 移動平均線以週期區分輸出名稱
+                    length = params.get('length', 20)
+                    values[f'{indicator_type}_{length}'] = arrays[indicator_type]
+                else:
+                    values.update(arrays)
+        
+        # 預設返回欄式格式，response_format為legacy時返回以日期為鍵的舊版格式
+        results = columnar(df.index, values)
+        if get_response_format(data, request.args) == 'legacy':
+            results = columnar_to_legacy(results)
                 
-        return jsonify(results)
+        return json_response(results)
         
+    except (PriceSeriesError, StrategyError) as e:
+        return jsonify({'error': str(e)}), 400
+    except PriceStoreError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': f'計算技術指標時發生錯誤: {str(e)}'}), 500
 
+# 列出策略註冊表中的策略：名稱、參數預設值、優化時的預設候選值與使用的指標
+@app.route('/api/strategies', methods=['GET'])
+def list_strategies():
+    return json_response([strategy.describe() for strategy in STRATEGIES.values()])
+
+# 指標快取統計
+@app.route('/api/indicators/cache', methods=['GET'])
+def get_indicator_cache_stats():
+    return jsonify(indicator_cache.stats())
+
 # 執行回測
 @app.route('/api/backtest/run', methods=['POST'])
 def run_backtest():
-    data = request.json
+    data = get_request_data()
     
-    if not data or 'price_data' not in data or 'strategy' not in data:
+    if not data or not has_price_source(data) or 'strategy' not in data:
         return jsonify({'error': '請提供價格數據和策略參數'}), 400
     
     try:
-        # 將價格數據轉換為DataFrame
-        df = pd.DataFrame(data['price_data'])
-        df['date'] = pd.to_datetime(df['date'])
-        df.set_index('date', inplace=True)
+        # 將價格數據轉換為DataFrame（或從本地價格資料庫讀取）
+        df = load_price_frame(data)
         
         # 獲取策略參數
         strategy = data['strategy']
         strategy_type = strategy.get('type', '')
         params = strategy.get('params', {})
         
-        # 初始資金
+        # 初始資金與撮合模型（未提供execution時以收盤價成交、不計交易成本）
+        initial_capital = data.get('initial_capital', 1000000)
+        execution = build_execution_model(data.get('execution'))
+        
+        # 相同價格數據、策略、參數、初始資金與撮合設定的結果直接從結果資料庫讀取（cache為false時重新計算且不保存）
+        store = get_result_store(data)
+        run_id = result_key('backtest', price_fingerprint(df), strategy_type, params, initial_capital, execution_config(execution))
+        body = store.get_payload(run_id) if store is not None else None
+        
+        if body is None:
+            # 執行回測
+            backtest_result = backtest_strategy(df, strategy_type, params, initial_capital, execution)
+            backtest_result['run_id'] = run_id
+            with stage('serialize'):
+                body = dumps(backtest_result)
+            if store is not None:
+                with stage('store'):
+                    store.put(
+                        run_id, 'backtest', body, data.get('symbol'), strategy_type, params, initial_capital,
+                        backtest_result['performance_metrics']
+                    )
+        
+        # response_format為legacy時權益曲線返回舊版的逐日記錄
+        if get_response_format(data, request.args) == 'legacy':
+            backtest_result = json.loads(body)
+            backtest_result['equity_curve'] = columnar_to_records(backtest_result['equity_curve'], 'equity')
+            return json_response(backtest_result)
+        
+        return raw_json_response(body)
+        
+    except (PriceSeriesError, ExecutionError, StrategyError) as e:
+        return jsonify({'error': str(e)}), 400
+    except PriceStoreError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': f'執行回測時發生錯誤: {str(e)}'}), 500
+
+# 蒙地卡羅穩健性分析：對回測的每日策略收益做區塊自助抽樣、對平倉損益重複抽樣，返回各績效指標的分位數與直方圖
+@app.route('/api/backtest/montecarlo', methods=['POST'])
+def run_montecarlo_analysis():
+    data = get_request_data()
+    
+    if not data or not has_price_source(data) or 'strategy' not in data:
+        return jsonify({'error': '請提供價格數據和策略參數'}), 400
+    
+    try:
+        df = load_price_frame(data)
+        
+        strategy = data['strategy']
+        strategy_type = strategy.get('type', '')
+        params = strategy.get('params', {})
+        initial_capital = data.get('initial_capital', 1000000)
+        execution = build_execution_model(data.get('execution'))
+        montecarlo = data.get('montecarlo', {})
+        
+        # 先執行一次回測，取得實際的每日策略收益、平倉損益與績效指標
+        backtest_result = backtest_strategy(df, strategy_type, params, initial_capital, execution)
+        returns, trade_pnl = backtest_samples(backtest_result, initial_capital)
+        
+        with stage('simulate'):
+            simulations = run_montecarlo(
+                df.index, returns, trade_pnl, initial_capital, backtest_result['performance_metrics'],
+                methods=montecarlo.get('methods', METHODS),
+                paths=int(montecarlo.get('paths', DEFAULT_PATHS)),
+                block_size=montecarlo.get('block_size'),
+                seed=montecarlo.get('seed'),
+                percentiles=montecarlo.get('percentiles', DEFAULT_PERCENTILES),
+                bins=int(montecarlo.get('bins', DEFAULT_BINS)),
+                workers=resolve_workers(montecarlo.get('workers'))
+            )
+        
+        return json_response({
+            'performance_metrics': backtest_result['performance_metrics'],
+            'simulations': simulations
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except PriceStoreError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': f'執行蒙地卡羅分析時發生錯誤: {str(e)}'}), 500
+
+# 執行投資組合回測：同一策略套用到多檔股票，按資金配置合併績效
+@app.route('/api/backtest/portfolio', methods=['POST'])
+def run_portfolio():
+    data = get_request_data()
+    
+    if not data or ('symbols' not in data and 'price_data' not in data) or 'strategy' not in data:
+        return jsonify({'error': '請提供股票代碼列表（或各股票的價格數據）和策略參數'}), 400
+    
+    try:
+        # 價格來源：price_data為 {股票代碼: 價格數據}，否則從本地價格資料庫讀取symbols
+        if 'price_data' in data:
+            frames = {symbol: load_price_frame({'price_data': prices}) for symbol, prices in data['price_data'].items()}
+            symbols = list(frames)
+            missing_symbols = []
+            frame_by_symbol = lambda symbol: frames[symbol]
+        else:
+            interval = data.get('interval', DEFAULT_INTERVAL)
+            symbols = [symbol for symbol in data['symbols'] if price_store.has(symbol, interval)]
+            missing_symbols = [symbol for symbol in data['symbols'] if not price_store.has(symbol, interval)]
+            start_date, end_date = data.get('start_date'), data.get('end_date')
+            frame_by_symbol = lambda symbol: price_store.load(symbol, start_date, end_date, interval)
+        
+        strategy = data['strategy']
+        strategy_type = strategy.get('type', '')
+        params = strategy.get('params', {})
+        
+        # 初始資金與資金配置權重（未提供時平均分配）
         initial_capital = data.get('initial_capital', 1000000)
+        weights = data.get('allocation', {}).get('weights')
         
-        # 執行回測
-        backtest_result = backtest_strategy(df, strategy_type, params, initial_capital)
+        portfolio_result = run_portfolio_backtest(
+            symbols, frame_by_symbol, strategy_type, params, initial_capital, weights
+        )
+        portfolio_result['missing_symbols'] = missing_symbols
         
-        return jsonify(backtest_result)
+        if get_response_format(data, request.args) == 'legacy':
+            portfolio = portfolio_result['portfolio']
+            portfolio['equity_curve'] = columnar_to_records(portfolio['equity_curve'], 'equity')
         
+        return json_response(portfolio_result)
+        
+    except (PriceStoreError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        return jsonify({'error': f'執行回測時發生錯誤: {str(e)}'}), 500
+        return jsonify({'error': f'執行投資組合回測時發生錯誤: {str(e)}'}), 500
 
 # 執行參數優化
 @app.route('/api/optimize/run', methods=['POST'])
 def run_optimization():
-    data = request.json
+    data = get_request_data()
     
-    if not data or 'price_data' not in data or 'strategy' not in data or 'optimization' not in data:
+    if not data or not has_price_source(data) or 'strategy' not in data or 'optimization' not in data:
         return jsonify({'error': '請提供價格數據、策略參數和優化參數'}), 400
     
     try:
-        # 將價格數據轉換為DataFrame
-        df = pd.DataFrame(data['price_data'])
-        df['date'] = pd.to_datetime(df['date'])
-        df.set_index('date', inplace=True)
+        # 將價格數據轉換為DataFrame（或從本地價格資料庫讀取）
+        df = load_price_frame(data)
         
         # 獲取策略和優化參數
         strategy = data['strategy']
@@ -261,260 +516,452 @@ def run_optimization():
         optimization_method = optimization.get('method', 'grid')
         target_metric = optimization.get('target_metric', 'sharpe')
         param_ranges = optimization.get('param_ranges', {})
+        workers = resolve_workers(optimization.get('workers'))
         
-        # 初始資金
+        # 初始資金與撮合模型
         initial_capital = data.get('initial_capital', 1000000)
+        execution = build_execution_model(data.get('execution'))
         
-        # 執行參數優化
+        # 執行參數優化：已評估過的參數組合從結果資料庫讀取，完成後保存本次結果
+        store = get_result_store(data)
         optimization_result = optimize_strategy_parameters(
             df, strategy_type, param_ranges, optimization_method, 
-            target_metric, initial_capital
+            target_metric, initial_capital, workers, search_options=optimization, execution=execution, result_store=store
         )
+        save_optimization_run(store, df, data, execution, optimization_result)
         
-        return jsonify(optimization_result)
+        return json_response(optimization_result)
         
+    except (PriceSeriesError, ExecutionError, StrategyError, ParallelSearchError) as e:
+        return jsonify({'error': str(e)}), 400
+    except PriceStoreError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': f'執行參數優化時發生錯誤: {str(e)}'}), 500
 
-# 回測策略函數
-def backtest_strategy(df, strategy_type, params, initial_capital):
-    # 創建回測結果DataFrame
-    df_backtest = df.copy()
-    
-    # 根據策略類型計算交易信號
-    if strategy_type == 'ma_cross':
-        # 移動平均線交叉策略
-        short_period = params.get('short', 5)
-        long_period = params.get('long', 20)
-        
-        # 計算短期和長期移動平均線
-        df_backtest[f'ma_short'] = df_backtest['close'].rolling(window=short_period).mean()
-        df_backtest[f'ma_long'] = df_backtest['close'].rolling(window=long_period).mean()
-        
-        # 計算交易信號：短期均線上穿長期均線為買入信號(1)，下穿為賣出信號(-1)
-        df_backtest['signal'] = 0
-        df_backtest['position'] = 0
-        
-        # 計算交叉信號
-        df_backtest['cross_above'] = (df_backtest['ma_short'] > df_backtest['ma_long']) & (df_backtest['ma_short'].shift(1) <= df_backtest['ma_long'].shift(1))
-        df_backtest['cross_below'] = (df_backtest['ma_short'] < df_backtest['ma_long']) & (df_backtest['ma_short'].shift(1) >= df_backtest['ma_long'].shift(1))
-        
-        # 設置買入和賣出信號
-        df_backtest.loc[df_backtest['cross_above'], 'signal'] = 1
-        df_backtest.loc[df_backtest['cross_below'], 'signal'] = -1
-        
-    elif strategy_type == 'rsi':
-        # RSI超買超賣策略
-        period = params.get('period', 14)
-        overbought = params.get('overbought', 70)
-        oversold = params.get('oversold', 30)
-        
-        # 計算RSI
-        delta = df_backtest['close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-        rs = gain / loss
-        df_backtest['rsi'] = 100 - (100 / (1 + rs))
-        
-        # 計算交易信號：RSI低於超賣線為買入信號(1)，高於超買線為賣出信號(-1)
-        df_backtest['signal'] = 0
-        df_backtest['position'] = 0
-        
-        # 設置買入和賣出信號
-        df_backtest.loc[df_backtest['rsi'] < oversold, 'signal'] = 1
-        df_backtest.loc[df_backtest['rsi'] > overbought, 'signal'] = -1
-        
-    elif strategy_type == 'bollinger':
-        # 布林帶突破策略
-        period = params.get('period', 20)
-        std = params.get('std', 2)
-        
-        # 計算布林帶
-        df_backtest['bollinger_middle'] = df_backtest['close'].rolling(window=period).mean()
-        df_backtest['bollinger_std'] = df_backtest['close'].rolling(window=period).std()
-        df_backtest['bollinger_upper'] = df_backtest['bollinger_middle'] + df_backtest['bollinger_std'] * std
-        df_backtest['bollinger_lower'] = df_backtest['bollinger_middle'] - df_backtest['bollinger_std'] * std
-        
-        # 計算交易信號：價格突破上軌為買入信號(1)，突破下軌為賣出信號(-1)
-        df_backtest['signal'] = 0
-        df_backtest['position'] = 0
-        
-        # 設置買入和賣出信號
-        df_backtest.loc[df_backtest['close'] > df_backtest['bollinger_upper'], 'signal'] = 1
-        df_backtest.loc[df_backtest['close'] < df_backtest['bollinger_lower'], 'signal'] = -1
-    
-    # 計算持倉
-    df_backtest['position'] = df_backtest['signal'].replace(to_replace=0, method='ffill')
-    
-    # 計算每日收益
-    df_backtest['returns'] = df_backtest['close'].pct_change()
-    df_backtest['strategy_returns'] = df_backtest['position'].shift(1) * df_backtest['returns']
-    
-    # 計算累積收益
-    df_backtest['cumulative_returns'] = (1 + df_backtest['returns']).cumprod()
-    df_backtest['cumulative_strategy_returns'] = (1 + df_backtest['strategy_returns']).cumprod()
-    
-    # 計算權益曲線
-    df_backtest['equity'] = initial_capital * df_backtest['cumulative_strategy_returns']
-    
-    # 生成交易記錄
-    trades = []
-    current_position = 0
-    entry_price = 0
-    entry_date = None
-    
-    for index, row in df_backtest.iterrows():
-        if row['signal'] != 0:
-            if row['signal'] == 1 and current_position <= 0:
-                # 買入
-                current_position = 1
-                entry_price = row['close']
-                entry_date = index
-                trades.append({
-                    'date': index.strftime('%Y-%m-%d'),
-                    'type': '買入',
-                    'price': entry_price,
-                    'shares': int(initial_capital * 0.1 / entry_price),  # 假設每次使用10%資金
-                    'amount': int(initial_capital * 0.1),
-                    'pnl': 0
-                })
-            elif row['signal'] == -1 and current_position >= 0:
-                # 賣出
-                if current_position > 0:
-                    exit_price = row['close']
-                    shares = int(initial_capital * 0.1 / entry_price)
-                    pnl = shares * (exit_price - entry_price)
-                    trades.append({
-                        'date': index.strftime('%Y-%m-%d'),
-                        'type': '賣出',
-                        'price': exit_price,
-                        'shares': shares,
-                        'amount': int(shares * exit_price),
-                        'pnl': int(pnl)
-                    })
-                current_position = -1
-                entry_price = row['close']
-                entry_date = index
-    
-    # 計算績效指標
-    total_return = df_backtest['cumulative_strategy_returns'].iloc[-1] - 1 if not df_backtest.empty else 0
-    
-    # 計算年化收益率
-    days = (df_backtest.index[-1] - df_backtest.index[0]).days
-    annualized_return = (1 + total_return) ** (365 / days) - 1 if days > 0 else 0
-    
-    # 計算最大回撤
-    df_backtest['peak'] = df_backtest['equity'].cummax()
-    df_backtest['drawdown'] = (df_backtest['equity'] - df_backtest['peak']) / df_backtest['peak']
-    max_drawdown = df_backtest['drawdown'].min()
-    
-    # 計算夏普比率
-    risk_free_rate = 0.02  # 假設無風險利率為2%
-    sharpe_ratio = (annualized_return - risk_free_rate) / (df_backtest['strategy_returns'].std() * (252 ** 0.5)) if df_backtest['strategy_returns'].std() > 0 else 0
-    
-    # 計算勝率
-    winning_trades = sum(1 for trade in trades if trade['type'] == '賣出' and trade['pnl'] > 0)
-    total_trades = sum(1 for trade in trades if trade['type'] == '賣出')
-    win_rate = winning_trades / total_trades if total_trades > 0 else 0
-    
-    # 計算月度收益
-    df_backtest['year_month'] = df_backtest.index.strftime('%Y-%m')
-    monthly_returns = df_backtest.groupby('year_month')['strategy_returns'].sum().reset_index()
-    monthly_returns_list = [{'month': row['year_month'], 'return': row['strategy_returns']} for _, row in monthly_returns.iterrows()]
-    
-    # 返回回測結果
-    return {
-        'performance_metrics': {
-            'total_return': total_return,
-            'annualized_return': annualized_return,
-            'sharpe_ratio': sharpe_ratio,
-            'max_drawdown': max_drawdown,
-            'win_rate': win_rate,
-            'total_trades': total_trades
-        },
-        'trades': trades,
-        'monthly_returns': monthly_returns_list,
-        'equity_curve': [{'date': index.strftime('%Y-%m-%d'), 'equity': row['equity']} for index, row in df_backtest.iterrows()]
-    }
+# 前進式分析：在每個訓練視窗優化參數、套用到下一個測試視窗，並返回串接的樣本外權益曲線
+@app.route('/api/optimize/walkforward', methods=['POST'])
+def run_walkforward_optimization():
+    data = get_request_data()
+    
+    if not data or not has_price_source(data) or 'strategy' not in data:
+        return jsonify({'error': '請提供價格數據和策略參數'}), 400
+    
+    try:
+        df = load_price_frame(data)
+        
+        strategy_type = data['strategy'].get('type', '')
+        optimization = data.get('optimization', {})
+        walkforward = data.get('walkforward', {})
+        initial_capital = data.get('initial_capital', 1000000)
+        
+        with stage('param_grid'):
+            param_grid = build_param_grid(strategy_type, optimization.get('param_ranges', {}))
+        
+        with stage('walkforward'):
+            result = run_walkforward(
+                df, strategy_type, param_grid, optimization.get('target_metric', 'sharpe_ratio'), initial_capital,
+                strategy_signal_rows,
+                train_size=int(walkforward.get('train_size', DEFAULT_TRAIN_SIZE)),
+                test_size=int(walkforward.get('test_size', DEFAULT_TEST_SIZE)),
+                anchored=bool(walkforward.get('anchored', False)),
+                workers=resolve_workers(optimization.get('workers'))
+            )
+        
+        if get_response_format(data, request.args) == 'legacy':
+            result['out_of_sample']['equity_curve'] = columnar_to_records(result['out_of_sample']['equity_curve'], 'equity')
+        
+        return json_response(result)
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except PriceStoreError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': f'執行前進式分析時發生錯誤: {str(e)}'}), 500
+
+# 請求中是否提供價格來源：完整的price_data，或本地資料庫中的symbol
+def has_price_source(data):
+    return 'price_data' in data or 'symbol' in data
+
+# 讀取請求內容：JSON請求直接解析；multipart表單的payload欄位為JSON，
+# 價格數據可用 .npy 檔案上傳（price_data 欄位，投資組合回測為 price_data:<股票代碼>）
+def get_request_data():
+    if request.is_json:
+        data = request.get_json(silent=True)
+    elif request.mimetype == 'multipart/form-data':
+        try:
+            data = json.loads(request.form.get('payload', '{}'))
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            for name, file in request.files.items():
+                if name == 'price_data':
+                    data['price_data'] = PriceSeries.from_npy(file.read())
+                elif name.startswith('price_data:'):
+                    data.setdefault('price_data', {})[name.split(':', 1)[1]] = PriceSeries.from_npy(file.read())
+    else:
+        data = None
+    g.request_data = data
+    return data
+
+# 將請求中的價格數據轉換為DataFrame
+# price_data可為欄式格式、舊版逐列格式或上傳的二進位陣列，皆先轉為PriceSeries，可用start_date/end_date截取區間
+# 提供symbol時從本地價格資料庫讀取（可用start_date/end_date指定區間、interval指定K線週期，預設為日線），不需傳送完整價格數據
+def load_price_frame(data):
+    with stage('parse'):
+        if 'price_data' in data:
+            series = to_price_series(data['price_data'])
+            if data.get('start_date') or data.get('end_date'):
+                series = series.between(data.get('start_date'), data.get('end_date'))
+            return series.to_frame()
+        
+        df = price_store.load(
+            data['symbol'], data.get('start_date'), data.get('end_date'), data.get('interval', DEFAULT_INTERVAL)
+        )
+    if df.empty:
+        raise PriceStoreError(f'{data["symbol"]} 在指定區間內沒有價格數據')
+    return df
+
+# 提交背景參數優化任務：立即返回任務ID，透過 /api/jobs/<job_id> 查詢進度與結果
+@app.route('/api/jobs/optimize', methods=['POST'])
+def submit_optimization_job():
+    data = get_request_data()
+    
+    if not data or not has_price_source(data) or 'strategy' not in data or 'optimization' not in data:
+        return jsonify({'error': '請提供價格數據、策略參數和優化參數'}), 400
+    
+    try:
+        df = load_price_frame(data)
+        
+        strategy_type = data['strategy'].get('type', '')
+        optimization = data['optimization']
+        optimization_method = optimization.get('method', 'grid')
+        target_metric = optimization.get('target_metric', 'sharpe')
+        param_ranges = optimization.get('param_ranges', {})
+        workers = resolve_workers(optimization.get('workers'))
+        initial_capital = data.get('initial_capital', 1000000)
+        execution = build_execution_model(data.get('execution'))
+        get_strategy(strategy_type)
+        
+        store = get_result_store(data)
+        
+        def run_job(job):
+            result = optimize_strategy_parameters(
+                df, strategy_type, param_ranges, optimization_method,
+                target_metric, initial_capital, workers, progress=job.report_progress,
+                search_options=optimization, execution=execution, result_store=store
+            )
+            save_optimization_run(store, df, data, execution, result)
+            return result
+        
+        # 相同價格數據與參數的已完成任務直接重用（工作進程數不影響結果）；cache為false時一律重新計算
+        job_hash = optimization_run_id(df, data, execution) if data.get('cache', True) else None
+        job, cached = job_manager.submit('optimize', run_job, job_hash)
+        
+        return json_response({'job_id': job['id'], 'status': job['status'], 'cached': cached}, status=200 if cached else 202)
+        
+    except (PriceSeriesError, ExecutionError, StrategyError, ParallelSearchError) as e:
+        return jsonify({'error': str(e)}), 400
+    except PriceStoreError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': f'提交參數優化任務時發生錯誤: {str(e)}'}), 500
+
+# 請求使用的結果資料庫：cache為false時不讀取也不保存結果
+def get_result_store(data):
+    return result_store if data.get('cache', True) else None
+
+def execution_config(execution):
+    return execution.config() if execution is not None else None
+
+# 參數優化結果的ID：價格數據、策略、優化設定（不含工作進程數）、初始資金、撮合設定與結果版本的雜湊
+def optimization_run_id(df, data, execution):
+    optimization = data['optimization']
+    return result_key(
+        'optimize', price_fingerprint(df), data['strategy'],
+        {key: value for key, value in optimization.items() if key != 'workers'},
+        data.get('initial_capital', 1000000), execution_config(execution)
+    )
+
+# 保存參數優化結果，以便之後從 /api/results 查詢
+def save_optimization_run(store, df, data, execution, optimization_result):
+    if store is None:
+        return
+    run_id = optimization_run_id(df, data, execution)
+    optimization_result['run_id'] = run_id
+    with stage('store'):
+        store.put(
+            run_id, 'optimize', dumps(optimization_result), data.get('symbol'), data['strategy'].get('type', ''),
+            data['optimization'].get('param_ranges', {}), data.get('initial_capital', 1000000),
+            {'best_params': optimization_result['best_params'], 'best_metric_value': optimization_result['best_metric_value'],
+             'target_metric': data['optimization'].get('target_metric', 'sharpe')}
+        )
+
+# 列出結果資料庫中保存的回測與參數優化結果（不含完整內容），可依kind、symbol、strategy_type篩選，總數放在 X-Total-Count 標頭
+@app.route('/api/results', methods=['GET'])
+def list_results():
+    try:
+        total, runs = result_store.list(
+            request.args.get('kind'), request.args.get('symbol'), request.args.get('strategy_type'),
+            int(request.args.get('limit', DEFAULT_LIST_LIMIT)), int(request.args.get('offset', 0))
+        )
+    except ValueError:
+        return jsonify({'error': 'limit與offset必須為整數'}), 400
+    except ResultStoreError as e:
+        return jsonify({'error': str(e)}), 500
+    response = json_response(runs)
+    response.headers['X-Total-Count'] = str(total)
+    response.headers['Access-Control-Expose-Headers'] = 'X-Total-Count'
+    return response
+
+# 結果資料庫統計
+@app.route('/api/results/stats', methods=['GET'])
+def get_result_store_stats():
+    return json_response(result_store.stats())
+
+# 讀取保存的完整結果（含權益曲線）；response_format=legacy時回測的權益曲線返回逐日記錄
+@app.route('/api/results/<run_id>', methods=['GET'])
+def get_result(run_id):
+    body = result_store.get_payload(run_id)
+    if body is None:
+        return jsonify({'error': '找不到指定的結果'}), 404
+    if get_response_format({}, request.args) == 'legacy':
+        result = json.loads(body)
+        if isinstance(result.get('equity_curve'), dict):
+            result['equity_curve'] = columnar_to_records(result['equity_curve'], 'equity')
+        return json_response(result)
+    return raw_json_response(body)
+
+# 刪除保存的結果
+@app.route('/api/results/<run_id>', methods=['DELETE'])
+def delete_result(run_id):
+    if not result_store.delete(run_id):
+        return jsonify({'error': '找不到指定的結果'}), 404
+    return json_response({'id': run_id, 'deleted': True})
+
+# 列出所有任務（不含完整結果）
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    return json_response(job_manager.list())
+
+# 查詢任務進度、目前最佳參數、部分結果與完成後的結果
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': '找不到指定的任務'}), 404
+    return json_response(job)
+
+# 取消任務
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({'error': '找不到指定的任務'}), 404
+    return json_response(job)
+
+# 建立串流指標會話：以歷史K線初始化增量狀態，之後新增K線只計算新的指標與信號
+@app.route('/api/stream/sessions', methods=['POST'])
+def create_stream_session():
+    data = get_request_data()
+
+    if not data or not has_price_source(data) or ('indicators' not in data and 'strategy' not in data):
+        return jsonify({'error': '請提供價格數據和指標或策略參數'}), 400
+
+    try:
+        df = load_price_frame(data)
+        session = StreamingSession(data.get('indicators', []), data.get('strategy'))
+        session.append(df.index.values, df.to_dict('records'))
+        stream_sessions.add(session)
+        return json_response(session.info(), status=201)
+
+    except (StreamingError, PriceSeriesError) as e:
+        return jsonify({'error': str(e)}), 400
+    except PriceStoreError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': f'建立串流會話時發生錯誤: {str(e)}'}), 500
+
+# 新增K線到串流會話，只返回新K線的指標數值、信號與持倉
+@app.route('/api/stream/sessions/<session_id>/bars', methods=['POST'])
+def append_stream_bars(session_id):
+    data = get_request_data()
+
+    if not data or 'bars' not in data:
+        return jsonify({'error': '請提供新增的K線數據'}), 400
+
+    try:
+        # 會話在共用的狀態資料庫中讀出、更新後寫回，新增失敗時會話不變
+        with stream_sessions.update(session_id) as session:
+            if session is None:
+                return jsonify({'error': '找不到指定的串流會話'}), 404
+
+            # bars可為舊版逐列格式或欄式格式
+            bars = to_price_series(data['bars'])
+            if not len(bars):
+                return json_response({'session': session.info(), 'dates': [], 'values': {}})
+            if bars.high is None or bars.low is None:
+                return jsonify({'error': 'K線數據需包含 date、high、low、close 欄位'}), 400
+            df = bars.to_frame()
+
+            values, signals, positions = session.append(df.index.values, df.to_dict('records'))
+
+        result = columnar(df.index, values)
+        if session.signal_state is not None:
+            result['signal'] = np.array(signals, dtype=np.int8)
+            result['position'] = np.array(positions, dtype=np.int8)
+        result['session'] = session.info()
+        return json_response(result)
+
+    except (StreamingError, PriceSeriesError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'新增K線時發生錯誤: {str(e)}'}), 500
+
+# 查詢串流會話狀態
+@app.route('/api/stream/sessions/<session_id>', methods=['GET'])
+def get_stream_session(session_id):
+    session = stream_sessions.get(session_id)
+    if session is None:
+        return jsonify({'error': '找不到指定的串流會話'}), 404
+    return json_response(session.info())
+
+# 刪除串流會話
+@app.route('/api/stream/sessions/<session_id>', methods=['DELETE'])
+def delete_stream_session(session_id):
+    session = stream_sessions.remove(session_id)
+    if session is None:
+        return jsonify({'error': '找不到指定的串流會話'}), 404
+    return json_response(session.info())
+
+# 回測策略函數；execution為選填的撮合模型（交易成本、整股/零股、漲跌停、次根開盤價成交）
+def backtest_strategy(df, strategy_type, params, initial_capital, execution=None):
+    with stage('signals'):
+        signal = build_strategy_signals(df, strategy_type, params)
+    
+    if execution is not None:
+        open_prices = df['open'].to_numpy() if 'open' in df else None
+        return run_execution_backtest(execution, df.index, open_prices, df['close'].to_numpy(), signal, initial_capital)
+    
+    # 以NumPy引擎計算持倉、交易記錄、績效指標與權益曲線
+    return run_backtest_arrays(df.index, df['close'].to_numpy(), signal, initial_capital)
+
+# 根據策略類型計算交易信號：1為買入，-1為賣出，0為無信號
+# 由策略註冊表的向量化信號函數計算（與批量回測相同），直接以指標陣列比較產生信號，不複製價格DataFrame
+def build_strategy_signals(df, strategy_type, params):
+    return get_strategy(strategy_type).signals(df, [params])[0].astype(np.int64)
 
 # 參數優化函數
-def optimize_strategy_parameters(df, strategy_type, param_ranges, optimization_method, target_metric, initial_capital):
+# progress為選填的進度回報函數 progress(done, total, best_params, best_metric_value, sorted_results)，
+# 提供時參數網格分段評估，每段結束後回報一次（回報函數可拋出例外以中止優化）
+# execution為選填的撮合模型，所有參數組合以同一模型評估
+# result_store為選填的結果資料庫：已評估過的參數組合直接讀取績效指標，只評估其餘組合並保存
+def optimize_strategy_parameters(df, strategy_type, param_ranges, optimization_method, target_metric, initial_capital, workers=None, progress=None, search_options=None, execution=None, result_store=None):
     best_params = {}
+    evaluate_chunk = evaluate_param_chunk if execution is None else partial(evaluate_param_chunk, execution=execution)
+    fingerprint = price_fingerprint(df) if result_store is not None else None
     best_metric_value = -float('inf') if target_metric != 'max_drawdown' else float('inf')
     results = []
     
-    if strategy_type == 'ma_cross':
-        # 移動平均線交叉策略參數優化
-        short_range = param_ranges.get('short', [5, 10, 15])
-        long_range = param_ranges.get('long', [20, 30, 40, 50])
-        
-        for short_period in short_range:
-            for long_period in long_range:
-                if short_period >= long_period:
-                    continue
-                    
-                params = {'short': short_period, 'long': long_period}
-                backtest_result = backtest_strategy(df, strategy_type, params, initial_capital)
-                
-                # 獲取目標指標值
-                metric_value = get_metric_value(backtest_result, target_metric)
-                
-                # 記錄結果
-                result = {
-                    'params': params,
-                    'metrics': backtest_result['performance_metrics']
-                }
-                results.append(result)
-                
-                # 更新最佳參數
-                if (target_metric != 'max_drawdown' and metric_value > best_metric_value) or \
-                   (target_metric == 'max_drawdown' and metric_value < best_metric_value):
-                    best_metric_value = metric_value
-                    best_params = params
-    
-    elif strategy_type == 'rsi':
-        # RSI策略參數優化
-        period_range = param_ranges.get('period', [7, 14, 21])
-        overbought_range = param_ranges.get('overbought', [65, 70, 75, 80])
-        oversold_range = param_ranges.get('oversold', [20, 25, 30, 35])
-        
-        for period in period_range:
-            for overbought in overbought_range:
-                for oversold in oversold_range:
-                    if oversold >= overbought:
-                        continue
-                        
-                    params = {'period': period, 'overbought': overbought, 'oversold': oversold}
-                    backtest_result = backtest_strategy(df, strategy_type, params, initial_capital)
-                    
-                    # 獲取目標指標值
-                    metric_value = get_metric_value(backtest_result, target_metric)
-                    
-                    # 記錄結果
-                    result = {
-                        'params': params,
-                        'metrics': backtest_result['performance_metrics']
-                    }
-                    results.append(result)
-                    
-                    # 更新最佳參數
-                    if (target_metric != 'max_drawdown' and metric_value > best_metric_value) or \
-                       (target_metric == 'max_drawdown' and metric_value < best_metric_value):
-                        best_metric_value = metric_value
-                        best_params = params
+    # 評估一組參數組合（workers大於1時使用多進程，同一次優化的各批共用同一個進程池），記錄結果並更新最佳參數
+    def evaluate(param_chunk, total):
+        nonlocal best_params, best_metric_value
+        if result_store is None:
+            with stage('evaluate'):
+                metrics_list = pool.evaluate(param_chunk)
+        else:
+            with stage('cache_lookup'):
+                keys = evaluation_keys(fingerprint, strategy_type, initial_capital, execution_config(execution), param_chunk)
+                cached = result_store.get_evaluations(keys)
+            missing = [i for i, key in enumerate(keys) if key not in cached]
+            with stage('evaluate'):
+                missing_metrics = pool.evaluate([param_chunk[i] for i in missing]) if missing else []
+            with stage('store'):
+                result_store.put_evaluations([keys[i] for i in missing], missing_metrics)
+            cached.update((keys[i], metrics) for i, metrics in zip(missing, missing_metrics))
+            metrics_list = [cached[key] for key in keys]
+        metric_values = []
+        
+        for params, metrics in zip(param_chunk, metrics_list):
+            # 記錄結果
+            result = {
+                'params': params,
+                'metrics': metrics
+            }
+            results.append(result)
+            
+            # 獲取目標指標值
+            metric_value = get_metric_value(result, target_metric)
+            metric_values.append(metric_value)
+            
+            # 更新最佳參數
+            if (target_metric != 'max_drawdown' and metric_value > best_metric_value) or \
+               (target_metric == 'max_drawdown' and metric_value < best_metric_value):
+                best_metric_value = metric_value
+                best_params = params
+        
+        if progress is not None:
+            progress(len(results), total, best_params, best_metric_value, sort_results(results, target_metric))
+        return metric_values
+    
+    search = None
+    with WorkerPool(evaluate_chunk, df, strategy_type, initial_capital, workers) as pool:
+        if optimization_method in SEARCH_METHODS:
+            # 隨機搜索、TPE與遺傳算法：在評估預算內抽樣，已評估的組合不重複計算，目標指標停滯時提前停止
+            param_space = build_param_space(strategy_type, param_ranges)
+            search = run_search(optimization_method, param_space, evaluate, target_metric != 'max_drawdown', search_options)
+        else:
+            # 網格搜索：生成參數組合，順序與逐一執行時相同
+            with stage('param_grid'):
+                param_grid = build_param_grid(strategy_type, param_ranges)
+            chunk_size = len(param_grid) if progress is None else PROGRESS_CHUNK_SIZE
+            
+            for start in range(0, len(param_grid), max(1, chunk_size)):
+                evaluate(param_grid[start:start + chunk_size], len(param_grid))
     
     # 按目標指標排序結果
-    if target_metric != 'max_drawdown':
-        results.sort(key=lambda x: get_metric_value(x, target_metric), reverse=True)
-    else:
-        results.sort(key=lambda x: get_metric_value(x, target_metric))
+    with stage('rank'):
+        results = sort_results(results, target_metric)
     
     # 返回優化結果
-    return {
+    optimization_result = {
         'best_params': best_params,
         'best_metric_value': best_metric_value,
         'results': results[:10]  # 只返回前10個結果
     }
+    if search is not None:
+        optimization_result['search'] = search
+    return optimization_result
+
+# 按目標指標排序結果（max_drawdown越小越好，其餘越大越好）
+def sort_results(results, target_metric):
+    if target_metric != 'max_drawdown':
+        return sorted(results, key=lambda x: get_metric_value(x, target_metric), reverse=True)
+    return sorted(results, key=lambda x: get_metric_value(x, target_metric))
+
+# 評估一組參數組合：註冊表中的策略一次算完整組，其餘逐一回測
+def evaluate_param_chunk(df, strategy_type, param_chunk, initial_capital, execution=None):
+    if strategy_type in STRATEGIES:
+        return batched_backtest(df, strategy_type, param_chunk, initial_capital, execution)
+    return [
+        backtest_strategy(df, strategy_type, params, initial_capital, execution)['performance_metrics']
+        for params in param_chunk
+    ]
+
+# 建立參數空間：範圍可為候選值列表或 {'min', 'max', 'step'}，未指定的參數使用策略註冊表中的預設候選值
+def build_param_space(strategy_type, param_ranges):
+    strategy = get_strategy(strategy_type)
+    return ParamSpace(
+        list(strategy.param_ranges),
+        [expand_param_range(param_ranges.get(name, default)) for name, default in strategy.param_ranges.items()],
+        strategy.is_valid
+    )
+
+# 生成參數網格的輔助函數
+def build_param_grid(strategy_type, param_ranges):
+    param_space = build_param_space(strategy_type, param_ranges)
+    return [param_space.params(key) for key in param_space.valid_keys()]
 
 # 獲取指標值的輔助函數
 def get_metric_value(result, metric_name):
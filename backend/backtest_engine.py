@@ -0,0 +1,191 @@
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage
+from serialization import columnar
+
+# 每次交易使用的資金比例
+TRADE_CAPITAL_RATIO = 0.1
+
+# 無風險利率（用於夏普比率）
+RISK_FREE_RATE = 0.02
+
+
+# 將交易信號向前填充為持倉：信號為0時沿用上一個非0信號，開頭沒有信號時為0
+# 支援二維陣列（每列一組參數），沿最後一個軸（時間）填充
+def signals_to_positions(signal):
+    signal = np.asarray(signal)
+    idx = np.where(signal != 0, np.arange(signal.shape[-1]), 0)
+    np.maximum.accumulate(idx, axis=-1, out=idx)
+    return np.take_along_axis(signal, idx, axis=-1)
+
+
+# 依照pandas的skipna規則計算累乘：NaN視為1參與累乘，輸出時保留NaN
+def nan_cumprod(values):
+    mask = np.isnan(values)
+    result = np.cumprod(np.where(mask, 1.0, values), axis=-1)
+    result[mask] = np.nan
+    return result
+
+
+# 依照pandas的skipna規則計算累計最大值
+def nan_cummax(values):
+    mask = np.isnan(values)
+    result = np.fmax.accumulate(values, axis=-1)
+    result[mask] = np.nan
+    return result
+
+
+# 與pandas Series.std()相同的樣本標準差（ddof=1，忽略NaN），沿最後一個軸計算
+def nan_std(values):
+    mask = np.isnan(values)
+    count = values.shape[-1] - mask.sum(axis=-1)
+    filled = np.where(mask, 0.0, values)
+    avg = filled.sum(axis=-1, keepdims=True) / np.expand_dims(count, -1)
+    sqr = (avg - filled) ** 2
+    sqr[mask] = 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = np.sqrt(sqr.sum(axis=-1) / (count - 1))
+    return np.where(count > 1, result, np.nan)[()]
+
+
+# 由持倉陣列找出持倉轉換點，批量生成交易記錄
+def build_trade_ledger(dates, close, position, initial_capital):
+    prev_position = np.empty_like(position)
+    prev_position[0] = 0
+    prev_position[1:] = position[:-1]
+    change_idx = np.flatnonzero(position != prev_position)
+
+    new_position = position[change_idx]
+    old_position = prev_position[change_idx]
+
+    # 買入：持倉轉為多頭；賣出：由多頭轉為空頭時才記錄平倉
+    is_buy = new_position == 1
+    is_sell = (new_position == -1) & (old_position == 1)
+
+    trade_capital = initial_capital * TRADE_CAPITAL_RATIO
+    trade_amount = int(trade_capital)
+
+    # 持倉在1與-1之間交替，賣出的進場價即為前一個轉換點的收盤價
+    change_close = close[change_idx]
+    entry_close = np.empty_like(change_close)
+    if len(change_close):
+        entry_close[0] = np.nan
+        entry_close[1:] = change_close[:-1]
+
+    buy_shares = np.trunc(trade_capital / change_close[is_buy]).astype(np.int64)
+
+    sell_exit = change_close[is_sell]
+    sell_entry = entry_close[is_sell]
+    sell_shares = np.trunc(trade_capital / sell_entry).astype(np.int64)
+    sell_amount = np.trunc(sell_shares * sell_exit).astype(np.int64)
+    sell_pnl = np.trunc(sell_shares * (sell_exit - sell_entry)).astype(np.int64)
+
+    record_idx = change_idx[is_buy | is_sell]
+    record_is_buy = is_buy[is_buy | is_sell]
+    date_strs = dates[record_idx].strftime('%Y-%m-%d').tolist()
+
+    buy_iter = zip(change_close[is_buy].tolist(), buy_shares.tolist())
+    sell_iter = zip(sell_exit.tolist(), sell_shares.tolist(), sell_amount.tolist(), sell_pnl.tolist())
+
+    trades = []
+    for date, buy in zip(date_strs, record_is_buy.tolist()):
+        if buy:
+            price, shares = next(buy_iter)
+            trades.append({
+                'date': date,
+                'type': '買入',
+                'price': price,
+                'shares': shares,
+                'amount': trade_amount,
+                'pnl': 0
+            })
+        else:
+            price, shares, amount, pnl = next(sell_iter)
+            trades.append({
+                'date': date,
+                'type': '賣出',
+                'price': price,
+                'shares': shares,
+                'amount': amount,
+                'pnl': pnl
+            })
+
+    return trades, sell_pnl
+
+
+# 計算每日收益、策略收益與權益曲線
+def compute_equity(close, position, initial_capital):
+    returns = np.empty_like(close)
+    returns[0] = np.nan
+    returns[1:] = close[1:] / close[:-1] - 1
+
+    strategy_returns = np.empty_like(close)
+    strategy_returns[0] = np.nan
+    strategy_returns[1:] = position[:-1] * returns[1:]
+
+    cumulative_strategy_returns = nan_cumprod(1 + strategy_returns)
+    equity = initial_capital * cumulative_strategy_returns
+    return strategy_returns, cumulative_strategy_returns, equity
+
+
+# 計算績效指標
+def compute_performance_metrics(dates, strategy_returns, cumulative_strategy_returns, equity, sell_pnl):
+    total_return = cumulative_strategy_returns[-1] - 1 if len(equity) else 0
+
+    # 計算年化收益率
+    days = (dates[-1] - dates[0]).days
+    annualized_return = (1 + total_return) ** (365 / days) - 1 if days > 0 else 0
+
+    # 計算最大回撤
+    peak = nan_cummax(equity)
+    drawdown = (equity - peak) / peak
+    max_drawdown = np.nanmin(drawdown) if not np.isnan(drawdown).all() else np.nan
+
+    # 計算夏普比率
+    returns_std = nan_std(strategy_returns)
+    sharpe_ratio = (annualized_return - RISK_FREE_RATE) / (returns_std * (252 ** 0.5)) if returns_std > 0 else 0
+
+    # 計算勝率
+    total_trades = len(sell_pnl)
+    winning_trades = int((sell_pnl > 0).sum())
+    win_rate = winning_trades / total_trades if total_trades > 0 else 0
+
+    return {
+        'total_return': total_return,
+        'annualized_return': annualized_return,
+        'sharpe_ratio': sharpe_ratio,
+        'max_drawdown': max_drawdown,
+        'win_rate': win_rate,
+        'total_trades': total_trades
+    }
+
+
+# 計算月度收益
+def compute_monthly_returns(dates, strategy_returns):
+    monthly = pd.Series(strategy_returns, index=dates.strftime('%Y-%m')).groupby(level=0).sum()
+    return [{'month': month, 'return': value} for month, value in zip(monthly.index.tolist(), monthly.tolist())]
+
+
+# 以NumPy陣列執行回測：由交易信號產生交易記錄、績效指標、月度收益與權益曲線
+# 權益曲線為欄式格式 {dates: [...], values: {equity: [...]}}
+def run_backtest_arrays(dates, close, signal, initial_capital):
+    close = np.asarray(close, dtype=np.float64)
+
+    with stage('equity'):
+        position = signals_to_positions(np.asarray(signal))
+        strategy_returns, cumulative_strategy_returns, equity = compute_equity(close, position, initial_capital)
+    with stage('ledger'):
+        trades, sell_pnl = build_trade_ledger(dates, close, position, initial_capital)
+    with stage('metrics'):
+        performance_metrics = compute_performance_metrics(
+            dates, strategy_returns, cumulative_strategy_returns, equity, sell_pnl
+        )
+        monthly_returns = compute_monthly_returns(dates, strategy_returns)
+        equity_curve = columnar(dates, {'equity': equity})
+    return {
+        'performance_metrics': performance_metrics,
+        'trades': trades,
+        'monthly_returns': monthly_returns,
+        'equity_curve': equity_curve
+    }
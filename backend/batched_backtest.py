@@ -0,0 +1,132 @@
+import numpy as np
+
+from backtest_engine import (
+    RISK_FREE_RATE,
+    TRADE_CAPITAL_RATIO,
+    nan_cummax,
+    nan_cumprod,
+    nan_std,
+    signals_to_positions,
+)
+from strategies import IndicatorRows, get_strategy
+
+# 每個計算區塊最多容納的矩陣元素數（參數組合數 × K線數），用於限制記憶體用量
+MAX_BLOCK_CELLS = 2000000
+
+
+# 由持倉矩陣找出所有平倉（多轉空）事件，返回 (列索引, K線索引, 損益)
+# close可為共用的一維陣列或逐列的二維陣列，initial_capital可為純量或逐列的陣列
+def trade_events(close, position, initial_capital):
+    prev_position = np.zeros_like(position)
+    prev_position[:, 1:] = position[:, :-1]
+    rows, cols = np.nonzero(position != prev_position)
+
+    new_position = position[rows, cols]
+    old_position = prev_position[rows, cols]
+
+    # 賣出一定不是該列的第一個轉換點，進場價為同一列前一個轉換點的收盤價
+    sell_idx = np.flatnonzero((new_position == -1) & (old_position == 1))
+    sell_rows = rows[sell_idx]
+    sell_cols = cols[sell_idx]
+    if close.ndim == 2:
+        sell_exit = close[sell_rows, sell_cols]
+        sell_entry = close[sell_rows, cols[sell_idx - 1]]
+    else:
+        sell_exit = close[sell_cols]
+        sell_entry = close[cols[sell_idx - 1]]
+
+    if np.ndim(initial_capital):
+        initial_capital = np.asarray(initial_capital, dtype=np.float64)[sell_rows]
+
+    sell_shares = np.trunc(initial_capital * TRADE_CAPITAL_RATIO / sell_entry).astype(np.int64)
+    sell_pnl = np.trunc(sell_shares * (sell_exit - sell_entry)).astype(np.int64)
+    return sell_rows, sell_cols, sell_pnl
+
+
+# 由持倉矩陣批量統計平倉次數與獲利次數
+def _trade_counts(close, position, initial_capital):
+    sell_rows, _, sell_pnl = trade_events(close, position, initial_capital)
+    n_rows = position.shape[0]
+    total_trades = np.bincount(sell_rows, minlength=n_rows)
+    winning_trades = np.bincount(sell_rows[sell_pnl > 0], minlength=n_rows)
+    return total_trades, winning_trades
+
+
+# 由持倉矩陣計算每列的策略收益與累積收益；returns可為共用的一維陣列或逐列的二維陣列
+def batch_strategy_returns(returns, position):
+    strategy_returns = np.empty(position.shape, dtype=np.float64)
+    strategy_returns[:, 0] = np.nan
+    strategy_returns[:, 1:] = position[:, :-1] * returns[..., 1:]
+    return strategy_returns, nan_cumprod(1 + strategy_returns)
+
+
+# 對一個區塊的持倉矩陣計算績效指標，返回每列的指標字典；days與initial_capital可為純量或逐列的陣列
+# trade_counts為選填的（平倉次數, 獲利次數），未提供時由持倉矩陣以收盤價成交計算
+def batch_performance_metrics(days, close, strategy_returns, cumulative_strategy_returns, position, initial_capital, trade_counts=None):
+    capital = np.asarray(initial_capital, dtype=np.float64)[:, None] if np.ndim(initial_capital) else initial_capital
+    equity = capital * cumulative_strategy_returns
+    total_returns = cumulative_strategy_returns[:, -1] - 1
+
+    peak = nan_cummax(equity)
+    drawdown = (equity - peak) / peak
+    with np.errstate(invalid='ignore'):
+        max_drawdowns = np.fmin.reduce(drawdown, axis=1)
+
+    returns_std = nan_std(strategy_returns)
+    total_trades, winning_trades = trade_counts or _trade_counts(close, position, initial_capital)
+
+    days = np.broadcast_to(days, (position.shape[0],)).tolist()
+    metrics_list = []
+    for i in range(position.shape[0]):
+        total_return = total_returns[i]
+        annualized_return = (1 + total_return) ** (365 / days[i]) - 1 if days[i] > 0 else 0
+        std = returns_std[i]
+        sharpe_ratio = (annualized_return - RISK_FREE_RATE) / (std * (252 ** 0.5)) if std > 0 else 0
+        trades = int(total_trades[i])
+        win_rate = int(winning_trades[i]) / trades if trades > 0 else 0
+        metrics_list.append({
+            'total_return': total_return,
+            'annualized_return': annualized_return,
+            'sharpe_ratio': sharpe_ratio,
+            'max_drawdown': max_drawdowns[i],
+            'win_rate': win_rate,
+            'total_trades': trades
+        })
+    return metrics_list
+
+
+# 批量回測：一次評估整組參數，返回與param_grid順序一致的績效指標列表
+# 結果與逐一呼叫backtest_strategy的performance_metrics相同；execution為選填的撮合模型（見execution.py）
+def batched_backtest(df, strategy_type, param_grid, initial_capital, execution=None):
+    strategy = get_strategy(strategy_type)
+    if not param_grid:
+        return []
+
+    close = df['close'].to_numpy(dtype=np.float64)
+    returns = np.empty_like(close)
+    returns[0] = np.nan
+    returns[1:] = close[1:] / close[:-1] - 1
+    days = (df.index[-1] - df.index[0]).days
+    if execution is not None:
+        day_numbers = df.index.values.astype('M8[D]').astype(np.int64)
+        open_prices = df['open'].to_numpy(dtype=np.float64) if 'open' in df else None
+
+    # 依記憶體上限將參數網格切成區塊
+    block_size = max(1, MAX_BLOCK_CELLS // max(1, len(close)))
+
+    # 已計算的指標（每組指標參數一條序列），供所有區塊共用
+    indicator_rows = IndicatorRows(df)
+    metrics_list = []
+    for start in range(0, len(param_grid), block_size):
+        block = param_grid[start:start + block_size]
+        position = signals_to_positions(strategy.signals(df, block, indicator_rows))
+        if execution is not None:
+            metrics_list.extend(execution.batch_metrics(
+                day_numbers, days, open_prices, close, position, initial_capital, batch_performance_metrics
+            ))
+            continue
+        strategy_returns, cumulative_strategy_returns = batch_strategy_returns(returns, position)
+        metrics_list.extend(batch_performance_metrics(
+            days, close, strategy_returns, cumulative_strategy_returns, position, initial_capital
+        ))
+    return metrics_list
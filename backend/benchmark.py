@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from app import app, build_strategy_signals, load_price_frame, optimize_strategy_parameters
+from backtest_engine import (
+    build_trade_ledger, compute_equity, compute_monthly_returns, compute_performance_metrics, signals_to_positions
+)
+from indicators import INDICATOR_FUNCTIONS, normalize_params
+from market_data import simulate_ohlcv
+from serialization import columnar, dumps
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, 'benchmark_results.json')
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'benchmark_baseline.json')
+
+# 測試資料集：K線數與頻率（日線以日曆日計，與 /api/stocks/data 相同；分鐘線約一年的交易分鐘數）
+DATASETS = {
+    '1y': (365, 'D'),
+    '10y': (3650, 'D'),
+    '30y': (10950, 'D'),
+    'minute': (245 * 270, 'min'),
+}
+
+# 參數優化只在較小的資料集上測量，避免整體執行時間過長
+OPTIMIZE_DATASETS = ('1y', '10y')
+
+BENCHMARK_STRATEGIES = [
+    ('ma_cross', {'short': 5, 'long': 20}),
+    ('rsi', {'period': 14, 'overbought': 70, 'oversold': 30}),
+    ('bollinger', {'period': 20, 'std': 2}),
+]
+
+INITIAL_CAPITAL = 1000000
+
+# 執行時間超過基準的比例上限，以及忽略比較的最短時間（過短的階段受雜訊影響大）
+DEFAULT_THRESHOLD = 0.3
+DEFAULT_MIN_SECONDS = 0.002
+
+
+# 產生模擬K線：與 /api/stocks/data 相同的向量化產生器，但固定隨機種子、K線數（日線以日曆日計）
+# 且單根K線的報酬波動固定為1%，長序列的價格不會溢位
+def generate_price_data(periods, freq='D', base_price=500, seed=42):
+    dates = pd.date_range(end=pd.Timestamp('2024-12-31 13:30'), periods=periods, freq=freq)
+    prices = simulate_ohlcv(np.random.RandomState(seed), periods, base_price, 0.01)
+
+    date_format = '%Y-%m-%d' if freq == 'D' else '%Y-%m-%dT%H:%M:%S'
+    return [
+        {'date': date, 'open': open_, 'high': high, 'low': low, 'close': close, 'volume': int(volume)}
+        for date, open_, high, low, close, volume in zip(
+            dates.strftime(date_format), *(prices[name].tolist() for name in ('open', 'high', 'low', 'close', 'volume'))
+        )
+    ]
+
+
+# 重複執行並記錄時間（中位數與最小值），再於tracemalloc下執行一次記錄記憶體峰值
+def measure(func, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return result, {
+        'seconds': statistics.median(timings),
+        'min_seconds': min(timings),
+        'peak_bytes': peak,
+    }
+
+
+# 對單一資料集測量各階段：DataFrame解析、指標、信號、交易記錄、績效指標、序列化與完整的HTTP端點
+def benchmark_dataset(name, repeat):
+    periods, freq = DATASETS[name]
+    price_data = generate_price_data(periods, freq)
+    stages = {}
+
+    df, stages['parse'] = measure(lambda: load_price_frame({'price_data': price_data}), repeat)
+
+    # 直接呼叫指標函數，不經過快取
+    def compute_indicators():
+        values = {}
+        for indicator_type, func in INDICATOR_FUNCTIONS.items():
+            values.update(func(df, **dict(normalize_params(indicator_type, {}))))
+        return values
+    indicator_values, stages['indicators'] = measure(compute_indicators, repeat)
+    _, stages['indicators_serialization'] = measure(lambda: dumps(columnar(df.index, indicator_values)), repeat)
+
+    close = df['close'].to_numpy()
+    for strategy_type, params in BENCHMARK_STRATEGIES:
+        signal, stages[f'{strategy_type}.signals'] = measure(
+            lambda: build_strategy_signals(df, strategy_type, params), repeat
+        )
+
+        def ledger():
+            position = signals_to_positions(signal)
+            return compute_equity(close, position, INITIAL_CAPITAL), build_trade_ledger(df.index, close, position, INITIAL_CAPITAL)
+        ((strategy_returns, cumulative, equity), (trades, sell_pnl)), stages[f'{strategy_type}.ledger'] = measure(ledger, repeat)
+
+        def metrics():
+            return {
+                'performance_metrics': compute_performance_metrics(df.index, strategy_returns, cumulative, equity, sell_pnl),
+                'trades': trades,
+                'monthly_returns': compute_monthly_returns(df.index, strategy_returns),
+                'equity_curve': columnar(df.index, {'equity': equity}),
+            }
+        result, stages[f'{strategy_type}.metrics'] = measure(metrics, repeat)
+        _, stages[f'{strategy_type}.serialization'] = measure(lambda: dumps(result), repeat)
+
+    # 完整的HTTP請求：JSON解析、回測與回應編碼
+    client = app.test_client()
+    body = json.dumps({'price_data': price_data, 'strategy': {'type': 'ma_cross', 'params': {'short': 5, 'long': 20}}, 'cache': False})
+
+    def request_backtest():
+        response = client.post('/api/backtest/run', data=body, content_type='application/json')
+        if response.status_code != 200:
+            raise RuntimeError(response.get_data(as_text=True))
+        return response
+    _, stages['endpoint.backtest'] = measure(request_backtest, repeat)
+
+    if name in OPTIMIZE_DATASETS:
+        _, stages['optimize.grid'] = measure(
+            lambda: optimize_strategy_parameters(df, 'ma_cross', {}, 'grid', 'sharpe_ratio', INITIAL_CAPITAL), repeat
+        )
+
+    return {'bars': periods, 'interval': freq, 'stages': stages}
+
+
+def run_benchmarks(datasets, repeat):
+    # 關閉指標快取，確保每次都測量實際計算
+    from indicators import indicator_cache
+    indicator_cache.max_bytes = 0
+
+    results = {}
+    for name in datasets:
+        started = time.perf_counter()
+        results[name] = benchmark_dataset(name, repeat)
+        print(f'{name}: {time.perf_counter() - started:.1f}s', file=sys.stderr)
+
+    return {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+# 與基準比較：執行時間或記憶體峰值超過基準 (1 + threshold) 倍的階段視為退化
+def compare_with_baseline(current, baseline, threshold, min_seconds):
+    regressions = []
+    for name, dataset in current['results'].items():
+        baseline_stages = baseline['results'].get(name, {}).get('stages', {})
+        for stage, stats in dataset['stages'].items():
+            reference = baseline_stages.get(stage)
+            if reference is None:
+                continue
+            if max(stats['seconds'], reference['seconds']) >= min_seconds and \
+               stats['seconds'] > reference['seconds'] * (1 + threshold):
+                regressions.append(f"{name} {stage}: {reference['seconds'] * 1000:.2f}ms -> {stats['seconds'] * 1000:.2f}ms")
+            if stats['peak_bytes'] > reference['peak_bytes'] * (1 + threshold) + 65536:
+                regressions.append(f"{name} {stage}: peak {reference['peak_bytes']} -> {stats['peak_bytes']} bytes")
+    return regressions
+
+
+def print_summary(report):
+    for name, dataset in report['results'].items():
+        print(f"[{name}] {dataset['bars']} bars ({dataset['interval']})")
+        for stage, stats in dataset['stages'].items():
+            print(f"  {stage:28s} {stats['seconds'] * 1000:10.2f} ms  {stats['peak_bytes'] / 1024 / 1024:8.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='後端效能基準測試')
+    parser.add_argument('--datasets', default=','.join(DATASETS), help=f'逗號分隔的資料集（{", ".join(DATASETS)}）')
+    parser.add_argument('--repeat', type=int, default=5, help='每個階段重複執行的次數')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='結果JSON檔案')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基準JSON檔案')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='允許比基準慢的比例')
+    parser.add_argument('--min-seconds', type=float, default=DEFAULT_MIN_SECONDS, help='短於此時間的階段不比較執行時間')
+    parser.add_argument('--update-baseline', action='store_true', help='以本次結果覆寫基準')
+    args = parser.parse_args()
+
+    datasets = [name.strip() for name in args.datasets.split(',') if name.strip()]
+    unknown = [name for name in datasets if name not in DATASETS]
+    if unknown:
+        parser.error(f'未知的資料集: {", ".join(unknown)}')
+
+    report = run_benchmarks(datasets, args.repeat)
+    print_summary(report)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'已更新基準: {args.baseline}')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f'找不到基準檔案 {args.baseline}，略過比較')
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare_with_baseline(report, baseline, args.threshold, args.min_seconds)
+    if regressions:
+        print('效能退化：')
+        for regression in regressions:
+            print(f'  {regression}')
+        return 1
+    print('未發現效能退化')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
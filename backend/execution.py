@@ -0,0 +1,322 @@
+import numpy as np
+
+from backtest_engine import (
+    TRADE_CAPITAL_RATIO,
+    compute_monthly_returns,
+    compute_performance_metrics,
+    signals_to_positions,
+)
+from instrumentation import stage
+from serialization import columnar
+
+# 台股交易成本與撮合規則的預設值
+# fee_discount為實際支付的手續費比例（例如6折為0.6），手續費與稅金皆無條件捨去到元
+EXECUTION_DEFAULTS = {
+    'fee_rate': 0.001425,
+    'fee_discount': 1.0,
+    'min_fee': 20,
+    'tax_rate': 0.003,
+    'day_trade_tax_rate': 0.0015,
+    'lot_size': 1000,
+    'odd_lots': True,
+    'price_limit': 0.1,
+    'fill': 'next_open',
+    'capital_ratio': TRADE_CAPITAL_RATIO,
+    'allow_short': False,
+}
+
+# 成交價：next_open為信號K線的下一根開盤價，close為信號K線的收盤價
+FILL_MODES = ('next_open', 'close')
+
+# 漲跌停價依檔位向下取整，成交價與理論漲跌停價相差在此比例內即視為觸及漲跌停
+LIMIT_TOLERANCE = 0.001
+
+
+class ExecutionError(ValueError):
+    pass
+
+
+# 事件陣列依列排序時，取得同一列中前一個事件的值（每列第一個事件為fill）
+def _shift_in_rows(values, rows, fill):
+    shifted = np.empty_like(values)
+    if len(values):
+        shifted[0] = fill
+        shifted[1:] = values[:-1]
+        shifted[1:][rows[1:] != rows[:-1]] = fill
+    return shifted
+
+
+# 每根K線之後（含當根）第一根未被封鎖的K線索引，沒有時為K線數
+def _next_allowed(blocked):
+    n = len(blocked)
+    idx = np.where(blocked, n, np.arange(n))
+    return np.minimum.accumulate(idx[::-1])[::-1]
+
+
+# 前一個交易日的收盤價：日線為前一根K線，分鐘線為前一日最後一根K線
+def _reference_close(day_numbers, close):
+    previous_idx = np.searchsorted(day_numbers, day_numbers, side='left') - 1
+    return np.where(previous_idx >= 0, close[np.maximum(previous_idx, 0)], np.nan)
+
+
+# 台股撮合模型：手續費（含折扣與最低手續費）、證交稅（當沖減半）、整股/零股、漲跌停無法成交、次根開盤價成交
+# 每次進場使用固定金額（初始資金 × capital_ratio），所有計算皆為陣列運算，持倉矩陣可為（參數組合 × K線）
+class TaiwanExecution:
+    name = 'taiwan'
+
+    def __init__(self, **options):
+        unknown = sorted(set(options) - set(EXECUTION_DEFAULTS))
+        if unknown:
+            raise ExecutionError(f'不支援的撮合參數: {", ".join(unknown)}')
+        config = {**EXECUTION_DEFAULTS, **options}
+
+        if config['fill'] not in FILL_MODES:
+            raise ExecutionError(f'不支援的成交方式: {config["fill"]}')
+        for key in ('fee_rate', 'fee_discount', 'min_fee', 'tax_rate', 'day_trade_tax_rate', 'price_limit'):
+            if config[key] is not None and float(config[key]) < 0:
+                raise ExecutionError(f'{key} 不可為負數')
+        if int(config['lot_size']) < 1 or float(config['capital_ratio']) <= 0:
+            raise ExecutionError('lot_size 與 capital_ratio 必須大於0')
+
+        self.fee_rate = float(config['fee_rate'])
+        self.fee_discount = float(config['fee_discount'])
+        self.min_fee = float(config['min_fee'])
+        self.tax_rate = float(config['tax_rate'])
+        self.day_trade_tax_rate = float(config['day_trade_tax_rate'])
+        self.lot_size = int(config['lot_size'])
+        self.odd_lots = bool(config['odd_lots'])
+        self.price_limit = float(config['price_limit'] or 0)
+        self.fill = config['fill']
+        self.capital_ratio = float(config['capital_ratio'])
+        self.allow_short = bool(config['allow_short'])
+
+    def config(self):
+        return {'model': self.name, **{key: getattr(self, key) for key in EXECUTION_DEFAULTS}}
+
+    # 成交價與買賣各自的下一根可成交K線：觸及漲停無法買入、觸及跌停無法賣出，缺少價格的K線都無法成交
+    def _fill_prices(self, day_numbers, open_prices, close):
+        if self.fill == 'next_open' and open_prices is not None:
+            price = np.asarray(open_prices, dtype=np.float64)
+        else:
+            price = close
+        missing = np.isnan(price)
+        buy_blocked = missing.copy()
+        sell_blocked = missing.copy()
+
+        if self.price_limit > 0:
+            reference = _reference_close(day_numbers, close)
+            with np.errstate(invalid='ignore'):
+                buy_blocked |= price >= reference * (1 + self.price_limit) * (1 - LIMIT_TOLERANCE)
+                sell_blocked |= price <= reference * (1 - self.price_limit) * (1 + LIMIT_TOLERANCE)
+        return price, _next_allowed(buy_blocked), _next_allowed(sell_blocked)
+
+    # 由持倉矩陣產生所有成交，返回依（列, K線）排序的成交陣列
+    # 信號改變後的委託從下一根（next_open）或當根（close）開始有效，遇漲跌停順延，下一個委託生效前仍未成交則被取代
+    def fills(self, day_numbers, open_prices, close, position, initial_capital):
+        position = np.atleast_2d(position)
+        n_bars = position.shape[1]
+        target = position if self.allow_short else np.maximum(position, 0)
+        delay = 1 if self.fill == 'next_open' else 0
+        price, next_buy, next_sell = self._fill_prices(day_numbers, open_prices, close)
+
+        prev_target = np.zeros_like(target)
+        prev_target[:, 1:] = target[:, :-1]
+        rows, cols = np.nonzero(target != prev_target)
+        direction = target[rows, cols].astype(np.int64)
+        is_buy = direction > prev_target[rows, cols]
+
+        active = cols + delay
+        in_range = active < n_bars
+        safe_active = np.minimum(active, n_bars - 1)
+        fill_cols = np.where(in_range, np.where(is_buy, next_buy[safe_active], next_sell[safe_active]), n_bars)
+
+        next_active = np.full(len(rows), n_bars + delay)
+        if len(rows) > 1:
+            same_row = rows[1:] == rows[:-1]
+            next_active[:-1] = np.where(same_row, active[1:], n_bars + delay)
+        kept = (fill_cols < n_bars) & (fill_cols < next_active)
+        rows, fill_cols, direction = rows[kept], fill_cols[kept], direction[kept]
+
+        # 前一個委託被取代時，目標方向可能與目前持倉相同，這類委託不需成交
+        changed = direction != _shift_in_rows(direction, rows, 0)
+        rows, fill_cols, direction = rows[changed], fill_cols[changed], direction[changed]
+
+        fill_price = price[fill_cols]
+        capital = np.asarray(initial_capital, dtype=np.float64)[rows] if np.ndim(initial_capital) else initial_capital
+        unit = 1 if self.odd_lots else self.lot_size
+        target_shares = direction * (np.floor(capital * self.capital_ratio / fill_price / unit) * unit).astype(np.int64)
+        prev_shares = _shift_in_rows(target_shares, rows, 0)
+        delta = target_shares - prev_shares
+
+        # 每筆成交先平掉原有部位，再建立新部位
+        closed = np.abs(prev_shares)
+        opened = np.abs(target_shares)
+        traded = np.abs(delta)
+        notional = traded * fill_price
+        fee = np.where(traded > 0, np.maximum(np.floor(notional * self.fee_rate * self.fee_discount), self.min_fee), 0.0)
+
+        # 證交稅只在賣出時課徵：平多頭部位時若與進場同一天視為當沖，放空則以一般稅率計
+        entry_day = _shift_in_rows(day_numbers[fill_cols], rows, -1)
+        is_day_trade = entry_day == day_numbers[fill_cols]
+        close_tax_rate = np.where(is_day_trade, self.day_trade_tax_rate, self.tax_rate)
+        close_tax = np.where(prev_shares > 0, closed * fill_price * close_tax_rate, 0.0)
+        open_tax = np.where(target_shares < 0, opened * fill_price * self.tax_rate, 0.0)
+        tax = np.floor(close_tax + open_tax)
+
+        # 成本依數量分攤到平倉與建倉，平倉損益扣除進場與出場兩端的成本
+        with np.errstate(invalid='ignore', divide='ignore'):
+            open_share = np.where(traded > 0, opened / traded, 0.0)
+        open_cost = fee * open_share + (tax - np.floor(close_tax)) * (target_shares < 0)
+        close_cost = fee + tax - open_cost
+        entry_price = _shift_in_rows(fill_price, rows, np.nan)
+        entry_cost = _shift_in_rows(open_cost, rows, 0.0)
+        pnl = np.where(prev_shares != 0, prev_shares * (fill_price - entry_price) - entry_cost - close_cost, np.nan)
+
+        return {
+            'rows': rows,
+            'cols': fill_cols,
+            'price': fill_price,
+            'delta': delta,
+            'shares': target_shares,
+            'fee': fee,
+            'tax': tax,
+            'open_cost': open_cost,
+            'pnl': pnl,
+        }
+
+    # 由成交計算權益：現金為初始資金加上各筆成交的現金流，權益為現金加上持股市值
+    def equity(self, close, fills, shape, initial_capital):
+        rows, cols = fills['rows'], fills['cols']
+        cash_flow = np.zeros(shape)
+        cash_flow[rows, cols] = -fills['delta'] * fills['price'] - fills['fee'] - fills['tax']
+        share_change = np.zeros(shape)
+        share_change[rows, cols] = fills['delta']
+
+        capital = np.asarray(initial_capital, dtype=np.float64)[:, None] if np.ndim(initial_capital) else initial_capital
+        return capital + np.cumsum(cash_flow, axis=1) + np.cumsum(share_change, axis=1) * close
+
+    # 批量回測的績效指標：權益曲線與平倉損益皆來自同一組成交
+    def batch_metrics(self, day_numbers, days, open_prices, close, position, initial_capital, batch_performance_metrics):
+        fills = self.fills(day_numbers, open_prices, close, position, initial_capital)
+        equity = self.equity(close, fills, position.shape, initial_capital)
+        strategy_returns, cumulative_strategy_returns = equity_returns(equity, initial_capital)
+
+        closing = ~np.isnan(fills['pnl'])
+        n_rows = position.shape[0]
+        total_trades = np.bincount(fills['rows'][closing], minlength=n_rows)
+        winning_trades = np.bincount(fills['rows'][closing & (fills['pnl'] > 0)], minlength=n_rows)
+        return batch_performance_metrics(
+            days, close, strategy_returns, cumulative_strategy_returns, position, initial_capital,
+            trade_counts=(total_trades, winning_trades)
+        )
+
+
+# 由權益矩陣計算策略收益與累積收益（相對初始資金）
+def equity_returns(equity, initial_capital):
+    capital = np.asarray(initial_capital, dtype=np.float64)[:, None] if np.ndim(initial_capital) else initial_capital
+    strategy_returns = np.empty(equity.shape)
+    strategy_returns[:, 0] = equity[:, 0] / capital - 1
+    strategy_returns[:, 1:] = equity[:, 1:] / equity[:, :-1] - 1
+    return strategy_returns, equity / capital
+
+
+EXECUTION_MODELS = {
+    'taiwan': TaiwanExecution,
+}
+
+
+# 由請求中的execution設定建立撮合模型；未提供或model為ideal時使用無交易成本的收盤價成交（返回None）
+def build_execution_model(config):
+    if not config:
+        return None
+    if not isinstance(config, dict):
+        raise ExecutionError('execution 必須為物件')
+    options = dict(config)
+    model = options.pop('model', 'taiwan')
+    if model == 'ideal':
+        return None
+    if model not in EXECUTION_MODELS:
+        raise ExecutionError(f'不支援的撮合模型: {model}')
+    return EXECUTION_MODELS[model](**options)
+
+
+# 成交的交易類型：平多頭部位（含反手放空）為賣出、平空頭部位（含反手做多）為回補，空手時建倉為買入或放空
+def _trade_type(prev_shares, delta):
+    if prev_shares > 0:
+        return '賣出'
+    if prev_shares < 0:
+        return '回補'
+    return '買入' if delta > 0 else '放空'
+
+
+# 由成交建立交易記錄：每筆成交一筆記錄，賣出/回補時附上平倉損益（已扣除成本）
+def build_execution_ledger(dates, fills):
+    date_format = '%Y-%m-%d' if (dates.normalize() == dates).all() else '%Y-%m-%dT%H:%M:%S'
+    date_strs = dates[fills['cols']].strftime(date_format).tolist()
+    pnl = np.where(np.isnan(fills['pnl']), 0, np.round(fills['pnl']))
+    prev_shares = (fills['shares'] - fills['delta']).tolist()
+    return [
+        {
+            'date': date,
+            'type': _trade_type(prev, delta),
+            'price': price,
+            'shares': abs(delta),
+            'amount': int(abs(delta) * price),
+            'fee': int(fee),
+            'tax': int(tax),
+            'pnl': int(trade_pnl),
+        }
+        for date, prev, delta, price, fee, tax, trade_pnl in zip(
+            date_strs, prev_shares, fills['delta'].tolist(), fills['price'].tolist(), fills['fee'].tolist(),
+            fills['tax'].tolist(), pnl.tolist()
+        )
+        if delta != 0
+    ]
+
+
+# 權益曲線與交易記錄的對帳：期末權益 = 初始資金 + 已實現損益 + 未平倉部位的未實現損益
+def reconcile(fills, close, equity, initial_capital):
+    closing = ~np.isnan(fills['pnl'])
+    realized = float(fills['pnl'][closing].sum())
+    unrealized = 0.0
+    if len(fills['shares']) and fills['shares'][-1] != 0:
+        unrealized = float(fills['shares'][-1] * (close[-1] - fills['price'][-1]) - fills['open_cost'][-1])
+    final_equity = float(equity[-1]) if len(equity) else float(initial_capital)
+    return {
+        'final_equity': final_equity,
+        'realized_pnl': realized,
+        'unrealized_pnl': unrealized,
+        'total_fees': float(fills['fee'].sum()),
+        'total_tax': float(fills['tax'].sum()),
+        'difference': final_equity - (initial_capital + realized + unrealized),
+    }
+
+
+# 以撮合模型執行單一回測，返回與 run_backtest_arrays 相同的結構，另附撮合設定與對帳結果
+def run_execution_backtest(model, dates, open_prices, close, signal, initial_capital):
+    close = np.asarray(close, dtype=np.float64)
+    day_numbers = dates.values.astype('M8[D]').astype(np.int64)
+
+    with stage('equity'):
+        position = signals_to_positions(np.asarray(signal))[None, :]
+        fills = model.fills(day_numbers, open_prices, close, position, initial_capital)
+        equity_matrix = model.equity(close, fills, position.shape, initial_capital)
+        strategy_returns, cumulative_strategy_returns = equity_returns(equity_matrix, initial_capital)
+        equity = equity_matrix[0]
+    with stage('ledger'):
+        trades = build_execution_ledger(dates, fills)
+        sell_pnl = fills['pnl'][~np.isnan(fills['pnl'])]
+    with stage('metrics'):
+        performance_metrics = compute_performance_metrics(
+            dates, strategy_returns[0], cumulative_strategy_returns[0], equity, sell_pnl
+        )
+        monthly_returns = compute_monthly_returns(dates, strategy_returns[0])
+        equity_curve = columnar(dates, {'equity': equity})
+    return {
+        'performance_metrics': performance_metrics,
+        'trades': trades,
+        'monthly_returns': monthly_returns,
+        'equity_curve': equity_curve,
+        'execution': model.config(),
+        'reconciliation': reconcile(fills, close, equity, initial_capital),
+    }
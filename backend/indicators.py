@@ -0,0 +1,175 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# 指標快取的記憶體上限（MB），可透過環境變數 INDICATOR_CACHE_MB 設定，0表示停用快取
+DEFAULT_CACHE_MB = float(os.environ.get('INDICATOR_CACHE_MB', '64'))
+
+# 各指標的預設參數
+INDICATOR_DEFAULTS = {
+    'ma': {'length': 20},
+    'ema': {'length': 20},
+    'rsi': {'length': 14},
+    'macd': {'fast': 12, 'slow': 26, 'signal': 9},
+    'bollinger': {'length': 20, 'std': 2},
+    'kd': {'k': 9, 'd': 3},
+}
+
+
+# 以LRU策略淘汰的指標快取，依計算結果實際佔用的位元組數控制記憶體上限
+class IndicatorCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value[0]
+
+    def put(self, key, arrays):
+        size = sum(array.nbytes for array in arrays.values())
+        if size > self.max_bytes:
+            return
+        # 快取中的陣列設為唯讀，避免呼叫端修改到共用的結果
+        for array in arrays.values():
+            array.flags.writeable = False
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (arrays, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'current_bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+# 進程層級共用的指標快取
+indicator_cache = IndicatorCache(int(DEFAULT_CACHE_MB * 1024 * 1024))
+
+
+# 計算價格序列的指紋：日期與OHLCV陣列內容的雜湊值
+def price_fingerprint(df):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(df.index.asi8).tobytes())
+    for column in ('open', 'high', 'low', 'close', 'volume'):
+        if column in df:
+            digest.update(column.encode())
+            digest.update(np.ascontiguousarray(df[column].to_numpy(dtype=np.float64)).tobytes())
+    return digest.hexdigest()
+
+
+# 補上預設值並轉為可雜湊的參數元組
+def normalize_params(indicator_type, params):
+    merged = dict(INDICATOR_DEFAULTS[indicator_type])
+    merged.update({key: params[key] for key in merged if key in params})
+    return tuple(sorted(merged.items()))
+
+
+def _ma(df, length):
+    return {'ma': df['close'].rolling(window=length).mean().to_numpy()}
+
+
+def _ema(df, length):
+    return {'ema': df['close'].ewm(span=length, adjust=False).mean().to_numpy()}
+
+
+def _rsi(df, length):
+    delta = df['close'].diff()
+    gain = (delta.where(delta > 0, 0)).rolling(window=length).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=length).mean()
+    rs = gain / loss
+    return {'rsi': (100 - (100 / (1 + rs))).to_numpy()}
+
+
+def _macd(df, fast, slow, signal):
+    ema_fast = df['close'].ewm(span=fast, adjust=False).mean()
+    ema_slow = df['close'].ewm(span=slow, adjust=False).mean()
+    macd_line = ema_fast - ema_slow
+    signal_line = macd_line.ewm(span=signal, adjust=False).mean()
+    histogram = macd_line - signal_line
+    return {
+        'macd': macd_line.to_numpy(),
+        'macd_signal': signal_line.to_numpy(),
+        'macd_histogram': histogram.to_numpy(),
+    }
+
+
+def _bollinger(df, length, std):
+    middle = df['close'].rolling(window=length).mean()
+    std_dev = df['close'].rolling(window=length).std()
+    upper = middle + std_dev * std
+    lower = middle - std_dev * std
+    return {
+        'bollinger_upper': upper.to_numpy(),
+        'bollinger_middle': middle.to_numpy(),
+        'bollinger_lower': lower.to_numpy(),
+    }
+
+
+def _kd(df, k, d):
+    low_min = df['low'].rolling(window=k).min()
+    high_max = df['high'].rolling(window=k).max()
+    stoch_k = 100 * ((df['close'] - low_min) / (high_max - low_min))
+    stoch_d = stoch_k.rolling(window=d).mean()
+    return {'stoch_k': stoch_k.to_numpy(), 'stoch_d': stoch_d.to_numpy()}
+
+
+INDICATOR_FUNCTIONS = {
+    'ma': _ma,
+    'ema': _ema,
+    'rsi': _rsi,
+    'macd': _macd,
+    'bollinger': _bollinger,
+    'kd': _kd,
+}
+
+
+# 計算技術指標（經由快取），返回 {輸出名稱: NumPy陣列}
+# fingerprint可由呼叫端預先計算，同一個請求內計算多個指標時避免重複雜湊
+def compute_indicator(df, indicator_type, params=None, fingerprint=None):
+    normalized = normalize_params(indicator_type, params or {})
+    func = INDICATOR_FUNCTIONS[indicator_type]
+
+    if indicator_cache.max_bytes <= 0:
+        return func(df, **dict(normalized))
+
+    if fingerprint is None:
+        fingerprint = price_fingerprint(df)
+    key = (fingerprint, indicator_type, normalized)
+
+    arrays = indicator_cache.get(key)
+    if arrays is None:
+        arrays = func(df, **dict(normalized))
+        indicator_cache.put(key, arrays)
+    return arrays
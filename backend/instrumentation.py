@@ -0,0 +1,341 @@
+import contextvars
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from shared_store import SharedDatabase, SharedStoreError
+
+# 延遲直方圖的上界（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# ?profile=1 時返回的函數數量（依累計時間排序）
+PROFILE_TOP_N = 30
+
+_current_recorder = contextvars.ContextVar('stage_recorder', default=None)
+
+
+# 記錄單一請求內各階段的耗時，同名階段（例如分段評估）累加
+class StageRecorder:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = OrderedDict()
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    # Server-Timing 標頭：各階段與總耗時（毫秒）
+    def server_timing(self, total):
+        entries = [f'{name};dur={seconds * 1000:.3f}' for name, seconds in self.stages.items()]
+        entries.append(f'total;dur={total * 1000:.3f}')
+        return ', '.join(entries)
+
+
+def start_recording():
+    recorder = StageRecorder()
+    _current_recorder.set(recorder)
+    return recorder
+
+
+def stop_recording():
+    _current_recorder.set(None)
+
+
+# 階段計時：只在請求中（已開始記錄時）計時，其他情況（背景任務、工作進程）不做任何事
+@contextmanager
+def stage(name):
+    recorder = _current_recorder.get()
+    if recorder is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.add(name, time.perf_counter() - start)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, description, label_names):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    # 可JSON序列化的快照：[[標籤, 數值], ...]；values為合併後的數值，未提供時為本進程的數值
+    def snapshot(self, values=None):
+        if values is None:
+            with self._lock:
+                values = dict(self._values)
+        return [[list(labels), value] for labels, value in values.items()]
+
+    # 合併多個進程的快照（同標籤相加）
+    def merge(self, snapshots):
+        values = {}
+        for snapshot in snapshots:
+            for labels, value in snapshot:
+                labels = tuple(labels)
+                values[labels] = values.get(labels, 0) + value
+        return values
+
+    # values為合併後的數值，未提供時輸出本進程的數值
+    def render(self, values=None):
+        if values is None:
+            values = self.merge([self.snapshot()])
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{_format_labels(self.label_names, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, description, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    # 可JSON序列化的快照：[[標籤, 各上界的累計數, 總和, 次數], ...]；series為合併後的數值，未提供時為本進程的數值
+    def snapshot(self, series=None):
+        if series is None:
+            with self._lock:
+                series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        return [[list(labels), list(counts), total, count] for labels, (counts, total, count) in series.items()]
+
+    # 合併多個進程的快照（同標籤的各上界累計數、總和與次數相加）
+    def merge(self, snapshots):
+        series = {}
+        for snapshot in snapshots:
+            for labels, counts, total, count in snapshot:
+                labels = tuple(labels)
+                merged = series.get(labels)
+                if merged is None:
+                    series[labels] = [list(counts), total, count]
+                else:
+                    merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                    merged[1] += total
+                    merged[2] += count
+        return series
+
+    # series為合併後的數值，未提供時輸出本進程的數值
+    def render(self, series=None):
+        if series is None:
+            series = self.merge([self.snapshot()])
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in sorted(series.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                bucket_labels = _format_labels(self.label_names, labels, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{bucket_labels} {bucket_count}')
+            inf_labels = _format_labels(self.label_names, labels, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{inf_labels} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(self.label_names, labels)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.label_names, labels)} {count}')
+        return lines
+
+
+requests_total = Counter(
+    'http_requests_total', '依端點、方法與狀態碼統計的請求數', ('endpoint', 'method', 'status')
+)
+request_latency = Histogram(
+    'http_request_duration_seconds', '請求延遲（秒），依端點、方法與策略類型區分', ('endpoint', 'method', 'strategy')
+)
+stage_latency = Histogram(
+    'http_request_stage_duration_seconds', '請求內各階段的耗時（秒）', ('endpoint', 'stage')
+)
+
+METRICS = [requests_total, request_latency, stage_latency]
+
+
+METRICS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS metrics (
+    owner TEXT PRIMARY KEY,
+    snapshot TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+'''
+
+# 多進程時各工作進程寫入指標快照的間隔（秒）
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '1'))
+
+# 已結束的工作進程的指標併入此列，使計數不因工作進程重新啟動而減少
+RETIRED_OWNER = 'retired'
+
+
+def _metrics_snapshot():
+    return {metric.name: metric.snapshot() for metric in METRICS}
+
+
+def _merge_snapshots(snapshots):
+    return {metric.name: metric.merge([snapshot.get(metric.name, []) for snapshot in snapshots]) for metric in METRICS}
+
+
+# 多進程伺服器的監控指標：每個工作進程定期把自己的指標快照寫入共用的狀態資料庫（每個進程一列），
+# /metrics 由處理請求的工作進程合併所有進程的快照後輸出
+class SharedMetrics:
+    def __init__(self, path, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.db = SharedDatabase(path, METRICS_SCHEMA)
+        self.flush_interval = flush_interval
+        self.owner = None
+        self.pid = None
+        self.dirty = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    # 父進程在fork前呼叫：清除上次執行留下的指標
+    def reset(self):
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM metrics')
+        self.db.close()
+
+    # 記錄指標後呼叫；每個進程第一次呼叫時啟動背景寫入執行緒
+    def mark_dirty(self):
+        with self._lock:
+            self.dirty = True
+            if self.pid == os.getpid():
+                return
+            self.owner = uuid.uuid4().hex
+            self.pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            with self._lock:
+                dirty, self.dirty = self.dirty, False
+            if dirty:
+                try:
+                    self.flush()
+                except SharedStoreError:
+                    pass
+
+    def flush(self):
+        with self._flush_lock:
+            if self.pid != os.getpid():
+                return
+            with self.db.transaction() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO metrics (owner, snapshot, updated_at) VALUES (?, ?, ?)',
+                    (self.owner, json.dumps(_metrics_snapshot()), time.time()),
+                )
+
+    # 工作進程結束前呼叫：本進程的指標併入已結束進程的合計
+    def retire(self):
+        with self._flush_lock:
+            if self.pid != os.getpid():
+                return
+            with self.db.transaction() as conn:
+                row = conn.execute('SELECT snapshot FROM metrics WHERE owner = ?', (RETIRED_OWNER,)).fetchone()
+                snapshots = [_metrics_snapshot()] + ([json.loads(row[0])] if row is not None else [])
+                merged = _merge_snapshots(snapshots)
+                merged = {metric.name: metric.snapshot(merged[metric.name]) for metric in METRICS}
+                conn.execute(
+                    'INSERT OR REPLACE INTO metrics (owner, snapshot, updated_at) VALUES (?, ?, ?)',
+                    (RETIRED_OWNER, json.dumps(merged), time.time()),
+                )
+                conn.execute('DELETE FROM metrics WHERE owner = ?', (self.owner,))
+            self.pid = None
+
+    # 合併所有進程（含本進程的最新數值）的指標
+    def collect(self):
+        self.flush()
+        rows = self.db.connect().execute('SELECT snapshot FROM metrics').fetchall()
+        return _merge_snapshots([json.loads(snapshot) for snapshot, in rows])
+
+
+# 多進程伺服器啟用的共用指標（單一進程時為None，只輸出本進程的指標）
+shared_metrics = None
+
+
+# 由多進程伺服器在fork工作進程前呼叫
+def enable_shared_metrics(path):
+    global shared_metrics
+    shared_metrics = SharedMetrics(path)
+    shared_metrics.reset()
+
+
+# 工作進程結束前呼叫，保留其指標
+def retire_shared_metrics():
+    if shared_metrics is not None:
+        shared_metrics.retire()
+
+
+# 記錄一次請求的延遲與各階段耗時
+def observe_request(endpoint, method, status, strategy, seconds, recorder):
+    requests_total.inc((endpoint, method, str(status)))
+    request_latency.observe((endpoint, method, strategy), seconds)
+    for name, stage_seconds in recorder.stages.items():
+        stage_latency.observe((endpoint, name), stage_seconds)
+    if shared_metrics is not None:
+        shared_metrics.mark_dirty()
+
+
+# Prometheus文字格式；多進程時合併所有工作進程的指標
+def render_metrics():
+    merged = shared_metrics.collect() if shared_metrics is not None else {}
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render(merged.get(metric.name)))
+    return '\n'.join(lines) + '\n'
+
+
+# cProfile摘要：依累計時間排序的前N個函數，以及pstats的文字報表
+def profile_summary(profiler, top_n=PROFILE_TOP_N):
+    stats = pstats.Stats(profiler)
+    stats.sort_stats('cumulative')
+
+    functions = []
+    for func in stats.fcn_list[:top_n]:
+        primitive_calls, total_calls, total_time, cumulative_time, _ = stats.stats[func]
+        filename, line, name = func
+        functions.append({
+            'function': f'{filename}:{line}({name})',
+            'ncalls': total_calls,
+            'primitive_calls': primitive_calls,
+            'tottime': total_time,
+            'cumtime': cumulative_time,
+        })
+
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(top_n)
+    return {
+        'total_seconds': stats.total_tt,
+        'functions': functions,
+        'report': report.getvalue(),
+    }
@@ -0,0 +1,285 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from serialization import dumps
+from shared_store import DEFAULT_STATE_STORE_PATH, SharedDatabase
+
+# 同時執行的背景任務數（每個進程），可透過環境變數 JOB_WORKERS 設定
+DEFAULT_JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+
+# 最多保留的任務數，超過時淘汰最早結束的任務
+MAX_JOBS = int(os.environ.get('MAX_JOBS', '200'))
+
+# 進度查詢時返回的部分結果數
+PARTIAL_TOP_N = 10
+
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+UNFINISHED_STATUSES = ('queued', 'running')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    request_hash TEXT,
+    status TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    done INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    progress TEXT,
+    result BLOB,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_request_hash ON jobs (request_hash, status);
+CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at);
+'''
+
+JOB_COLUMNS = 'id, kind, status, created_at, started_at, finished_at, done, total, progress, error'
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# 計算請求雜湊值，相同請求的已完成任務可直接重用
+def request_hash(*parts):
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _encode(value):
+    payload = dumps(value)
+    return payload.encode() if isinstance(payload, str) else payload
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _job_dict(row, include_result):
+    job_id, kind, status, created_at, started_at, finished_at, done, total, progress, error = row[:10]
+    progress = json.loads(progress) if progress else {}
+    job = {
+        'id': job_id,
+        'kind': kind,
+        'status': status,
+        'created_at': created_at,
+        'started_at': started_at,
+        'finished_at': finished_at,
+        'progress': {
+            'done': done,
+            'total': total,
+            'ratio': done / total if total else 0,
+        },
+        'best_params': progress.get('best_params'),
+        'best_metric_value': progress.get('best_metric_value'),
+        'partial_results': progress.get('partial_results', []),
+        'error': error,
+    }
+    if include_result:
+        job['result'] = json.loads(zlib.decompress(row[10])) if row[10] is not None else None
+    return job
+
+
+# 執行中任務的控制代碼：在執行任務的進程內回報進度，並檢查其他進程送出的取消要求
+class Job:
+    def __init__(self, manager, job_id, kind):
+        self.manager = manager
+        self.id = job_id
+        self.kind = kind
+        self.partial_results = []
+
+    # 由執行中的任務回報進度；已要求取消時拋出JobCancelled中止任務
+    def report_progress(self, done, total, best_params=None, best_metric_value=None, partial_results=None):
+        if partial_results is not None:
+            self.partial_results = partial_results[:PARTIAL_TOP_N]
+        progress = {
+            'best_params': best_params,
+            'best_metric_value': best_metric_value,
+            'partial_results': self.partial_results,
+        }
+        if self.manager._update_progress(self.id, done, total, progress):
+            raise JobCancelled()
+
+
+# 長時間任務在提交任務的進程內以執行緒池執行，任務狀態、進度與結果保存在共用的狀態資料庫，
+# 多進程伺服器的任一工作進程都能查詢或取消；執行任務的進程結束時，未完成的任務標記為失敗
+class JobManager:
+    def __init__(self, path=DEFAULT_STATE_STORE_PATH, max_workers=DEFAULT_JOB_WORKERS, max_jobs=MAX_JOBS):
+        self.db = SharedDatabase(path, SCHEMA)
+        self.max_workers = max_workers
+        self.max_jobs = max_jobs
+        self._executor = None
+        self._executor_pid = None
+        self._running = set()
+        self._lock = threading.Lock()
+
+    # 執行緒池在每個進程第一次提交任務時建立（fork前建立的執行緒不會複製到子進程）
+    def _get_executor(self):
+        with self._lock:
+            if self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+                self._executor_pid = os.getpid()
+                self._running = set()
+            return self._executor
+
+    # 提交任務：func(job) 執行實際工作並返回結果；相同請求已完成時直接返回該任務
+    def submit(self, kind, func, request_hash=None):
+        executor = self._get_executor()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._running.add(job_id)
+        try:
+            with self.db.transaction() as conn:
+                row = None
+                if request_hash is not None:
+                    row = conn.execute(
+                        "SELECT id FROM jobs WHERE request_hash = ? AND status = 'completed' "
+                        'ORDER BY finished_at DESC LIMIT 1',
+                        (request_hash,),
+                    ).fetchone()
+                if row is None:
+                    conn.execute(
+                        "INSERT INTO jobs (id, kind, request_hash, status, pid, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                        (job_id, kind, request_hash, os.getpid(), time.time()),
+                    )
+                    self._evict(conn)
+        except BaseException:
+            self._discard(job_id)
+            raise
+
+        if row is not None:
+            self._discard(job_id)
+            return self.get(row[0], include_result=False), True
+        executor.submit(self._run, Job(self, job_id, kind), func)
+        return self.get(job_id, include_result=False), False
+
+    def _discard(self, job_id):
+        with self._lock:
+            self._running.discard(job_id)
+
+    def _run(self, job, func):
+        try:
+            with self.db.transaction() as conn:
+                started = conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'",
+                    (time.time(), job.id),
+                ).rowcount
+            if not started:
+                return
+            try:
+                result = zlib.compress(_encode(func(job)), 6)
+            except JobCancelled:
+                self._finish(job.id, 'cancelled')
+            except Exception as e:
+                self._finish(job.id, 'failed', error=str(e))
+            else:
+                self._finish(job.id, 'completed', result=result)
+        finally:
+            self._discard(job.id)
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self.db.transaction() as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ? WHERE id = ? AND status IN (?, ?)',
+                (status, time.time(), result, error, job_id) + UNFINISHED_STATUSES,
+            )
+
+    # 寫入進度並返回是否已要求取消
+    def _update_progress(self, job_id, done, total, progress):
+        conn = self.db.connect()
+        conn.execute(
+            'UPDATE jobs SET done = ?, total = ?, progress = ? WHERE id = ?',
+            (done, total, _encode(progress).decode(), job_id),
+        )
+        row = conn.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return row is None or bool(row[0])
+
+    # 淘汰最早結束的任務，執行中與排隊中的任務不受影響
+    def _evict(self, conn):
+        excess = conn.execute('SELECT COUNT(*) FROM jobs').fetchone()[0] - self.max_jobs
+        if excess > 0:
+            conn.execute(
+                'DELETE FROM jobs WHERE id IN (SELECT id FROM jobs WHERE status IN (?, ?, ?) ORDER BY finished_at LIMIT ?)',
+                FINISHED_STATUSES + (excess,),
+            )
+
+    # 執行任務的進程已結束（工作進程重新啟動或意外結束）時，其未完成的任務不會再有進度，標記為失敗
+    def _fail_orphans(self):
+        conn = self.db.connect()
+        rows = conn.execute('SELECT id, pid FROM jobs WHERE status IN (?, ?)', UNFINISHED_STATUSES).fetchall()
+        if not rows:
+            return
+        pid = os.getpid()
+        with self._lock:
+            running = set(self._running) if self._executor_pid == pid else set()
+        orphans = [
+            job_id for job_id, owner in rows
+            if (job_id not in running if owner == pid else not _pid_alive(owner))
+        ]
+        if orphans:
+            self._fail(orphans, '執行任務的進程已結束')
+
+    def _fail(self, job_ids, error):
+        with self.db.transaction() as conn:
+            conn.executemany(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, error = ? WHERE id = ? AND status IN (?, ?)",
+                [(time.time(), error, job_id) + UNFINISHED_STATUSES for job_id in job_ids],
+            )
+
+    # 伺服器啟動時（fork工作進程前）呼叫：先前未完成的任務已沒有進程執行
+    def fail_unfinished(self):
+        conn = self.db.connect()
+        rows = conn.execute('SELECT id FROM jobs WHERE status IN (?, ?)', UNFINISHED_STATUSES).fetchall()
+        if rows:
+            self._fail([job_id for job_id, in rows], '伺服器已重新啟動')
+
+    def close(self):
+        self.db.close()
+
+    # 查詢任務（含進度與完成後的結果），不存在時返回None
+    def get(self, job_id, include_result=True):
+        self._fail_orphans()
+        columns = JOB_COLUMNS + (', result' if include_result else '')
+        row = self.db.connect().execute(f'SELECT {columns} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return None if row is None else _job_dict(row, include_result)
+
+    # 列出所有任務（不含結果），依建立時間排序
+    def list(self):
+        self._fail_orphans()
+        rows = self.db.connect().execute(f'SELECT {JOB_COLUMNS} FROM jobs ORDER BY created_at').fetchall()
+        return [_job_dict(row, False) for row in rows]
+
+    # 要求取消任務：排隊中的任務不會開始執行，執行中的任務在下一次回報進度時中止
+    def cancel(self, job_id):
+        with self.db.transaction() as conn:
+            row = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row[0] == 'queued':
+                conn.execute(
+                    "UPDATE jobs SET status = 'cancelled', finished_at = ?, cancel_requested = 1 WHERE id = ?",
+                    (time.time(), job_id),
+                )
+            elif row[0] == 'running':
+                conn.execute('UPDATE jobs SET cancel_requested = 1 WHERE id = ?', (job_id,))
+        return self.get(job_id, include_result=False)
+
+
+# 進程層級共用的任務管理器（狀態保存在共用的狀態資料庫）
+job_manager = JobManager()
@@ -0,0 +1,209 @@
+import argparse
+import gzip
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from market_data import generate_stock_data, to_records
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 請求情境：名稱 → (方法, 路徑, JSON請求內容)；回測與優化不使用結果資料庫，測量實際計算
+def build_scenarios(price_data):
+    return {
+        'search': ('GET', '/api/stocks/search?query=%E5%8F%B0', None),
+        'indicators': ('POST', '/api/indicators/calculate', {
+            'price_data': price_data,
+            'indicators': [{'type': 'ma', 'params': {'length': 20}}, {'type': 'rsi'}, {'type': 'macd'}],
+        }),
+        'backtest': ('POST', '/api/backtest/run', {
+            'price_data': price_data,
+            'strategy': {'type': 'ma_cross', 'params': {'short': 5, 'long': 20}},
+            'cache': False,
+        }),
+        'optimize': ('POST', '/api/optimize/run', {
+            'price_data': price_data,
+            'strategy': {'type': 'rsi'},
+            'optimization': {'target_metric': 'sharpe_ratio'},
+            'cache': False,
+        }),
+    }
+
+
+# 本機模擬用戶端：每個執行緒依序送出請求，記錄每個請求的延遲、狀態碼與回應大小
+class LoadClient:
+    def __init__(self, url, scenarios, accept_gzip=True, timeout=120):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.accept_gzip = accept_gzip
+        self.requests = [
+            (name, method, path, json.dumps(body).encode() if body is not None else None)
+            for name, (method, path, body) in scenarios.items()
+        ]
+        self.records = []
+        self._lock = threading.Lock()
+
+    def send(self, name, method, path, body):
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        if self.accept_gzip:
+            headers['Accept-Encoding'] = 'gzip'
+        started = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            payload = response.read()
+            status = response.status
+            if response.getheader('Content-Encoding') == 'gzip':
+                gzip.decompress(payload)
+            conn.close()
+        except OSError:
+            status, payload = 0, b''
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.records.append((name, status, elapsed, len(payload)))
+
+    # concurrency個執行緒共送出total個請求，依情境輪流
+    def run(self, concurrency, total):
+        counter = iter(range(total))
+        counter_lock = threading.Lock()
+
+        def worker():
+            while True:
+                with counter_lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                self.send(*self.requests[i % len(self.requests)])
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+
+def latency_stats(latencies):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        'count': len(latencies),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p90_ms': float(np.percentile(latencies, 90)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'max_ms': float(latencies.max()),
+    }
+
+
+def build_report(records, elapsed, concurrency):
+    report = {
+        'concurrency': concurrency,
+        'requests': len(records),
+        'seconds': elapsed,
+        'throughput_rps': len(records) / elapsed if elapsed > 0 else 0,
+        'errors': sum(1 for _, status, _, _ in records if status != 200),
+        'bytes_received': sum(size for _, _, _, size in records),
+        'latency': latency_stats([latency for _, _, latency, _ in records]),
+        'scenarios': {},
+    }
+    for name in dict.fromkeys(name for name, _, _, _ in records):
+        scenario = [record for record in records if record[0] == name]
+        report['scenarios'][name] = {
+            **latency_stats([latency for _, _, latency, _ in scenario]),
+            'errors': sum(1 for _, status, _, _ in scenario if status != 200),
+        }
+    return report
+
+
+def print_report(report):
+    print(f"{report['requests']} requests, concurrency {report['concurrency']}, {report['seconds']:.2f}s")
+    print(f"  throughput {report['throughput_rps']:.1f} req/s, errors {report['errors']}, "
+          f"received {report['bytes_received'] / 1024 / 1024:.2f} MB")
+    rows = [('all', report['latency'])] + list(report['scenarios'].items())
+    print(f"  {'scenario':12s} {'count':>6s} {'p50':>9s} {'p90':>9s} {'p99':>9s} {'max':>9s}")
+    for name, stats in rows:
+        print(f"  {name:12s} {stats['count']:6d} {stats['p50_ms']:7.1f}ms {stats['p90_ms']:7.1f}ms "
+              f"{stats['p99_ms']:7.1f}ms {stats['max_ms']:7.1f}ms")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# 以生產模式在本機啟動伺服器，等待可連線後返回子進程
+def start_local_server(port, workers, threads):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, 'server.py'), '--host', '127.0.0.1', '--port', str(port),
+         '--workers', str(workers), '--threads', str(threads)],
+        cwd=BACKEND_DIR,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('伺服器啟動失敗')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('等待伺服器啟動逾時')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='後端API負載測試：報告吞吐量與延遲分佈')
+    parser.add_argument('--url', help='已啟動的伺服器網址（如 http://127.0.0.1:8000），未提供時在本機啟動 server.py')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='本機伺服器的工作進程數')
+    parser.add_argument('--threads', type=int, default=4, help='本機伺服器每個工作進程的執行緒數')
+    parser.add_argument('--concurrency', type=int, default=8, help='同時送出請求的用戶端數')
+    parser.add_argument('--requests', type=int, default=200, help='總請求數')
+    parser.add_argument('--scenarios', default='search,indicators,backtest', help='逗號分隔的請求情境（search, indicators, backtest, optimize）')
+    parser.add_argument('--range', default='2y', help='價格數據期間（與 /api/stocks/data 的range相同）')
+    parser.add_argument('--no-gzip', action='store_true', help='不接受gzip壓縮的回應')
+    parser.add_argument('--output', help='結果JSON檔案')
+    args = parser.parse_args()
+
+    price_data = to_records(generate_stock_data('2330.TW', args.range, '1d', end='2024-12-31'))
+    scenarios = build_scenarios(price_data)
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in scenarios]
+    if unknown:
+        parser.error(f'未知的請求情境: {", ".join(unknown)}')
+
+    process = None
+    url = args.url
+    if url is None:
+        port = _free_port()
+        process = start_local_server(port, args.workers, args.threads)
+        url = f'http://127.0.0.1:{port}'
+    try:
+        client = LoadClient(url, {name: scenarios[name] for name in names}, accept_gzip=not args.no_gzip)
+        elapsed = client.run(args.concurrency, args.requests)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    report = build_report(client.records, elapsed, args.concurrency)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 1 if report['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
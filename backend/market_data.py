@@ -0,0 +1,134 @@
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from price_series import PriceSeries
+
+# K線週期：分鐘線以分鐘數表示，其餘為pandas的日期頻率（工作日、每週五、每月最後一個工作日）
+INTERVALS = {
+    '1m': 1, '2m': 2, '5m': 5, '15m': 15, '30m': 30, '60m': 60, '90m': 90, '1h': 60,
+    '1d': 'B', '1wk': 'W-FRI', '1mo': 'BME',
+}
+
+# 資料期間
+RANGES = {
+    '1d': pd.DateOffset(days=1),
+    '5d': pd.DateOffset(days=5),
+    '1mo': pd.DateOffset(months=1),
+    '3mo': pd.DateOffset(months=3),
+    '6mo': pd.DateOffset(months=6),
+    '1y': pd.DateOffset(years=1),
+    '2y': pd.DateOffset(years=2),
+    '5y': pd.DateOffset(years=5),
+    '10y': pd.DateOffset(years=10),
+    'max': pd.DateOffset(years=30),
+}
+
+# 台股交易時段 09:00–13:30（自午夜起算的分鐘數），每年約245個交易日
+SESSION_OPEN_MINUTE = 9 * 60
+SESSION_CLOSE_MINUTE = 13 * 60 + 30
+TRADING_DAYS_PER_YEAR = 245
+
+# 模擬價格的年化波動率
+ANNUAL_VOLATILITY = 0.3
+
+# 單一股票最多產生的K線數（約28年的1分鐘線）
+MAX_BARS = 2000000
+
+# 已知股票的基礎價格（以股票代碼的數字部分為鍵），其他股票由種子決定
+BASE_PRICES = {'2330': 500, '2317': 120, '2412': 110}
+
+
+class MarketDataError(ValueError):
+    pass
+
+
+# 每檔股票固定的隨機種子（與進程無關，同一股票每次產生相同的數據）
+def symbol_seed(symbol):
+    return zlib.crc32(symbol.upper().encode())
+
+
+def base_price(symbol, seed):
+    return BASE_PRICES.get(symbol.split('.')[0], round(10 + seed % 59000 / 100, 2))
+
+
+# 依期間與週期產生K線時間：日線以上為工作日，分鐘線為每個工作日交易時段內的K線起始時間
+def bar_dates(range_period, interval, end=None):
+    if range_period not in RANGES:
+        raise MarketDataError(f'不支援的資料期間: {range_period}')
+    if interval not in INTERVALS:
+        raise MarketDataError(f'不支援的K線週期: {interval}')
+
+    try:
+        end = pd.Timestamp(end).normalize() if end else pd.Timestamp.now().normalize()
+    except ValueError:
+        raise MarketDataError(f'無效的結束日期: {end}')
+    start = end - RANGES[range_period] + pd.Timedelta(days=1)
+    frequency = INTERVALS[interval]
+
+    if isinstance(frequency, str):
+        return pd.date_range(start, end, freq=frequency).values
+
+    days = pd.bdate_range(start, end).values
+    offsets = np.arange(SESSION_OPEN_MINUTE, SESSION_CLOSE_MINUTE, frequency).astype('m8[m]').astype('m8[ns]')
+    if len(days) * len(offsets) > MAX_BARS:
+        raise MarketDataError(f'K線數超過上限 {MAX_BARS}，請縮短資料期間或改用較長的K線週期')
+    return (days[:, None] + offsets[None, :]).ravel()
+
+
+# 每根K線的報酬波動：年化波動率依每年的K線數換算
+def bar_volatility(interval):
+    frequency = INTERVALS[interval]
+    if frequency == 'W-FRI':
+        bars_per_year = 52
+    elif frequency == 'BME':
+        bars_per_year = 12
+    elif frequency == 'B':
+        bars_per_year = TRADING_DAYS_PER_YEAR
+    else:
+        bars_per_day = -(-(SESSION_CLOSE_MINUTE - SESSION_OPEN_MINUTE) // frequency)
+        bars_per_year = TRADING_DAYS_PER_YEAR * bars_per_day
+    return ANNUAL_VOLATILITY / bars_per_year ** 0.5
+
+
+# 向量化產生OHLCV：收盤價為報酬的累積乘積，開高低價與成交量一次抽取（每根K線依序為開、高、低、量）
+# 最高價與最低價涵蓋開盤價與收盤價
+def simulate_ohlcv(rng, periods, base_price, volatility):
+    price_changes = rng.normal(0, 1, periods) * volatility
+    close = np.cumprod(np.concatenate([[base_price], 1 + price_changes]))[1:]
+    draws = rng.random_sample((periods, 4))
+
+    open_ = close * (1 - draws[:, 0] * 0.01)
+    return {
+        'open': open_,
+        'high': np.maximum(open_, close) * (1 + draws[:, 1] * 0.015),
+        'low': np.minimum(open_, close) * (1 - draws[:, 2] * 0.015),
+        'close': close,
+        'volume': np.floor(draws[:, 3] * 10000000 + 5000000),
+    }
+
+
+# 產生單一股票的模擬價格序列；未指定種子時使用股票代碼的固定種子
+def generate_stock_data(symbol, range_period='1y', interval='1d', end=None, seed=None):
+    dates = bar_dates(range_period, interval, end)
+    try:
+        seed = symbol_seed(symbol) if seed is None else int(seed)
+    except ValueError:
+        raise MarketDataError(f'無效的隨機種子: {seed}')
+    prices = simulate_ohlcv(np.random.RandomState(seed), len(dates), base_price(symbol, seed), bar_volatility(interval))
+
+    unit = 's' if isinstance(INTERVALS[interval], int) else 'D'
+    return PriceSeries(dates.astype(f'M8[{unit}]').astype(np.int64), unit=unit, **prices)
+
+
+# 舊版逐列格式（成交量為整數）
+def to_records(series):
+    dates = series.to_columnar()['dates']
+    return [
+        {'date': date, 'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume}
+        for date, open_, high, low, close, volume in zip(
+            dates, series.open.tolist(), series.high.tolist(), series.low.tolist(), series.close.tolist(),
+            series.volume.astype(np.int64).tolist()
+        )
+    ]
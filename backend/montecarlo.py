@@ -0,0 +1,220 @@
+import numpy as np
+import pandas as pd
+
+from backtest_engine import RISK_FREE_RATE
+from parallel_search import evaluate_param_grid
+
+# 模擬方法：bootstrap為每日策略收益的區塊自助抽樣，trades為平倉損益的重複抽樣
+METHODS = ('bootstrap', 'trades')
+
+# 平倉的交易類型：賣出（平多頭部位）與撮合模型中的回補（平空頭部位）
+CLOSING_TRADE_TYPES = ('賣出', '回補')
+
+DEFAULT_PATHS = 1000
+MAX_PATHS = 100000
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+DEFAULT_BINS = 50
+
+# 每個模擬任務最多容納的矩陣元素數（路徑數 × K線數），用於限制每個進程的記憶體用量
+MAX_BLOCK_CELLS = 1000000
+
+# 權益分位數帶的取樣點數
+EQUITY_BAND_POINTS = 100
+
+# 各方法輸出的績效指標（平倉損益抽樣沒有逐日收益，不計算夏普比率）
+METHOD_METRICS = {
+    'bootstrap': ('total_return', 'annualized_return', 'sharpe_ratio', 'max_drawdown'),
+    'trades': ('total_return', 'annualized_return', 'max_drawdown'),
+}
+
+
+class MonteCarloError(ValueError):
+    pass
+
+
+# 由回測的權益曲線取得每日策略收益（與回測相同，第一根K線為0）及平倉損益
+# 權益開頭的NaN（尚無收益的K線）以初始資金填補
+def backtest_samples(backtest_result, initial_capital):
+    equity = pd.Series(np.asarray(backtest_result['equity_curve']['values']['equity'], dtype=np.float64))
+    equity = equity.ffill().fillna(initial_capital).to_numpy()
+    previous = np.concatenate([[initial_capital], equity[:-1]])
+    returns = equity / previous - 1
+
+    trade_pnl = np.array(
+        [trade['pnl'] for trade in backtest_result['trades'] if trade['type'] in CLOSING_TRADE_TYPES],
+        dtype=np.float64
+    )
+    return returns, trade_pnl
+
+
+# 環狀區塊自助抽樣的收益矩陣（路徑 × K線）：每條路徑由隨機起點的連續區塊串接，保留收益的短期自相關
+def block_bootstrap(rng, returns, paths, block_size):
+    n = len(returns)
+    n_blocks = -(-n // block_size)
+    starts = rng.integers(0, n, (paths, n_blocks, 1))
+    idx = (starts + np.arange(block_size)) % n
+    return returns[idx.reshape(paths, -1)[:, :n]]
+
+
+# 每條路徑的最大回撤（權益矩陣的第一欄為初始資金）
+def max_drawdowns(equity):
+    peak = np.maximum.accumulate(equity, axis=1)
+    return ((equity - peak) / peak).min(axis=1)
+
+
+def annualize(total_returns, days):
+    if days <= 0:
+        return np.zeros_like(total_returns)
+    # 虧損超過初始資金的路徑年化收益率記為-100%
+    growth = np.maximum(1 + total_returns, 0)
+    return growth ** (365 / days) - 1
+
+
+# 權益路徑在固定取樣點上的數值，用於計算分位數帶
+def _band_samples(equity):
+    points = np.unique(np.linspace(0, equity.shape[1] - 1, EQUITY_BAND_POINTS).round().astype(np.int64))
+    return equity[:, points]
+
+
+def _simulate_bootstrap(rng, inputs, paths, initial_capital):
+    returns = block_bootstrap(rng, inputs['returns'], paths, inputs['block_size'])
+    equity = np.empty((paths, returns.shape[1] + 1))
+    equity[:, 0] = initial_capital
+    np.cumprod(1 + returns, axis=1, out=equity[:, 1:])
+    equity[:, 1:] *= initial_capital
+
+    total_returns = equity[:, -1] / initial_capital - 1
+    annualized_returns = annualize(total_returns, inputs['days'])
+    std = returns.std(axis=1, ddof=1) if returns.shape[1] > 1 else np.zeros(paths)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe_ratios = np.where(std > 0, (annualized_returns - RISK_FREE_RATE) / (std * 252 ** 0.5), 0)
+    return {
+        'total_return': total_returns,
+        'annualized_return': annualized_returns,
+        'sharpe_ratio': sharpe_ratios,
+        'max_drawdown': max_drawdowns(equity),
+        'bands': _band_samples(equity),
+    }
+
+
+def _simulate_trades(rng, inputs, paths, initial_capital):
+    trade_pnl = inputs['trade_pnl']
+    equity = np.empty((paths, len(trade_pnl) + 1))
+    equity[:, 0] = initial_capital
+    np.cumsum(trade_pnl[rng.integers(0, len(trade_pnl), (paths, len(trade_pnl)))], axis=1, out=equity[:, 1:])
+    equity[:, 1:] += initial_capital
+
+    total_returns = equity[:, -1] / initial_capital - 1
+    return {
+        'total_return': total_returns,
+        'annualized_return': annualize(total_returns, inputs['days']),
+        'max_drawdown': max_drawdowns(equity),
+        'bands': _band_samples(equity),
+    }
+
+
+SIMULATORS = {
+    'bootstrap': _simulate_bootstrap,
+    'trades': _simulate_trades,
+}
+
+
+# 執行一組模擬任務（可在工作進程中執行）：每個任務為 (隨機種子, 路徑數)，返回每個任務的指標陣列
+def simulate_tasks(inputs, method, tasks, initial_capital):
+    simulate = SIMULATORS[method]
+    return [simulate(np.random.default_rng(seed), inputs, paths, initial_capital) for seed, paths in tasks]
+
+
+# 將路徑數切成記憶體受限的任務；每個任務的種子由seed_sequence衍生，結果與工作進程數無關
+def split_tasks(paths, length, seed_sequence):
+    task_paths = max(1, MAX_BLOCK_CELLS // max(1, length))
+    sizes = [min(task_paths, paths - start) for start in range(0, paths, task_paths)]
+    return list(zip(seed_sequence.spawn(len(sizes)), sizes))
+
+
+# 分佈摘要：平均、標準差、分位數、直方圖，以及實際回測值在模擬分佈中的百分位
+def summarize(values, percentiles, bins, observed=None):
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return None
+    counts, edges = np.histogram(values, bins=bins)
+    summary = {
+        'mean': float(values.mean()),
+        'std': float(values.std()),
+        'percentiles': {f'p{p:g}': float(v) for p, v in zip(percentiles, np.percentile(values, percentiles))},
+        'histogram': {'bin_edges': edges.tolist(), 'counts': counts.tolist()},
+    }
+    if observed is not None and np.isfinite(observed):
+        summary['observed'] = float(observed)
+        summary['observed_percentile'] = float((values <= observed).mean() * 100)
+    return summary
+
+
+# 蒙地卡羅穩健性分析：以區塊自助抽樣的每日收益與重複抽樣的平倉損益產生大量權益路徑，
+# 在（路徑 × 時間）矩陣上批量計算各路徑的報酬、夏普比率與最大回撤，任務分配到進程池執行
+def run_montecarlo(dates, returns, trade_pnl, initial_capital, observed_metrics, methods=METHODS,
+                   paths=DEFAULT_PATHS, block_size=None, seed=None, percentiles=DEFAULT_PERCENTILES,
+                   bins=DEFAULT_BINS, workers=None):
+    # 單一方法可直接以字串指定
+    if isinstance(methods, str):
+        methods = [methods]
+    unknown = [method for method in methods if method not in METHODS]
+    if unknown:
+        raise MonteCarloError(f'不支援的模擬方法: {", ".join(unknown)}')
+    if not 1 <= paths <= MAX_PATHS:
+        raise MonteCarloError(f'模擬路徑數必須介於1與{MAX_PATHS}之間')
+    if any(not 0 <= p <= 100 for p in percentiles):
+        raise MonteCarloError('百分位數必須介於0與100之間')
+    if len(returns) < 2:
+        raise MonteCarloError('價格數據不足以進行模擬')
+
+    returns = np.nan_to_num(np.asarray(returns, dtype=np.float64)[1:], nan=0.0)
+    block_size = int(block_size) if block_size else max(1, round(len(returns) ** (1 / 3)))
+    if block_size < 1:
+        raise MonteCarloError('block_size必須大於0')
+    inputs = {
+        'returns': returns,
+        'trade_pnl': np.asarray(trade_pnl, dtype=np.float64),
+        'days': (dates[-1] - dates[0]).days,
+        'block_size': block_size,
+    }
+
+    # 每個方法使用由主種子衍生的獨立種子
+    method_seeds = dict(zip(METHODS, np.random.SeedSequence(seed).spawn(len(METHODS))))
+    results = {}
+    for method in methods:
+        length = len(returns) if method == 'bootstrap' else len(inputs['trade_pnl'])
+        if method == 'trades' and length == 0:
+            results[method] = {'paths': 0, 'error': '回測期間沒有平倉交易'}
+            continue
+
+        chunks = evaluate_param_grid(
+            simulate_tasks, inputs, method, split_tasks(paths, length, method_seeds[method]), initial_capital, workers
+        )
+        metrics = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in METHOD_METRICS[method]}
+        bands = np.vstack([chunk['bands'] for chunk in chunks])
+
+        if method == 'bootstrap':
+            points = np.unique(np.linspace(0, length, EQUITY_BAND_POINTS).round().astype(np.int64))
+            band_axis = {'dates': dates[points].strftime('%Y-%m-%d').tolist()}
+        else:
+            band_axis = {'trades': np.unique(np.linspace(0, length, EQUITY_BAND_POINTS).round().astype(np.int64)).tolist()}
+
+        result = {
+            'paths': paths,
+            'metrics': {
+                name: summarize(values, percentiles, bins, observed_metrics.get(name))
+                for name, values in metrics.items()
+            },
+            'probability_of_loss': float((metrics['total_return'] < 0).mean()),
+            'equity_bands': {
+                **band_axis,
+                **{f'p{p:g}': values.tolist() for p, values in zip(percentiles, np.percentile(bands, percentiles, axis=0))},
+            },
+        }
+        if method == 'bootstrap':
+            result['block_size'] = block_size
+        else:
+            result['trades'] = len(inputs['trade_pnl'])
+        results[method] = result
+    return results
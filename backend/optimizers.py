@@ -0,0 +1,274 @@
+import itertools
+import math
+
+import numpy as np
+
+# 抽樣搜索的預設評估次數上限
+DEFAULT_MAX_EVALUATIONS = 200
+
+# 連續多少次評估沒有改善目標指標即提前停止
+DEFAULT_PATIENCE = 100
+
+# 參數空間不超過此大小時列舉所有有效組合再抽樣，超過時改用拒絕抽樣
+ENUMERATE_LIMIT = 100000
+
+
+# 展開參數範圍：可為候選值列表，或 {'min': ..., 'max': ..., 'step': ...} 字典（例如 short 2–60）
+def expand_param_range(param_range):
+    if not isinstance(param_range, dict):
+        return list(param_range)
+
+    start = param_range['min']
+    stop = param_range['max']
+    step = param_range.get('step', 1)
+    if step <= 0:
+        raise ValueError('參數範圍的step必須大於0')
+
+    count = int(math.floor((stop - start) / step + 1e-9)) + 1
+    if all(isinstance(value, int) for value in (start, stop, step)):
+        return [start + i * step for i in range(count)]
+    return [round(start + i * step, 10) for i in range(count)]
+
+
+# 離散參數空間：每個參數對應一個候選值列表，組合以各參數的索引元組表示
+class ParamSpace:
+    def __init__(self, names, values, is_valid=None):
+        self.names = list(names)
+        self.values = [list(candidates) for candidates in values]
+        self.sizes = np.array([len(candidates) for candidates in self.values], dtype=np.int64)
+        self.size = int(np.prod(self.sizes)) if self.names else 0
+        self.is_valid = is_valid or (lambda params: True)
+        self._valid_keys = None
+
+    def params(self, key):
+        return {name: candidates[i] for name, candidates, i in zip(self.names, self.values, key)}
+
+    def valid(self, key):
+        return self.is_valid(self.params(key))
+
+    # 依參數順序列舉所有有效組合（與巢狀迴圈的網格順序相同）
+    def valid_keys(self):
+        if self._valid_keys is None:
+            keys = itertools.product(*(range(size) for size in self.sizes)) if self.size else ()
+            self._valid_keys = [key for key in keys if self.valid(key)]
+        return self._valid_keys
+
+    # 隨機抽取最多count個未評估過的有效組合；返回空列表表示參數空間已搜索完畢
+    def sample(self, rng, count, seen):
+        if count <= 0 or not self.size:
+            return []
+
+        if self.size <= ENUMERATE_LIMIT:
+            remaining = [key for key in self.valid_keys() if key not in seen]
+            if len(remaining) <= count:
+                return [remaining[i] for i in rng.permutation(len(remaining))]
+            return [remaining[i] for i in rng.choice(len(remaining), count, replace=False)]
+
+        keys = []
+        picked = set()
+        for _ in range(count * 100):
+            key = tuple(rng.integers(0, self.sizes).tolist())
+            if key not in seen and key not in picked and self.valid(key):
+                keys.append(key)
+                picked.add(key)
+                if len(keys) == count:
+                    break
+        return keys
+
+
+# 目標函數：記憶已評估的組合、控制評估預算，並追蹤目標指標是否停滯
+# evaluate(params_list, total) 返回各組合的目標指標值；maximize為False時指標越小越好
+class Objective:
+    def __init__(self, space, evaluate, maximize, max_evaluations, patience, min_delta):
+        self.space = space
+        self.evaluate = evaluate
+        self.sign = 1.0 if maximize else -1.0
+        self.max_evaluations = max_evaluations
+        self.patience = patience
+        self.min_delta = min_delta
+        self.scores = {}
+        self.best_score = -math.inf
+        self.stale = 0
+
+    @property
+    def remaining(self):
+        return self.max_evaluations - len(self.scores)
+
+    @property
+    def plateaued(self):
+        return self.stale >= self.patience
+
+    @property
+    def finished(self):
+        return self.remaining <= 0 or self.plateaued
+
+    # 評估一批組合，已評估過的直接使用記憶結果；超出預算的組合不評估，其分數為None
+    def __call__(self, keys):
+        new_keys = list(dict.fromkeys(key for key in keys if key not in self.scores))[:max(0, self.remaining)]
+        if new_keys:
+            values = self.evaluate([self.space.params(key) for key in new_keys], self.max_evaluations)
+            improved = False
+            for key, value in zip(new_keys, values):
+                score = self.sign * float(value)
+                if score != score:
+                    score = -math.inf
+                self.scores[key] = score
+                if score > self.best_score + self.min_delta or (self.best_score == -math.inf and score > self.best_score):
+                    self.best_score = score
+                    improved = True
+            self.stale = 0 if improved else self.stale + len(new_keys)
+        return [self.scores.get(key) for key in keys]
+
+
+# 隨機搜索：每批抽取未評估過的組合
+def random_search(space, objective, rng, options):
+    batch_size = int(options.get('batch_size', 32))
+    while not objective.finished:
+        keys = space.sample(rng, min(batch_size, objective.remaining), objective.scores)
+        if not keys:
+            break
+        objective(keys)
+
+
+# 以高斯核估計單一參數索引上的機率分佈，並混合均勻先驗，避免未探索區域的機率為0
+def _parzen_density(observed, size):
+    density = np.full(size, 1.0 / size)
+    if len(observed):
+        positions = np.arange(size)
+        bandwidth = max(1.0, 1.06 * observed.std() * len(observed) ** -0.2)
+        kernels = np.exp(-0.5 * ((positions[None, :] - observed[:, None]) / bandwidth) ** 2)
+        kernels /= kernels.sum(axis=1, keepdims=True)
+        density = (density + kernels.sum(axis=0)) / (1 + len(observed))
+    return density
+
+
+# TPE（Tree-structured Parzen Estimator）：依目標指標將已評估組合分為好/壞兩群，
+# 從好群的分佈抽取候選組合，挑選 l(x)/g(x) 最大者評估
+def tpe_search(space, objective, rng, options):
+    startup = int(options.get('startup_evaluations', 20))
+    batch_size = int(options.get('batch_size', 8))
+    candidates_per_batch = int(options.get('candidates', 64))
+    gamma = float(options.get('gamma', 0.25))
+
+    objective(space.sample(rng, min(startup, objective.remaining), objective.scores))
+
+    while not objective.finished:
+        keys = np.array(list(objective.scores), dtype=np.int64).reshape(-1, len(space.names))
+        order = np.argsort(-np.array(list(objective.scores.values())), kind='stable')
+        n_good = max(1, int(math.ceil(gamma * len(order))))
+        good = keys[order[:n_good]]
+        bad = keys[order[n_good:]]
+
+        candidates = np.empty((candidates_per_batch, len(space.names)), dtype=np.int64)
+        log_ratio = np.zeros(candidates_per_batch)
+        for d, size in enumerate(space.sizes.tolist()):
+            good_density = _parzen_density(good[:, d], size)
+            bad_density = _parzen_density(bad[:, d], size)
+            candidates[:, d] = rng.choice(size, candidates_per_batch, p=good_density)
+            log_ratio += np.log(good_density[candidates[:, d]]) - np.log(bad_density[candidates[:, d]])
+
+        batch = min(batch_size, objective.remaining)
+        picks = []
+        for i in np.argsort(-log_ratio, kind='stable'):
+            key = tuple(candidates[i].tolist())
+            if key not in objective.scores and key not in picks and space.valid(key):
+                picks.append(key)
+                if len(picks) == batch:
+                    break
+
+        # 候選組合都已評估過時以隨機組合補足
+        if len(picks) < batch:
+            picks += space.sample(rng, batch - len(picks), set(objective.scores) | set(picks))
+        if not picks:
+            break
+        objective(picks)
+
+
+# 遺傳算法：錦標賽選擇、均勻交配、以索引高斯擾動突變，並保留菁英個體
+def genetic_search(space, objective, rng, options):
+    population_size = int(options.get('population_size', 24))
+    elite_count = int(options.get('elite_count', 2))
+    tournament_size = int(options.get('tournament_size', 3))
+    crossover_rate = float(options.get('crossover_rate', 0.9))
+    mutation_rate = float(options.get('mutation_rate', max(0.2, 1.0 / max(1, len(space.names)))))
+    mutation_scale = np.maximum(1.0, space.sizes * 0.1)
+
+    population = space.sample(rng, min(population_size, objective.remaining), objective.scores)
+    objective(population)
+
+    while population and not objective.finished:
+        scores = np.array([objective.scores[key] for key in population])
+
+        def select():
+            contenders = rng.integers(0, len(population), tournament_size)
+            return population[contenders[np.argmax(scores[contenders])]]
+
+        ranked = [population[i] for i in np.argsort(-scores, kind='stable')]
+        next_population = ranked[:elite_count]
+        pending = set(next_population)
+        children = []
+
+        for _ in range(population_size * 20):
+            if len(next_population) + len(children) >= population_size:
+                break
+            child = np.array(select())
+            if rng.random() < crossover_rate:
+                other = np.array(select())
+                child = np.where(rng.random(len(child)) < 0.5, child, other)
+            mutate = rng.random(len(child)) < mutation_rate
+            child = np.where(mutate, child + np.rint(rng.normal(0, mutation_scale)).astype(np.int64), child)
+            key = tuple(np.clip(child, 0, space.sizes - 1).tolist())
+            if key in objective.scores or key in pending or not space.valid(key):
+                continue
+            children.append(key)
+            pending.add(key)
+
+        # 族群收斂、無法產生新個體時引入隨機個體維持多樣性
+        shortfall = population_size - len(next_population) - len(children)
+        if shortfall > 0:
+            children += space.sample(rng, shortfall, set(objective.scores) | pending)
+        if not children:
+            break
+
+        objective(children)
+        population = next_population + [key for key in children if key in objective.scores]
+
+
+SEARCH_METHODS = {
+    'random': random_search,
+    'monte_carlo': random_search,
+    'tpe': tpe_search,
+    'bayesian': tpe_search,
+    'genetic': genetic_search,
+}
+
+
+# 執行抽樣搜索，返回搜索摘要（評估次數、參數空間大小與停止原因）
+# options可指定 max_evaluations（或 iterations）、patience、min_delta、seed 及各演算法的參數
+def run_search(method, space, evaluate, maximize, options=None):
+    options = options or {}
+    max_evaluations = int(options.get('max_evaluations', options.get('iterations', DEFAULT_MAX_EVALUATIONS)))
+    objective = Objective(
+        space, evaluate, maximize,
+        max_evaluations=min(max_evaluations, space.size),
+        patience=int(options.get('patience', DEFAULT_PATIENCE)),
+        min_delta=float(options.get('min_delta', 0.0)),
+    )
+    rng = np.random.default_rng(options.get('seed', 0))
+
+    SEARCH_METHODS[method](space, objective, rng, options)
+
+    if objective.plateaued and objective.remaining > 0:
+        stopped_reason = 'plateau'
+    elif objective.remaining <= 0 and objective.max_evaluations == max_evaluations:
+        stopped_reason = 'budget'
+    else:
+        stopped_reason = 'exhausted'
+
+    return {
+        'method': method,
+        'evaluations': len(objective.scores),
+        'max_evaluations': max_evaluations,
+        'search_space_size': space.size,
+        'stopped_reason': stopped_reason,
+    }
@@ -0,0 +1,124 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# 預設的優化工作進程數，可透過環境變數 OPTIMIZE_WORKERS 設定（1表示單核心執行）
+DEFAULT_WORKERS = int(os.environ.get('OPTIMIZE_WORKERS', '1'))
+
+# 每個工作進程平均分到的任務塊數，越多負載越平均，但進程間通訊也越多
+CHUNKS_PER_WORKER = 4
+
+# 工作進程內的共享狀態：價格數據只在進程啟動時傳入一次
+_worker_state = {}
+
+
+class ParallelSearchError(ValueError):
+    pass
+
+
+# 解析工作進程數：0或'auto'表示使用全部CPU核心，其餘數值不超過CPU核心數
+def resolve_workers(workers):
+    if workers is None:
+        workers = DEFAULT_WORKERS
+    cpu_count = os.cpu_count() or 1
+    if workers == 'auto':
+        return cpu_count
+    if isinstance(workers, bool) or isinstance(workers, float) and not workers.is_integer():
+        raise ParallelSearchError('workers必須為整數或auto')
+    try:
+        workers = int(workers)
+    except (TypeError, ValueError):
+        raise ParallelSearchError('workers必須為整數或auto')
+    if workers <= 0:
+        return cpu_count
+    return min(workers, cpu_count)
+
+
+# forkserver預先載入的模組：主程式（server.py或app.py）與定義評估函數的後端模組，工作進程不需重新匯入
+FORKSERVER_PRELOAD = ['__main__', 'app']
+
+
+# 工作進程池在背景任務執行緒與多執行緒伺服器中建立，直接fork多執行緒的進程可能讓子進程卡在fork時被其他執行緒持有的鎖
+# （logging、sqlite3、指標快取），因此使用forkserver（由單執行緒的伺服器進程fork），不支援時退回spawn；
+# 兩者都以initargs把價格數據序列化傳給每個工作進程一次
+def _get_mp_context():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(FORKSERVER_PRELOAD)
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def _init_worker(evaluate_chunk, df, strategy_type, initial_capital):
+    _worker_state['evaluate_chunk'] = evaluate_chunk
+    _worker_state['df'] = df
+    _worker_state['strategy_type'] = strategy_type
+    _worker_state['initial_capital'] = initial_capital
+
+
+def _run_chunk(param_chunk):
+    return _worker_state['evaluate_chunk'](
+        _worker_state['df'], _worker_state['strategy_type'], param_chunk, _worker_state['initial_capital']
+    )
+
+
+# 將參數網格切成連續的任務塊，保留原本的順序
+def split_chunks(param_grid, n_chunks):
+    n_chunks = max(1, min(n_chunks, len(param_grid)))
+    size, extra = divmod(len(param_grid), n_chunks)
+    chunks = []
+    start = 0
+    for i in range(n_chunks):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(param_grid[start:end])
+        start = end
+    return chunks
+
+
+# 工作進程池：價格數據在進程啟動時傳入一次，同一次優化中分批評估的參數組合（背景任務的進度分段、
+# 隨機搜索/TPE/遺傳算法的每一批）共用同一組進程；第一次需要多進程時才建立，以with區塊或close()結束
+class WorkerPool:
+    def __init__(self, evaluate_chunk, df, strategy_type, initial_capital, workers=None):
+        self.evaluate_chunk = evaluate_chunk
+        self.df = df
+        self.strategy_type = strategy_type
+        self.initial_capital = initial_capital
+        self.workers = resolve_workers(workers)
+        self._executor = None
+
+    # 評估一批參數組合，回傳與param_grid順序一致的績效指標列表
+    def evaluate(self, param_grid):
+        workers = min(self.workers, len(param_grid))
+        if workers <= 1:
+            return self.evaluate_chunk(self.df, self.strategy_type, param_grid, self.initial_capital)
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=_get_mp_context(),
+                initializer=_init_worker,
+                initargs=(self.evaluate_chunk, self.df, self.strategy_type, self.initial_capital),
+            )
+        chunks = split_chunks(param_grid, workers * CHUNKS_PER_WORKER)
+        # executor.map依提交順序返回結果，合併後與單核心執行的順序完全一致
+        chunk_results = self._executor.map(_run_chunk, chunks)
+        return [metrics for chunk in chunk_results for metrics in chunk]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# 評估整個參數網格，回傳與param_grid順序一致的績效指標列表
+# evaluate_chunk(df, strategy_type, param_chunk, initial_capital) 負責評估一個任務塊
+def evaluate_param_grid(evaluate_chunk, df, strategy_type, param_grid, initial_capital, workers=None):
+    workers = max(1, min(resolve_workers(workers), len(param_grid)))
+    with WorkerPool(evaluate_chunk, df, strategy_type, initial_capital, workers) as pool:
+        return pool.evaluate(param_grid)
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+from backtest_engine import compute_performance_metrics, signals_to_positions
+from batched_backtest import batch_performance_metrics, batch_strategy_returns
+from serialization import columnar
+from strategies import get_strategy
+
+# 每個計算區塊最多容納的矩陣元素數（K線數 × 股票數），用於限制記憶體用量
+MAX_BLOCK_CELLS = 1000000
+
+
+# 資金配置：未指定權重時平均分配；權重總和超過1時按比例縮放，不足1的部分保留為現金
+def allocate_weights(symbols, weights=None):
+    if not weights:
+        return np.full(len(symbols), 1 / len(symbols))
+    result = np.array([float(weights.get(symbol, 0)) for symbol in symbols])
+    if (result < 0).any():
+        raise ValueError('資金配置權重不可為負數')
+    total = result.sum()
+    return result / total if total > 1 else result
+
+
+# 一個股票區塊對齊到共同日期軸的價格（停牌缺值以前一日價格填補）：{欄位: (時間 × 股票) DataFrame}，
+# 欄位在第一次使用時才建立（例如只用收盤價的策略不建立最高價與最低價矩陣）
+class _PriceBlock(dict):
+    def __init__(self, dates, frames):
+        super().__init__()
+        self.dates = dates
+        self.frames = frames
+
+    def __missing__(self, column):
+        values = np.full((len(self.dates), len(self.frames)), np.nan)
+        for j, frame in enumerate(self.frames):
+            if column in frame:
+                values[np.searchsorted(self.dates.values, frame.index.values), j] = frame[column].to_numpy(dtype=np.float64)
+        self[column] = pd.DataFrame(values, index=self.dates).ffill()
+        return self[column]
+
+
+# 區塊的信號矩陣（股票 × 時間）：支援橫截面輸入的策略一次計算整個區塊，其他策略逐檔計算
+def _block_signals(dates, frames, block, strategy, params):
+    if strategy.panel:
+        return strategy.panel_signals(block, params)
+    signal = np.zeros((len(frames), len(dates)), dtype=np.int8)
+    for j, frame in enumerate(frames):
+        signal[j] = strategy.signals(frame.reindex(dates).ffill(), [params])[0]
+    return signal
+
+
+# 每檔股票有數據的第一天到最後一天相隔的天數（用於年化收益率）
+def _active_days(dates, close_rows):
+    valid = ~np.isnan(close_rows)
+    has_data = valid.any(axis=1)
+    first = valid.argmax(axis=1)
+    last = close_rows.shape[1] - 1 - valid[:, ::-1].argmax(axis=1)
+    day_numbers = dates.values.astype('M8[D]').astype(np.int64)
+    return np.where(has_data, day_numbers[last] - day_numbers[first], 0)
+
+
+# 投資組合回測：以（股票 × 時間）矩陣一次計算信號、持倉與績效，按股票區塊處理以控制記憶體
+# frame_by_symbol(symbol) 返回以日期為索引的價格DataFrame（OHLCV）
+def run_portfolio_backtest(symbols, frame_by_symbol, strategy_type, params, initial_capital, weights=None):
+    strategy = get_strategy(strategy_type)
+    if not symbols:
+        raise ValueError('請提供至少一檔股票')
+
+    # 每檔股票的價格只讀取一次（本地價格資料庫為記憶體映射，不複製數據），所有股票日期的聯集作為共同日期軸
+    frames = [frame_by_symbol(symbol) for symbol in symbols]
+    dates = frames[0].index
+    if not dates.is_monotonic_increasing or not all(frame.index.equals(dates) for frame in frames[1:]):
+        dates = np.unique(np.concatenate([frame.index.values for frame in frames]))
+    dates = pd.DatetimeIndex(dates, name='date')
+
+    sleeve_weights = allocate_weights(symbols, weights)
+    sleeve_capital = initial_capital * sleeve_weights
+
+    # 各股票子帳戶獨立運作（不再平衡），投資組合權益為各子帳戶權益加上未配置的現金
+    portfolio_equity = np.full(len(dates), initial_capital - sleeve_capital.sum())
+    symbol_results = []
+    total_trades = 0
+    winning_trades = 0
+
+    block_size = max(1, MAX_BLOCK_CELLS // max(1, len(dates)))
+    for start in range(0, len(symbols), block_size):
+        block = symbols[start:start + block_size]
+        capital = sleeve_capital[start:start + block_size]
+        block_frames = frames[start:start + block_size]
+        prices = _PriceBlock(dates, block_frames)
+        close_rows = np.ascontiguousarray(prices['close'].to_numpy().T)
+        signal = _block_signals(dates, block_frames, prices, strategy, params)
+
+        returns = np.empty_like(close_rows)
+        returns[:, 0] = np.nan
+        returns[:, 1:] = close_rows[:, 1:] / close_rows[:, :-1] - 1
+
+        position = signals_to_positions(signal)
+        strategy_returns, cumulative_strategy_returns = batch_strategy_returns(returns, position)
+        metrics_list = batch_performance_metrics(
+            _active_days(dates, close_rows), close_rows, strategy_returns,
+            cumulative_strategy_returns, position, capital
+        )
+
+        portfolio_equity += capital @ np.where(np.isnan(cumulative_strategy_returns), 1.0, cumulative_strategy_returns)
+
+        for symbol, weight, metrics in zip(block, sleeve_weights[start:start + block_size].tolist(), metrics_list):
+            total_trades += metrics['total_trades']
+            winning_trades += round(metrics['win_rate'] * metrics['total_trades'])
+            symbol_results.append({'symbol': symbol, 'weight': weight, 'performance_metrics': metrics})
+
+    # 投資組合績效：由合併後的權益曲線計算，交易統計為所有股票的總和
+    portfolio_returns = np.empty_like(portfolio_equity)
+    portfolio_returns[0] = np.nan
+    portfolio_returns[1:] = portfolio_equity[1:] / portfolio_equity[:-1] - 1
+    portfolio_metrics = compute_performance_metrics(
+        dates, portfolio_returns, portfolio_equity / initial_capital, portfolio_equity, np.empty(0, dtype=np.int64)
+    )
+    portfolio_metrics['total_trades'] = total_trades
+    portfolio_metrics['win_rate'] = winning_trades / total_trades if total_trades > 0 else 0
+
+    return {
+        'portfolio': {
+            'performance_metrics': portfolio_metrics,
+            'equity_curve': columnar(dates, {'equity': portfolio_equity}),
+        },
+        'symbols': symbol_results,
+    }
@@ -0,0 +1,195 @@
+import io
+import warnings
+
+import numpy as np
+import pandas as pd
+
+PRICE_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+# 日期以int64儲存：日線為epoch起算的天數，含時間的K線為epoch起算的秒數
+DATE_UNITS = ('D', 's')
+
+
+class PriceSeriesError(ValueError):
+    pass
+
+
+# 以連續NumPy陣列保存的價格序列：日期為int64，OHLCV為float64（未提供的欄位為None，close為必要欄位）
+# 切片返回共用記憶體的視圖，需要時再以 to_frame() 轉為pandas DataFrame（不複製價格陣列）
+class PriceSeries:
+    def __init__(self, dates, open=None, high=None, low=None, close=None, volume=None, unit='D'):
+        if unit not in DATE_UNITS:
+            raise PriceSeriesError(f'不支援的日期單位: {unit}')
+        if close is None:
+            raise PriceSeriesError('價格數據缺少 close 欄位')
+
+        self.unit = unit
+        self.dates = np.ascontiguousarray(dates, dtype=np.int64)
+        n = len(self.dates)
+        columns = {'open': open, 'high': high, 'low': low, 'close': close, 'volume': volume}
+        for name, values in columns.items():
+            setattr(self, name, None if values is None else np.ascontiguousarray(values, dtype=np.float64))
+        self.validate()
+
+    # 實際提供的價格欄位
+    @property
+    def columns(self):
+        return [name for name in PRICE_FIELDS if getattr(self, name) is not None]
+
+    # 檢查欄位長度一致、為一維陣列、日期嚴格遞增且價格不含無限大
+    def validate(self):
+        if self.dates.ndim != 1:
+            raise PriceSeriesError('日期必須為一維陣列')
+        n = len(self.dates)
+        for name in self.columns:
+            values = getattr(self, name)
+            if values.ndim != 1 or len(values) != n:
+                raise PriceSeriesError(f'{name} 欄位的長度與日期不一致')
+            if np.isinf(values).any():
+                raise PriceSeriesError(f'{name} 欄位含有無限大的數值')
+        if n > 1 and (np.diff(self.dates) <= 0).any():
+            raise PriceSeriesError('日期必須嚴格遞增且不可重複')
+
+    def __len__(self):
+        return len(self.dates)
+
+    # 以K線索引切片，返回共用記憶體的視圖
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError('PriceSeries只支援連續切片')
+        return self._view(key)
+
+    def _view(self, key):
+        view = object.__new__(PriceSeries)
+        view.unit = self.unit
+        view.dates = self.dates[key]
+        for name in PRICE_FIELDS:
+            values = getattr(self, name)
+            setattr(view, name, None if values is None else values[key])
+        return view
+
+    # 以日期區間切片（包含起訖日期），返回視圖
+    def between(self, start=None, end=None):
+        lo = np.searchsorted(self.dates, _to_int_dates([start], self.unit)[0], side='left') if start else 0
+        hi = np.searchsorted(self.dates, _to_int_dates([end], self.unit)[0], side='right') if end else len(self)
+        return self._view(slice(lo, hi))
+
+    def datetime_index(self):
+        return pd.DatetimeIndex(self.dates.astype(f'M8[{self.unit}]').astype('M8[ns]'), name='date')
+
+    # 轉為以日期為索引的DataFrame，各欄位直接使用既有陣列
+    def to_frame(self):
+        return pd.DataFrame(
+            {name: getattr(self, name) for name in self.columns}, index=self.datetime_index(), copy=False
+        )
+
+    # 欄式JSON：{'dates': [...], 'open': [...], ...}
+    def to_columnar(self):
+        dates = np.datetime_as_string(self.dates.astype(f'M8[{self.unit}]'), unit=self.unit).tolist()
+        return {'dates': dates, **{name: getattr(self, name) for name in self.columns}}
+
+    @classmethod
+    def from_frame(cls, df):
+        if 'date' in df.columns:
+            df = df.set_index('date')
+        index = pd.DatetimeIndex(pd.to_datetime(df.index))
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        unit = _infer_unit(index.values)
+        return cls(
+            index.values.astype(f'M8[{unit}]').astype(np.int64),
+            unit=unit,
+            **{name: df[name].to_numpy(dtype=np.float64) for name in PRICE_FIELDS if name in df}
+        )
+
+    # 舊版的逐列格式：[{'date': ..., 'open': ..., ...}, ...]，逐欄取值後與欄式格式相同處理
+    @classmethod
+    def from_records(cls, records):
+        if not records:
+            return cls([], close=[])
+        first = records[0]
+        if 'date' not in first:
+            raise PriceSeriesError('價格數據缺少 date 欄位')
+        try:
+            payload = {name: [record[name] for record in records] for name in ('date',) + PRICE_FIELDS if name in first}
+        except (KeyError, TypeError):
+            raise PriceSeriesError('價格數據的每筆記錄必須包含相同的欄位')
+        return cls.from_columnar(payload)
+
+    # 欄式格式：{'dates': [...], 'close': [...], ...}，價格欄位也可放在 'values' 之下；
+    # 日期可為ISO字串，或配合 'date_unit' 的epoch整數
+    @classmethod
+    def from_columnar(cls, payload):
+        dates = payload.get('dates', payload.get('date'))
+        if dates is None:
+            raise PriceSeriesError('價格數據缺少 dates 欄位')
+        columns = payload.get('values', payload)
+
+        unit = payload.get('date_unit')
+        if unit is None:
+            values = _parse_dates(dates)
+            unit = _infer_unit(values)
+            int_dates = values.astype(f'M8[{unit}]').astype(np.int64)
+        else:
+            int_dates = np.asarray(dates, dtype=np.int64)
+
+        try:
+            prices = {name: np.asarray(columns[name], dtype=np.float64) for name in PRICE_FIELDS if columns.get(name) is not None}
+        except (TypeError, ValueError):
+            raise PriceSeriesError('價格欄位必須為數值')
+        return cls(int_dates, unit=unit, **prices)
+
+    # 二進位格式：NumPy .npy 結構化陣列，欄位為 date（datetime64）與 open/high/low/close/volume
+    @classmethod
+    def from_npy(cls, data):
+        try:
+            records = np.load(io.BytesIO(data), allow_pickle=False)
+        except ValueError as e:
+            raise PriceSeriesError(f'無法讀取二進位價格數據: {e}')
+        if records.dtype.names is None or 'date' not in records.dtype.names:
+            raise PriceSeriesError('二進位價格數據必須是含 date 欄位的結構化陣列')
+
+        dates = records['date']
+        if dates.dtype.kind == 'M':
+            unit = _infer_unit(dates)
+            dates = dates.astype(f'M8[{unit}]').astype(np.int64)
+        else:
+            unit = 'D'
+        return cls(dates, unit=unit, **{name: records[name] for name in PRICE_FIELDS if name in records.dtype.names})
+
+
+# 解析日期：ISO字串以NumPy向量化解析，其他格式交給pandas
+def _parse_dates(dates):
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            return np.asarray(dates, dtype='M8[s]')
+    except (ValueError, TypeError, DeprecationWarning, UserWarning):
+        try:
+            index = pd.DatetimeIndex(pd.to_datetime(dates))
+        except (ValueError, TypeError) as e:
+            raise PriceSeriesError(f'無法解析日期: {e}')
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        return index.values
+
+
+# 所有日期都落在午夜時以天為單位，否則以秒為單位
+def _infer_unit(datetimes):
+    seconds = np.asarray(datetimes).astype('M8[s]').astype(np.int64)
+    return 'D' if (seconds % 86400 == 0).all() else 's'
+
+
+# 將請求中的價格數據轉為PriceSeries：已是PriceSeries、欄式字典或舊版的逐列列表
+def to_price_series(payload):
+    if isinstance(payload, PriceSeries):
+        return payload
+    if isinstance(payload, dict):
+        return PriceSeries.from_columnar(payload)
+    if isinstance(payload, list):
+        return PriceSeries.from_records(payload)
+    raise PriceSeriesError('無法識別的價格數據格式')
+
+
+def _to_int_dates(values, unit):
+    return np.asarray(pd.to_datetime(values).values.astype(f'M8[{unit}]').astype(np.int64))
@@ -0,0 +1,202 @@
+import argparse
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # 非POSIX系統沒有fcntl，只以進程內的鎖保護寫入
+    fcntl = None
+
+# 本地價格資料庫的目錄，可透過環境變數 PRICE_STORE_DIR 設定
+DEFAULT_STORE_DIR = os.environ.get(
+    'PRICE_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'prices')
+)
+
+PRICE_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+# 每檔股票存成一個結構化NumPy檔案，每一列為一根K線，依日期排序
+PRICE_DTYPE = np.dtype([('date', 'M8[ns]')] + [(column, 'f8') for column in PRICE_COLUMNS])
+
+SYMBOL_PATTERN = re.compile(r'^[A-Za-z0-9._\-]+$')
+INTERVAL_PATTERN = re.compile(r'^[A-Za-z0-9]+$')
+
+# 日線為預設週期，檔名為 <股票代碼>.npy；其他週期的K線分開保存為 <股票代碼>@<週期>.npy，不與日線合併
+DEFAULT_INTERVAL = '1d'
+
+
+class PriceStoreError(Exception):
+    pass
+
+
+# 以記憶體映射檔案保存的本地OHLCV資料庫，每檔股票的每個K線週期各一個檔案
+class PriceStore:
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _path(self, symbol, interval=DEFAULT_INTERVAL):
+        if not isinstance(symbol, str) or not SYMBOL_PATTERN.match(symbol) or '@' in symbol:
+            raise PriceStoreError(f'無效的股票代碼: {symbol}')
+        if not isinstance(interval, str) or not INTERVAL_PATTERN.match(interval):
+            raise PriceStoreError(f'無效的K線週期: {interval}')
+        name = symbol if interval == DEFAULT_INTERVAL else f'{symbol}@{interval}'
+        return os.path.join(self.root, f'{name}.npy')
+
+    # 檢查股票代碼與K線週期可作為檔名，無效時拋出PriceStoreError
+    def validate(self, symbol, interval=DEFAULT_INTERVAL):
+        self._path(symbol, interval)
+
+    def has(self, symbol, interval=DEFAULT_INTERVAL):
+        return os.path.exists(self._path(symbol, interval))
+
+    # 已保存的 (股票代碼, K線週期)
+    def entries(self):
+        if not os.path.isdir(self.root):
+            return []
+        names = sorted(name[:-4] for name in os.listdir(self.root) if name.endswith('.npy'))
+        return [tuple(name.split('@', 1)) if '@' in name else (name, DEFAULT_INTERVAL) for name in names]
+
+    def symbols(self, interval=DEFAULT_INTERVAL):
+        return [symbol for symbol, entry_interval in self.entries() if entry_interval == interval]
+
+    # 讀取整個結構化陣列（唯讀記憶體映射，不複製數據）
+    def _records(self, symbol, interval=DEFAULT_INTERVAL):
+        path = self._path(symbol, interval)
+        if not os.path.exists(path):
+            suffix = '' if interval == DEFAULT_INTERVAL else f'（{interval}）'
+            raise PriceStoreError(f'本地資料庫中沒有 {symbol}{suffix} 的價格數據')
+        return np.load(path, mmap_mode='r')
+
+    # 讀取指定日期區間的價格數據，返回以日期為索引的DataFrame，欄位為記憶體映射的視圖
+    def load(self, symbol, start=None, end=None, interval=DEFAULT_INTERVAL):
+        records = self._records(symbol, interval)
+        dates = records['date']
+        lo = np.searchsorted(dates, np.datetime64(pd.Timestamp(start), 'ns'), side='left') if start else 0
+        hi = np.searchsorted(dates, np.datetime64(pd.Timestamp(end), 'ns'), side='right') if end else len(dates)
+        records = records[lo:hi]
+
+        df = pd.DataFrame({column: records[column] for column in PRICE_COLUMNS}, copy=False)
+        df.index = pd.DatetimeIndex(records['date'], name='date')
+        return df
+
+    # 已保存的日期範圍
+    def info(self, symbol, interval=DEFAULT_INTERVAL):
+        records = self._records(symbol, interval)
+        if len(records) == 0:
+            return {'symbol': symbol, 'interval': interval, 'bars': 0, 'start': None, 'end': None}
+        return {
+            'symbol': symbol,
+            'interval': interval,
+            'bars': len(records),
+            'start': pd.Timestamp(records['date'][0]).isoformat(),
+            'end': pd.Timestamp(records['date'][-1]).isoformat(),
+        }
+
+    # 讀取、合併再取代檔案期間持有的鎖：進程內的執行緒鎖，加上旁邊 .lock 檔案的flock（多進程伺服器的工作進程之間）
+    @contextmanager
+    def _write_lock(self, path):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.root, exist_ok=True)
+            with open(f'{path}.lock', 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # 寫入價格數據：與同一週期的既有數據依日期合併；overwrite為True（匯入CSV）時相同日期以新數據為準，
+    # 為False（模擬數據）時保留既有數據，只補上缺少的日期
+    def write(self, symbol, df, interval=DEFAULT_INTERVAL, overwrite=True):
+        path = self._path(symbol, interval)
+        new_records = frame_to_records(df)
+
+        with self._write_lock(path):
+            if os.path.exists(path):
+                old_records = np.load(path)
+                records = np.concatenate([new_records, old_records] if overwrite else [old_records, new_records])
+                # 依日期排序並去除重複日期（保留排在前面的數據）
+                _, keep = np.unique(records['date'], return_index=True)
+                records = records[keep]
+            else:
+                records = np.sort(new_records, order='date')
+
+            # 先寫入暫存檔再取代，讀取端不會看到寫到一半的檔案
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, records)
+            os.replace(tmp_path, path)
+        return len(records)
+
+    # 從CSV匯入價格數據（需有 date, open, high, low, close, volume 欄位）
+    def import_csv(self, symbol, source, interval=DEFAULT_INTERVAL):
+        df = pd.read_csv(source)
+        df.columns = [str(column).strip().lower() for column in df.columns]
+        missing = [column for column in ('date',) + PRICE_COLUMNS if column not in df.columns]
+        if missing:
+            raise PriceStoreError(f'CSV缺少欄位: {", ".join(missing)}')
+        df['date'] = pd.to_datetime(df['date'])
+        return self.write(symbol, df.set_index('date'), interval)
+
+
+# 將以日期為索引（或含date欄位）的DataFrame轉為結構化陣列
+def frame_to_records(df):
+    if 'date' in df.columns:
+        df = df.set_index('date')
+    index = pd.DatetimeIndex(pd.to_datetime(df.index))
+    if index.tz is not None:
+        index = index.tz_localize(None)
+
+    records = np.empty(len(df), dtype=PRICE_DTYPE)
+    records['date'] = index.values.astype('M8[ns]')
+    for column in PRICE_COLUMNS:
+        records[column] = df[column].to_numpy(dtype=np.float64) if column in df else np.nan
+    return records
+
+
+# 進程層級共用的價格資料庫
+price_store = PriceStore(DEFAULT_STORE_DIR)
+
+
+# 命令列批量匯入：python price_store.py import <CSV檔或目錄>，目錄中每個檔案名稱即股票代碼
+def main():
+    parser = argparse.ArgumentParser(description='本地價格資料庫工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help='從CSV匯入價格數據')
+    import_parser.add_argument('path', help='CSV檔案或包含 <股票代碼>.csv 的目錄')
+    import_parser.add_argument('--symbol', help='匯入單一檔案時指定股票代碼（預設為檔名）')
+    import_parser.add_argument('--interval', default=DEFAULT_INTERVAL, help='K線週期（預設為日線）')
+    import_parser.add_argument('--store', default=DEFAULT_STORE_DIR, help='資料庫目錄')
+
+    list_parser = subparsers.add_parser('list', help='列出已保存的股票')
+    list_parser.add_argument('--store', default=DEFAULT_STORE_DIR, help='資料庫目錄')
+
+    args = parser.parse_args()
+    store = PriceStore(args.store)
+
+    if args.command == 'import':
+        if os.path.isdir(args.path):
+            files = sorted(name for name in os.listdir(args.path) if name.lower().endswith('.csv'))
+            sources = [(os.path.splitext(name)[0], os.path.join(args.path, name)) for name in files]
+        else:
+            symbol = args.symbol or os.path.splitext(os.path.basename(args.path))[0]
+            sources = [(symbol, args.path)]
+        for symbol, path in sources:
+            bars = store.import_csv(symbol, path, args.interval)
+            print(f'{symbol}: {bars} bars')
+    elif args.command == 'list':
+        for symbol, interval in store.entries():
+            print(store.info(symbol, interval))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from jobs import request_hash
+
+# 回測結果資料庫（SQLite檔案），可透過環境變數 RESULT_STORE_PATH 設定
+DEFAULT_RESULT_STORE_PATH = os.environ.get(
+    'RESULT_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'results.sqlite3')
+)
+
+# 結果保留天數與完整回測結果（壓縮後）的總容量上限，超過時淘汰最久未讀取的結果
+DEFAULT_TTL_DAYS = float(os.environ.get('RESULT_TTL_DAYS', '30'))
+DEFAULT_MAX_MB = float(os.environ.get('RESULT_STORE_MAX_MB', '256'))
+
+# 參數優化快取的績效指標筆數上限
+DEFAULT_MAX_EVALUATIONS = int(os.environ.get('RESULT_STORE_MAX_EVALUATIONS', '2000000'))
+
+# 兩次淘汰檢查之間至少間隔的秒數
+EVICT_INTERVAL = 60
+
+# 一次查詢的參數數量（SQLite的變數數上限）
+QUERY_CHUNK_SIZE = 500
+
+DEFAULT_LIST_LIMIT = 50
+MAX_LIST_LIMIT = 500
+
+# 結果格式與計算方式的版本：回測引擎、撮合模型或績效指標的計算改變時遞增，舊版本的結果與績效指標不再被讀取
+RESULT_SCHEMA_VERSION = 1
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    symbol TEXT,
+    strategy_type TEXT,
+    params TEXT,
+    initial_capital REAL,
+    summary TEXT,
+    payload BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_accessed_at ON runs (accessed_at);
+CREATE INDEX IF NOT EXISTS runs_created_at ON runs (created_at);
+CREATE TABLE IF NOT EXISTS evaluations (
+    key TEXT PRIMARY KEY,
+    metrics TEXT NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS evaluations_accessed_at ON evaluations (accessed_at);
+'''
+
+
+class ResultStoreError(Exception):
+    pass
+
+
+def _chunks(values, size=QUERY_CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+# 完整結果的ID：請求內容與結果版本的雜湊
+def result_key(*parts):
+    return request_hash(RESULT_SCHEMA_VERSION, *parts)
+
+
+# 參數組合的快取鍵：同一價格數據、策略、初始資金與撮合設定的前綴只計算一次
+def evaluation_keys(fingerprint, strategy_type, initial_capital, execution_config, param_list):
+    prefix = result_key('evaluation', fingerprint, strategy_type, initial_capital, execution_config).encode()
+    return [
+        hashlib.sha256(prefix + json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+        for params in param_list
+    ]
+
+
+# 以SQLite保存的結果資料庫：
+# runs保存完整回測與優化結果（JSON以zlib壓縮，包含權益曲線），以內容雜湊為ID，可列出與讀取；
+# evaluations保存每組參數的績效指標，參數優化時已評估過的組合直接讀取
+# 每個執行緒使用各自的連線，多個進程可共用同一檔案（WAL模式）
+class ResultStore:
+    def __init__(self, path, ttl_days=DEFAULT_TTL_DAYS, max_bytes=DEFAULT_MAX_MB * 1024 * 1024,
+                 max_evaluations=DEFAULT_MAX_EVALUATIONS):
+        self.path = path
+        self.ttl = ttl_days * 86400
+        self.max_bytes = max_bytes
+        self.max_evaluations = max_evaluations
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._last_evict = 0.0
+        self._stats = {'hits': 0, 'misses': 0, 'evaluation_hits': 0, 'evaluation_misses': 0, 'evicted': 0}
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+        except (OSError, sqlite3.Error) as e:
+            raise ResultStoreError(f'無法開啟結果資料庫 {self.path}: {e}')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._stats[name] += value
+
+    # 讀取完整結果的壓縮前JSON位元組，並更新最後讀取時間；不存在或已過期（超過保存天數未讀取）時返回None
+    def get_payload(self, run_id):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            'SELECT payload FROM runs WHERE id = ? AND accessed_at >= ?', (run_id, now - self.ttl)
+        ).fetchone()
+        if row is None:
+            self._count('misses')
+            return None
+        with conn:
+            conn.execute('UPDATE runs SET accessed_at = ? WHERE id = ?', (now, run_id))
+        self._count('hits')
+        return zlib.decompress(row[0])
+
+    def get(self, run_id):
+        payload = self.get_payload(run_id)
+        return None if payload is None else json.loads(payload)
+
+    # 保存完整結果：payload為已序列化的JSON（str或bytes），summary為列表時顯示的績效指標
+    def put(self, run_id, kind, payload, symbol=None, strategy_type=None, params=None, initial_capital=None,
+            summary=None):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        compressed = zlib.compress(payload, 6)
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO runs (id, kind, symbol, strategy_type, params, initial_capital, summary, '
+                'payload, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    run_id, kind, symbol, strategy_type, json.dumps(params, sort_keys=True, default=str),
+                    initial_capital, json.dumps(summary, default=str), compressed, len(compressed), now, now,
+                ),
+            )
+        self.maybe_evict()
+
+    # 列出保存的結果（不含完整內容），依建立時間由新到舊
+    def list(self, kind=None, symbol=None, strategy_type=None, limit=DEFAULT_LIST_LIMIT, offset=0):
+        filters = [('accessed_at >= ?', time.time() - self.ttl)]
+        for column, value in (('kind', kind), ('symbol', symbol), ('strategy_type', strategy_type)):
+            if value:
+                filters.append((f'{column} = ?', value))
+        where = ' AND '.join(clause for clause, _ in filters)
+        values = [value for _, value in filters]
+        limit = min(max(1, int(limit)), MAX_LIST_LIMIT)
+
+        conn = self._connect()
+        total = conn.execute(f'SELECT COUNT(*) FROM runs WHERE {where}', values).fetchone()[0]
+        rows = conn.execute(
+            f'SELECT id, kind, symbol, strategy_type, params, initial_capital, summary, size, created_at, accessed_at '
+            f'FROM runs WHERE {where} ORDER BY created_at DESC LIMIT ? OFFSET ?',
+            values + [limit, max(0, int(offset))],
+        ).fetchall()
+        return total, [
+            {
+                'id': run_id,
+                'kind': run_kind,
+                'symbol': run_symbol,
+                'strategy_type': run_strategy_type,
+                'params': json.loads(params),
+                'initial_capital': initial_capital,
+                'summary': json.loads(summary),
+                'size': size,
+                'created_at': created_at,
+                'accessed_at': accessed_at,
+            }
+            for run_id, run_kind, run_symbol, run_strategy_type, params, initial_capital, summary, size, created_at,
+            accessed_at in rows
+        ]
+
+    def delete(self, run_id):
+        conn = self._connect()
+        with conn:
+            return conn.execute('DELETE FROM runs WHERE id = ?', (run_id,)).rowcount > 0
+
+    # 批量讀取參數組合的績效指標，返回 {鍵: 指標字典}（只含已保存的鍵）
+    def get_evaluations(self, keys):
+        conn = self._connect()
+        now = time.time()
+        found = {}
+        for chunk in _chunks(keys):
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(
+                f'SELECT key, metrics FROM evaluations WHERE key IN ({placeholders}) AND accessed_at >= ?',
+                list(chunk) + [now - self.ttl],
+            ).fetchall()
+            found.update((key, json.loads(metrics)) for key, metrics in rows)
+        if found:
+            with conn:
+                conn.executemany('UPDATE evaluations SET accessed_at = ? WHERE key = ?', [(now, key) for key in found])
+        self._count('evaluation_hits', len(found))
+        self._count('evaluation_misses', len(keys) - len(found))
+        return found
+
+    # 批量保存參數組合的績效指標（NaN與無限大以JSON的NaN/Infinity保存，讀回時不變）
+    def put_evaluations(self, keys, metrics_list):
+        if not keys:
+            return
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO evaluations (key, metrics, accessed_at) VALUES (?, ?, ?)',
+                [(key, json.dumps(metrics, default=float), now) for key, metrics in zip(keys, metrics_list)],
+            )
+        self.maybe_evict()
+
+    # 淘汰超過保存天數未讀取的結果，再依最後讀取時間淘汰超過容量或筆數上限的部分；每個進程至多每EVICT_INTERVAL秒檢查一次
+    def maybe_evict(self, force=False):
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_evict < EVICT_INTERVAL:
+                return 0
+            self._last_evict = now
+
+        conn = self._connect()
+        evicted = 0
+        with conn:
+            evicted += conn.execute('DELETE FROM runs WHERE accessed_at < ?', (now - self.ttl,)).rowcount
+            evicted += conn.execute('DELETE FROM evaluations WHERE accessed_at < ?', (now - self.ttl,)).rowcount
+
+            total_size = conn.execute('SELECT COALESCE(SUM(size), 0) FROM runs').fetchone()[0]
+            if total_size > self.max_bytes:
+                excess = total_size - self.max_bytes
+                freed = 0
+                stale = []
+                for run_id, size in conn.execute('SELECT id, size FROM runs ORDER BY accessed_at'):
+                    if freed >= excess:
+                        break
+                    stale.append((run_id,))
+                    freed += size
+                conn.executemany('DELETE FROM runs WHERE id = ?', stale)
+                evicted += len(stale)
+
+            count = conn.execute('SELECT COUNT(*) FROM evaluations').fetchone()[0]
+            if count > self.max_evaluations:
+                evicted += conn.execute(
+                    'DELETE FROM evaluations WHERE key IN (SELECT key FROM evaluations ORDER BY accessed_at LIMIT ?)',
+                    (count - self.max_evaluations,),
+                ).rowcount
+        self._count('evicted', evicted)
+        return evicted
+
+    def stats(self):
+        conn = self._connect()
+        runs, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM runs').fetchone()
+        evaluations = conn.execute('SELECT COUNT(*) FROM evaluations').fetchone()[0]
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            'runs': runs,
+            'size_bytes': size,
+            'max_bytes': self.max_bytes,
+            'evaluations': evaluations,
+            'max_evaluations': self.max_evaluations,
+            'ttl_days': self.ttl / 86400,
+        })
+        return stats
+
+
+# 進程層級共用的結果資料庫（第一次使用時才建立檔案）
+result_store = ResultStore(DEFAULT_RESULT_STORE_PATH)
@@ -0,0 +1,98 @@
+import json
+import math
+
+import numpy as np
+from flask import current_app
+
+from instrumentation import stage
+
+try:
+    import orjson
+except ImportError:  # orjson為選用套件，未安裝時改用標準json
+    orjson = None
+
+# 回應格式：columnar為 {dates: [...], values: {name: [...]}}，legacy為舊版以日期為鍵的字典/逐列記錄
+RESPONSE_FORMATS = ('columnar', 'legacy')
+DEFAULT_RESPONSE_FORMAT = 'columnar'
+
+
+# 由請求內容（response_format）或查詢參數（format）決定回應格式
+def get_response_format(data, args):
+    response_format = (data or {}).get('response_format') or args.get('format') or DEFAULT_RESPONSE_FORMAT
+    return response_format if response_format in RESPONSE_FORMATS else DEFAULT_RESPONSE_FORMAT
+
+
+# 以向量化方式格式化日期：日線為 YYYY-MM-DD，含時間的K線為 YYYY-MM-DDTHH:MM:SS
+def format_dates(index):
+    values = index.values.astype('M8[s]')
+    is_daily = (values.astype(np.int64) % 86400 == 0).all()
+    return np.datetime_as_string(values, unit='D' if is_daily else 's').tolist()
+
+
+# 組成欄式序列：日期只輸出一次，各序列保留為連續的float64陣列，編碼時NaN轉為null
+def columnar(index, values_by_name, dates=None):
+    return {
+        'dates': dates if dates is not None else format_dates(index),
+        'values': {
+            name: np.ascontiguousarray(values, dtype=np.float64) for name, values in values_by_name.items()
+        },
+    }
+
+
+def _nan_to_none(values):
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+# 舊版指標格式：{name: {date: value}}
+def columnar_to_legacy(block):
+    return {
+        name: dict(zip(block['dates'], _nan_to_none(values))) for name, values in block['values'].items()
+    }
+
+
+# 舊版逐列格式：[{'date': date, name: value}, ...]
+def columnar_to_records(block, name):
+    return [{'date': date, name: value} for date, value in zip(block['dates'], _nan_to_none(block['values'][name]))]
+
+
+# 非有限的浮點數（NaN、±Infinity）轉為None，與orjson的輸出相同（標準json會寫出無效的NaN/Infinity）
+def _finite_or_none(obj):
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _finite_or_none(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite_or_none(value) for value in obj]
+    return obj
+
+
+def _default(obj):
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind == 'f':
+            return np.where(np.isfinite(obj), obj, None).tolist()
+        return _finite_or_none(obj.tolist())
+    if isinstance(obj, np.generic):
+        return _finite_or_none(obj.item())
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+# 編碼回應內容：優先使用orjson直接序列化NumPy陣列，鍵排序與Flask的jsonify一致；
+# 未安裝orjson時以標準json編碼，非有限的浮點數同樣輸出為null
+def dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_SORT_KEYS)
+    return json.dumps(
+        _finite_or_none(payload), default=_default, sort_keys=True, separators=(',', ':'), ensure_ascii=False, allow_nan=False
+    )
+
+
+def json_response(payload, status=200):
+    with stage('serialize'):
+        body = dumps(payload)
+    return raw_json_response(body, status)
+
+
+# 以已序列化的JSON作為回應內容（例如結果資料庫中保存的結果）
+def raw_json_response(body, status=200):
+    return current_app.response_class(body, status=status, mimetype='application/json')
@@ -0,0 +1,200 @@
+import argparse
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+import numpy as np
+
+from app import app, backtest_strategy
+from indicators import INDICATOR_FUNCTIONS, compute_indicator
+from instrumentation import enable_shared_metrics, retire_shared_metrics
+from jobs import job_manager
+from market_data import generate_stock_data
+from montecarlo import run_montecarlo
+from shared_store import DEFAULT_STATE_STORE_PATH, SharedStoreError
+from strategies import STRATEGIES, IndicatorRows
+
+# 生產模式的預設值，可透過命令列參數或環境變數設定
+DEFAULT_HOST = os.environ.get('HOST', '0.0.0.0')
+DEFAULT_PORT = int(os.environ.get('PORT', '8000'))
+DEFAULT_WORKERS = int(os.environ.get('WEB_WORKERS', str(os.cpu_count() or 1)))
+DEFAULT_THREADS = int(os.environ.get('WEB_THREADS', '4'))
+
+# 每個工作進程處理多少個請求後重新啟動（0為不限），避免長時間執行後記憶體持續增長
+DEFAULT_MAX_REQUESTS = int(os.environ.get('WEB_MAX_REQUESTS', '0'))
+
+# 監聽佇列長度
+LISTEN_BACKLOG = 1024
+
+# 工作進程檢查停止信號的間隔（秒）
+POLL_INTERVAL = 0.5
+
+
+# 暖機：在fork前以小型模擬數據執行所有指標、策略信號、回測與蒙地卡羅模擬，
+# 載入pandas/NumPy的程式碼路徑與共用資料（股票清單等），工作進程以寫入時複製共享
+def warm_up():
+    started = time.perf_counter()
+    df = generate_stock_data('2330.TW', '1y', '1d', end='2024-12-31', seed=0).to_frame()
+    for indicator_type in INDICATOR_FUNCTIONS:
+        compute_indicator(df, indicator_type)
+
+    rows = IndicatorRows(df)
+    for strategy in STRATEGIES.values():
+        strategy.signals(df, [strategy.defaults], rows)
+    result = backtest_strategy(df, 'ma_cross', {}, 1000000)
+    returns = np.zeros(len(df))
+    run_montecarlo(df.index, returns, [], 1000000, result['performance_metrics'], paths=10, workers=1)
+    return time.perf_counter() - started
+
+
+# fork前準備共用的狀態資料庫：上次執行未完成的任務已沒有進程執行，標記為失敗；
+# 多進程時各工作進程的監控指標寫入狀態資料庫，由 /metrics 合併。父進程的連線在fork前關閉
+def prepare_shared_state(workers):
+    job_manager.fail_unfinished()
+    job_manager.close()
+    if workers > 1:
+        enable_shared_metrics(DEFAULT_STATE_STORE_PATH)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    access_log = False
+
+    def log_message(self, format, *args):
+        if self.access_log:
+            super().log_message(format, *args)
+
+
+# 每個工作進程內的執行緒伺服器，使用父進程建立的監聽socket
+class WorkerServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+    def __init__(self, listen_socket, handler, threads):
+        super().__init__(listen_socket.getsockname()[:2], handler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = listen_socket
+        self.server_name = socket.getfqdn(self.server_address[0])
+        self.server_port = self.server_address[1]
+        self.setup_environ()
+        self.threads = threads
+        self.handled = 0
+        self._semaphore = threading.BoundedSemaphore(threads)
+
+    # 限制同時處理的請求數（執行緒數）
+    def process_request(self, request, client_address):
+        self._semaphore.acquire()
+        self.handled += 1
+        super().process_request(request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._semaphore.release()
+
+    # 等待處理中的請求完成
+    def drain(self):
+        for _ in range(self.threads):
+            self._semaphore.acquire()
+
+
+def run_worker(listen_socket, threads, max_requests):
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    server = WorkerServer(listen_socket, QuietRequestHandler, threads)
+    server.timeout = POLL_INTERVAL
+    server.set_app(app)
+    while not stopping.is_set() and not (max_requests and server.handled >= max_requests):
+        server.handle_request()
+
+    server.drain()
+    try:
+        retire_shared_metrics()
+    except SharedStoreError:
+        pass
+    os._exit(0)
+
+
+# 預先fork的多進程伺服器：父進程暖機並建立監聽socket後fork出工作進程，工作進程結束時自動補上
+class PreforkServer:
+    def __init__(self, host, port, workers, threads, max_requests=0):
+        self.host = host
+        self.port = port
+        self.workers = max(1, workers)
+        self.threads = max(1, threads)
+        self.max_requests = max_requests
+        self.children = set()
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(self.socket, self.threads, self.max_requests)
+        self.children.add(pid)
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def serve_forever(self):
+        # 監聽socket設為非阻塞：多個工作進程同時等待連線時，未搶到連線的進程不會卡在accept
+        self.socket = socket.create_server((self.host, self.port), backlog=LISTEN_BACKLOG)
+        self.socket.setblocking(False)
+        self.port = self.socket.getsockname()[1]
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        for _ in range(self.workers):
+            self.spawn()
+        print(f'listening on http://{self.host}:{self.port} ({self.workers} workers × {self.threads} threads)', flush=True)
+
+        while self.children:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            self.children.discard(pid)
+            if not self.stopping:
+                self.spawn()
+        self.socket.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='以預先fork的多進程模式啟動後端API')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='工作進程數')
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS, help='每個工作進程同時處理的請求數')
+    parser.add_argument('--max-requests', type=int, default=DEFAULT_MAX_REQUESTS, help='工作進程處理多少個請求後重新啟動')
+    parser.add_argument('--max-body-mb', type=float, help='請求內容大小上限（MB），預設為 MAX_REQUEST_MB')
+    parser.add_argument('--no-warmup', action='store_true', help='啟動時不執行暖機')
+    parser.add_argument('--access-log', action='store_true', help='輸出每個請求的存取記錄')
+    args = parser.parse_args(argv)
+
+    if args.max_body_mb is not None:
+        app.config['MAX_CONTENT_LENGTH'] = int(args.max_body_mb * 1024 * 1024)
+    QuietRequestHandler.access_log = args.access_log
+    if not args.no_warmup:
+        print(f'warm-up finished in {warm_up():.2f}s', flush=True)
+
+    prepare_shared_state(args.workers)
+    PreforkServer(args.host, args.port, args.workers, args.threads, args.max_requests).serve_forever()
+
+
+# 供其他WSGI伺服器使用的應用程式物件
+application = app
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# 跨進程共用的狀態資料庫（SQLite檔案）：背景任務、串流會話與多進程伺服器的監控指標，可透過環境變數 STATE_STORE_PATH 設定
+DEFAULT_STATE_STORE_PATH = os.environ.get(
+    'STATE_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'state.sqlite3')
+)
+
+
+class SharedStoreError(Exception):
+    pass
+
+
+# 多個工作進程共用的SQLite資料庫（WAL模式），每個執行緒使用各自的連線，fork後重新連線；
+# 第一次使用時才建立檔案與資料表
+class SharedDatabase:
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+
+    def connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(self.schema)
+        except (OSError, sqlite3.Error) as e:
+            raise SharedStoreError(f'無法開啟狀態資料庫 {self.path}: {e}')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    # 寫入交易：開始時即取得寫入鎖，讀取後再寫回的操作在所有進程間依序執行
+    @contextmanager
+    def transaction(self):
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    # 關閉目前執行緒的連線（父進程在fork工作進程前呼叫，子進程不沿用父進程的連線）
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
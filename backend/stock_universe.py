@@ -0,0 +1,228 @@
+import csv
+import os
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+
+# 股票清單CSV（欄位：symbol, name, market, industry, aliases；aliases以 | 分隔），可透過環境變數 STOCK_UNIVERSE_CSV 設定
+DEFAULT_UNIVERSE_CSV = os.environ.get(
+    'STOCK_UNIVERSE_CSV', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stock_universe.csv')
+)
+
+# 市場別對應的交易所代碼（與Yahoo Finance相同）
+EXCHANGES = {'上市': 'TAI', '上櫃': 'TWO'}
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# 排序分數（依欄位：代碼、名稱、別名、產業）：完全相符 > 前綴相符 > 包含 > 模糊比對
+EXACT_SCORES = np.array([100, 90, 85, 30], dtype=np.float32)
+PREFIX_SCORES = np.array([80, 70, 60, 30], dtype=np.float32)
+SUBSTRING_SCORES = np.array([55, 50, 40, 30], dtype=np.float32)
+FUZZY_SCORE = 20
+
+# 模糊比對的最低相似度（字元二元組的Dice係數）；只比對代碼、名稱與別名
+FUZZY_THRESHOLD = 0.4
+FUZZY_FIELDS = (0, 1, 2)
+
+
+class StockUniverseError(Exception):
+    pass
+
+
+# 全形轉半形、轉小寫並去除前後空白
+def normalize(text):
+    return unicodedata.normalize('NFKC', text or '').strip().lower()
+
+
+def _bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class _TrieNode:
+    __slots__ = ('children', 'keys')
+
+    def __init__(self):
+        self.children = {}
+        self.keys = []
+
+
+# 前綴樹：每個節點保存所有以該前綴開頭的鍵編號，查詢只需走訪查詢字串長度的節點
+class PrefixTrie:
+    def __init__(self):
+        self.root = _TrieNode()
+
+    def insert(self, key, key_id):
+        node = self.root
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+            node.keys.append(key_id)
+
+    # 建立完成後把各節點的鍵編號轉為NumPy陣列，查詢時可直接向量化計分
+    def freeze(self):
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            node.keys = np.array(node.keys, dtype=np.int32)
+            stack.extend(node.children.values())
+
+    def keys(self, prefix):
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return EMPTY_KEYS
+        return node.keys
+
+
+EMPTY_KEYS = np.empty(0, dtype=np.int32)
+
+
+# 股票清單與搜尋索引：代碼、名稱、別名與產業都展開為索引鍵，
+# 以前綴樹查前綴相符、以字元/二元組索引查包含與模糊比對，分數以NumPy陣列按股票累計
+# 股票依（名稱長度, 代碼）排序後編號，同分時編號較小者排前面
+class StockUniverse:
+    def __init__(self, stocks):
+        stocks = sorted(stocks, key=lambda stock: (len(stock['name']), stock['symbol']))
+        self.stocks = []
+        self._by_symbol = {}
+        self._keys = []
+        key_owner = []
+        key_field = []
+
+        for stock_id, stock in enumerate(stocks):
+            symbol = stock['symbol']
+            code = symbol.split('.')[0]
+            self.stocks.append({
+                'symbol': symbol,
+                'name': stock['name'],
+                'exchange': stock.get('exchange', 'TAI'),
+                'market': stock.get('market', ''),
+                'industry': stock.get('industry', ''),
+            })
+            self._by_symbol[symbol.upper()] = stock_id
+            self._by_symbol.setdefault(code.upper(), stock_id)
+
+            field_keys = (
+                [symbol, code], [stock['name']], stock.get('aliases', []), [stock.get('industry', '')]
+            )
+            for field, keys in enumerate(field_keys):
+                for key in dict.fromkeys(normalize(key) for key in keys):
+                    if key:
+                        self._keys.append(key)
+                        key_owner.append(stock_id)
+                        key_field.append(field)
+
+        self._key_owner = np.array(key_owner, dtype=np.int32)
+        self._key_field = np.array(key_field, dtype=np.int8)
+        self._key_grams = np.array([max(1, len(_bigrams(key))) for key in self._keys], dtype=np.float32)
+
+        self._trie = PrefixTrie()
+        exact = defaultdict(list)
+        ngrams = defaultdict(list)
+        for key_id, key in enumerate(self._keys):
+            self._trie.insert(key, key_id)
+            exact[key].append(key_id)
+            for gram in set(key) | _bigrams(key):
+                ngrams[gram].append(key_id)
+        self._trie.freeze()
+        self._exact = {key: np.array(ids, dtype=np.int32) for key, ids in exact.items()}
+        self._ngrams = {gram: np.array(ids, dtype=np.int32) for gram, ids in ngrams.items()}
+
+    @classmethod
+    def from_csv(cls, path):
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                rows = list(csv.DictReader(f))
+        except OSError as e:
+            raise StockUniverseError(f'無法讀取股票清單 {path}: {e}')
+
+        stocks = []
+        for row in rows:
+            symbol = (row.get('symbol') or '').strip()
+            name = (row.get('name') or '').strip()
+            if not symbol or not name:
+                continue
+            market = (row.get('market') or '').strip()
+            stocks.append({
+                'symbol': symbol,
+                'name': name,
+                'market': market,
+                'exchange': EXCHANGES.get(market, 'TAI'),
+                'industry': (row.get('industry') or '').strip(),
+                'aliases': [alias.strip() for alias in (row.get('aliases') or '').split('|') if alias.strip()],
+            })
+        return cls(stocks)
+
+    def __len__(self):
+        return len(self.stocks)
+
+    # 以完整代碼（2330.TW）或數字代碼（2330）查詢股票
+    def get(self, symbol):
+        stock_id = self._by_symbol.get((symbol or '').upper())
+        return None if stock_id is None else self.stocks[stock_id]
+
+    def symbols(self):
+        return [stock['symbol'] for stock in self.stocks]
+
+    # 包含查詢字串的鍵：一至兩個字元直接查字元/二元組索引，較長的查詢取各二元組索引的交集後再確認
+    def _substring_keys(self, query):
+        if len(query) <= 2:
+            return self._ngrams.get(query, EMPTY_KEYS)
+        postings = sorted((self._ngrams.get(gram, EMPTY_KEYS) for gram in _bigrams(query)), key=len)
+        candidates = postings[0]
+        for posting in postings[1:]:
+            if not len(candidates):
+                break
+            candidates = np.intersect1d(candidates, posting, assume_unique=True)
+        return np.array([key_id for key_id in candidates.tolist() if query in self._keys[key_id]], dtype=np.int32)
+
+    # 與查詢字串的二元組Dice係數，每檔股票取代碼、名稱與別名中最高者
+    def _fuzzy_scores(self, query):
+        scores = np.zeros(len(self.stocks), dtype=np.float32)
+        grams = _bigrams(query)
+        postings = [self._ngrams[gram] for gram in grams if gram in self._ngrams]
+        if not postings:
+            return scores
+
+        shared = np.bincount(np.concatenate(postings), minlength=len(self._keys))
+        similarity = 2 * shared / (len(grams) + self._key_grams)
+        matched = np.flatnonzero((similarity >= FUZZY_THRESHOLD) & np.isin(self._key_field, FUZZY_FIELDS))
+        np.maximum.at(scores, self._key_owner[matched], FUZZY_SCORE * similarity[matched])
+        return scores
+
+    def _add_scores(self, scores, key_ids, field_scores):
+        if len(key_ids):
+            np.maximum.at(scores, self._key_owner[key_ids], field_scores[self._key_field[key_ids]])
+
+    # 依排序分數返回符合的股票編號
+    def _ranked_ids(self, query):
+        scores = np.zeros(len(self.stocks), dtype=np.float32)
+        self._add_scores(scores, self._substring_keys(query), SUBSTRING_SCORES)
+        self._add_scores(scores, self._trie.keys(query), PREFIX_SCORES)
+        self._add_scores(scores, self._exact.get(query, EMPTY_KEYS), EXACT_SCORES)
+
+        # 沒有任何相符結果時才以模糊比對補充（例如錯字）
+        matched = np.flatnonzero(scores)
+        if not len(matched) and len(query) > 1:
+            scores = self._fuzzy_scores(query)
+            matched = np.flatnonzero(scores)
+
+        return matched[np.argsort(-scores[matched], kind='stable')]
+
+    # 搜尋股票並分頁：返回 (符合的總數, 該頁的股票列表)，page從1開始
+    def search(self, query, page=1, page_size=DEFAULT_PAGE_SIZE):
+        query = normalize(query)
+        if not query:
+            return 0, []
+        page = max(1, page)
+        page_size = min(max(1, page_size), MAX_PAGE_SIZE)
+
+        ids = self._ranked_ids(query)
+        start = (page - 1) * page_size
+        return len(ids), [self.stocks[stock_id] for stock_id in ids[start:start + page_size].tolist()]
+
+
+# 進程層級共用的股票清單，啟動時載入
+stock_universe = StockUniverse.from_csv(DEFAULT_UNIVERSE_CSV)
@@ -0,0 +1,290 @@
+import numpy as np
+
+from backtest_engine import signals_to_positions
+from indicators import INDICATOR_FUNCTIONS, compute_indicator, normalize_params, price_fingerprint
+
+
+class StrategyError(ValueError):
+    pass
+
+
+# 同一價格序列上的指標矩陣：每組不同的指標參數只計算一次（經由進程層級的指標快取），
+# 供同一請求或同一次優化的所有參數組合共用
+class IndicatorRows:
+    def __init__(self, df, fingerprint=None):
+        self.df = df
+        self.fingerprint = fingerprint or price_fingerprint(df)
+        self._computed = {}
+
+    def arrays(self, indicator_type, params):
+        key = (indicator_type, normalize_params(indicator_type, params))
+        arrays = self._computed.get(key)
+        if arrays is None:
+            arrays = compute_indicator(self.df, indicator_type, params, self.fingerprint)
+            self._computed[key] = arrays
+        return arrays
+
+    # 每組參數一列的指標輸出矩陣（參數組合 × K線）
+    def __call__(self, indicator_type, output, params_list):
+        return np.vstack([
+            np.asarray(self.arrays(indicator_type, params)[output], dtype=np.float64) for params in params_list
+        ])
+
+
+# 投資組合的橫截面指標：frames為 {欄位: (時間 × 股票) DataFrame}，pandas對每檔股票（每欄）分別計算，
+# 結果與逐檔計算相同；以（股票 × 時間）矩陣提供給策略的信號函數，一次只計算一組參數，不經由指標快取
+class PanelRows:
+    def __init__(self, frames):
+        self.frames = frames
+        self._computed = {}
+
+    def arrays(self, indicator_type, params):
+        key = (indicator_type, normalize_params(indicator_type, params))
+        arrays = self._computed.get(key)
+        if arrays is None:
+            outputs = INDICATOR_FUNCTIONS[indicator_type](self.frames, **dict(key[1]))
+            arrays = {name: np.ascontiguousarray(values.T, dtype=np.float64) for name, values in outputs.items()}
+            self._computed[key] = arrays
+        return arrays
+
+    def __call__(self, indicator_type, output, params_list):
+        if len(params_list) != 1:
+            raise StrategyError('橫截面信號一次只能計算一組參數')
+        return self.arrays(indicator_type, params_list[0])[output]
+
+
+# 橫截面價格：以（股票 × 時間）矩陣提供 frames 的欄位
+class PanelPrices:
+    def __init__(self, frames):
+        self.frames = frames
+
+    def __getitem__(self, column):
+        return self.frames[column].to_numpy(dtype=np.float64).T
+
+
+def _param_column(param_grid, name, default, dtype=np.float64):
+    return np.array([params.get(name, default) for params in param_grid], dtype=dtype)[:, None]
+
+
+# a由下往上穿越b為1、由上往下穿越為-1；第一根K線沒有前一根可比較
+def _cross_signals(a, b):
+    prev_below_or_equal = np.zeros(a.shape, dtype=bool)
+    prev_below_or_equal[:, 1:] = a[:, :-1] <= b[:, :-1]
+    prev_above_or_equal = np.zeros(a.shape, dtype=bool)
+    prev_above_or_equal[:, 1:] = a[:, :-1] >= b[:, :-1]
+
+    signal = np.zeros(a.shape, dtype=np.int8)
+    signal[(a > b) & prev_below_or_equal] = 1
+    signal[(a < b) & prev_above_or_equal] = -1
+    return signal
+
+
+# 交易策略：宣告使用的指標、參數預設值與優化範圍、參數限制，以及向量化的信號函數
+# signal_func(df, param_grid, rows) 一次返回所有參數組合的信號矩陣（參數組合 × K線，1買入、-1賣出、0無信號），
+# rows為IndicatorRows；indicators(params) 返回 [(指標類型, 指標參數), ...]，供指標API與串流會話使用
+# 每根K線的信號只依賴當根與前一根K線的指標與價格，串流會話以此增量計算信號
+# panel為True時信號函數也接受橫截面輸入（df為 {欄位: (股票 × 時間) 陣列}、rows為PanelRows），投資組合回測一次計算一個股票區塊
+# 組合策略另有parts（子策略）與mode（合成方式）
+class Strategy:
+    def __init__(self, name, label, defaults, param_ranges, signal_func, indicators, constraint=None,
+                 parts=(), mode=None, panel=False):
+        self.name = name
+        self.label = label
+        self.defaults = defaults
+        self.param_ranges = param_ranges
+        self.signal_func = signal_func
+        self.indicators = indicators
+        self.constraint = constraint
+        self.parts = parts
+        self.mode = mode
+        self.panel = panel
+
+    def resolve_params(self, params):
+        return {**self.defaults, **(params or {})}
+
+    # 參數組合是否有效（例如短期均線須小於長期均線）
+    def is_valid(self, params):
+        return self.constraint is None or self.constraint(self.resolve_params(params))
+
+    def signals(self, df, param_grid, rows=None):
+        if not param_grid:
+            return np.zeros((0, len(df)), dtype=np.int8)
+        return self.signal_func(df, param_grid, rows or IndicatorRows(df))
+
+    # 橫截面信號：frames為 {欄位: (時間 × 股票) DataFrame}，返回（股票 × 時間）信號矩陣；只適用於panel為True的策略
+    def panel_signals(self, frames, params):
+        return self.signal_func(PanelPrices(frames), [params], PanelRows(frames))
+
+    def describe(self):
+        return {
+            'name': self.name,
+            'label': self.label,
+            'defaults': self.defaults,
+            'param_ranges': self.param_ranges,
+            'indicators': [
+                {'type': indicator_type, 'params': params} for indicator_type, params in self.indicators(self.defaults)
+            ],
+        }
+
+
+# 移動平均線交叉策略：短期均線上穿長期均線為買入信號，下穿為賣出信號
+def _ma_cross_signals(df, param_grid, rows):
+    ma_short = rows('ma', 'ma', [{'length': params.get('short', 5)} for params in param_grid])
+    ma_long = rows('ma', 'ma', [{'length': params.get('long', 20)} for params in param_grid])
+    return _cross_signals(ma_short, ma_long)
+
+
+# RSI超買超賣策略：RSI低於超賣線為買入信號，高於超買線為賣出信號
+def _rsi_signals(df, param_grid, rows):
+    rsi = rows('rsi', 'rsi', [{'length': params.get('period', 14)} for params in param_grid])
+    signal = np.zeros(rsi.shape, dtype=np.int8)
+    signal[rsi < _param_column(param_grid, 'oversold', 30)] = 1
+    signal[rsi > _param_column(param_grid, 'overbought', 70)] = -1
+    return signal
+
+
+# 布林帶突破策略：價格突破上軌為買入信號，跌破下軌為賣出信號
+def _bollinger_signals(df, param_grid, rows):
+    bands = [{'length': params.get('period', 20), 'std': params.get('std', 2)} for params in param_grid]
+    upper = rows('bollinger', 'bollinger_upper', bands)
+    close = np.atleast_2d(np.asarray(df['close'], dtype=np.float64))
+    signal = np.zeros(upper.shape, dtype=np.int8)
+    signal[close > upper] = 1
+    signal[close < rows('bollinger', 'bollinger_lower', bands)] = -1
+    return signal
+
+
+def _macd_params(params):
+    return {'fast': params.get('fast', 12), 'slow': params.get('slow', 26), 'signal': params.get('signal', 9)}
+
+
+# MACD策略：MACD線上穿信號線為買入信號，下穿為賣出信號
+def _macd_signals(df, param_grid, rows):
+    macd_params = [_macd_params(params) for params in param_grid]
+    return _cross_signals(rows('macd', 'macd', macd_params), rows('macd', 'macd_signal', macd_params))
+
+
+# KD策略：K值在超賣區上穿D值為買入信號（黃金交叉），在超買區下穿D值為賣出信號（死亡交叉）
+def _kd_signals(df, param_grid, rows):
+    kd_params = [{'k': params.get('k', 9), 'd': params.get('d', 3)} for params in param_grid]
+    stoch_k = rows('kd', 'stoch_k', kd_params)
+    cross = _cross_signals(stoch_k, rows('kd', 'stoch_d', kd_params))
+    signal = np.zeros(cross.shape, dtype=np.int8)
+    signal[(cross == 1) & (stoch_k < _param_column(param_grid, 'oversold', 20))] = 1
+    signal[(cross == -1) & (stoch_k > _param_column(param_grid, 'overbought', 80))] = -1
+    return signal
+
+
+STRATEGIES = {}
+
+
+def register_strategy(strategy):
+    STRATEGIES[strategy.name] = strategy
+    return strategy
+
+
+def get_strategy(name):
+    strategy = STRATEGIES.get(name) if isinstance(name, str) else None
+    if strategy is None:
+        raise StrategyError(f'不支援的策略類型: {name}')
+    return strategy
+
+
+# 多指標組合策略：各子策略的參數以「子策略名稱.參數」命名，信號由各子策略的持倉合成
+# mode為all時所有子策略都持多才買入、任一子策略轉空即賣出；vote時依多空持倉數多數決
+COMPOSITE_MODES = ('all', 'vote')
+
+
+# 組合策略中子策略的參數（去掉「子策略名稱.」前綴）
+def sub_params(part, params):
+    prefix = f'{part.name}.'
+    return {key[len(prefix):]: value for key, value in params.items() if key.startswith(prefix)}
+
+
+# 由各子策略的持倉（子策略 × ... × K線）合成組合策略的信號
+def combine_positions(positions, mode):
+    if mode == 'all':
+        return np.where((positions == 1).all(axis=0), 1, np.where((positions == -1).any(axis=0), -1, 0)).astype(np.int8)
+    return np.sign(positions.sum(axis=0, dtype=np.int64)).astype(np.int8)
+
+
+def composite_strategy(name, label, components, mode='all'):
+    if mode not in COMPOSITE_MODES:
+        raise StrategyError(f'不支援的組合方式: {mode}')
+    parts = [get_strategy(component) for component in components]
+
+    def prefixed(part, values):
+        return {f'{part.name}.{key}': value for key, value in values.items()}
+
+    def signal_func(df, param_grid, rows):
+        positions = np.stack([
+            signals_to_positions(part.signal_func(df, [sub_params(part, params) for params in param_grid], rows))
+            for part in parts
+        ])
+        return combine_positions(positions, mode)
+
+    return Strategy(
+        name,
+        label,
+        {key: value for part in parts for key, value in prefixed(part, part.defaults).items()},
+        {key: value for part in parts for key, value in prefixed(part, part.param_ranges).items()},
+        signal_func,
+        lambda params: [indicator for part in parts for indicator in part.indicators(sub_params(part, params))],
+        lambda params: all(part.is_valid(sub_params(part, params)) for part in parts),
+        parts=parts,
+        mode=mode,
+        panel=all(part.panel for part in parts),
+    )
+
+
+register_strategy(Strategy(
+    'ma_cross', '移動平均線交叉',
+    {'short': 5, 'long': 20},
+    {'short': [5, 10, 15], 'long': [20, 30, 40, 50]},
+    _ma_cross_signals,
+    lambda params: [('ma', {'length': params.get('short', 5)}), ('ma', {'length': params.get('long', 20)})],
+    lambda params: params['short'] < params['long'],
+    panel=True,
+))
+register_strategy(Strategy(
+    'rsi', 'RSI超買超賣',
+    {'period': 14, 'overbought': 70, 'oversold': 30},
+    {'period': [7, 14, 21], 'overbought': [65, 70, 75, 80], 'oversold': [20, 25, 30, 35]},
+    _rsi_signals,
+    lambda params: [('rsi', {'length': params.get('period', 14)})],
+    lambda params: params['oversold'] < params['overbought'],
+    panel=True,
+))
+register_strategy(Strategy(
+    'bollinger', '布林帶突破',
+    {'period': 20, 'std': 2},
+    {'period': [10, 20, 30], 'std': [1.5, 2, 2.5]},
+    _bollinger_signals,
+    lambda params: [('bollinger', {'length': params.get('period', 20), 'std': params.get('std', 2)})],
+    panel=True,
+))
+register_strategy(Strategy(
+    'macd', 'MACD交叉',
+    {'fast': 12, 'slow': 26, 'signal': 9},
+    {'fast': [8, 12, 16], 'slow': [21, 26, 31], 'signal': [7, 9, 11]},
+    _macd_signals,
+    lambda params: [('macd', _macd_params(params))],
+    lambda params: params['fast'] < params['slow'],
+    panel=True,
+))
+register_strategy(Strategy(
+    'kd', 'KD黃金/死亡交叉',
+    {'k': 9, 'd': 3, 'overbought': 80, 'oversold': 20},
+    {'k': [5, 9, 14], 'd': [3, 5], 'overbought': [70, 80], 'oversold': [20, 30]},
+    _kd_signals,
+    lambda params: [('kd', {'k': params.get('k', 9), 'd': params.get('d', 3)})],
+    lambda params: params['oversold'] < params['overbought'],
+    panel=True,
+))
+register_strategy(composite_strategy('ma_rsi', '均線交叉 + RSI', ['ma_cross', 'rsi']))
+register_strategy(composite_strategy('macd_kd', 'MACD + KD', ['macd', 'kd'], mode='vote'))
+
+
+# 一次產生多組參數在完整歷史上的交易信號（參數組合 × K線）
+def strategy_signal_rows(df, strategy_type, param_list, rows=None):
+    return get_strategy(strategy_type).signals(df, param_list, rows)
@@ -0,0 +1,543 @@
+import math
+import os
+import pickle
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import signals_to_positions
+from indicators import normalize_params
+from serialization import format_dates
+from shared_store import DEFAULT_STATE_STORE_PATH, SharedDatabase
+from strategies import StrategyError, combine_positions, get_strategy, sub_params
+
+# 最多保留的串流會話數，超過時淘汰最久未使用的會話
+MAX_SESSIONS = int(os.environ.get('MAX_STREAM_SESSIONS', '100'))
+
+NaN = float('nan')
+
+# 傳給策略信號函數的K線欄位
+WINDOW_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class StreamingError(Exception):
+    pass
+
+
+# 依IEEE規則相除（除以0得到inf或NaN，不拋出例外），與pandas/NumPy的運算結果一致
+def _divide(a, b):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return float(np.float64(a) / np.float64(b))
+
+
+# 固定視窗的移動平均，每根K線O(1)更新
+# 與pandas rolling().mean()相同：Kahan補償加總，加入與移除各自維護補償項，結果逐位元一致
+class RollingMean:
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.count = 0
+        self.sum_x = 0.0
+        self.compensation_add = 0.0
+        self.compensation_remove = 0.0
+        self.nobs = 0
+        self.neg_ct = 0
+        self.num_consecutive_same_value = 0
+        self.prev_value = NaN
+
+    def _add(self, val):
+        if val == val:
+            self.nobs += 1
+            y = val - self.compensation_add
+            t = self.sum_x + y
+            self.compensation_add = t - self.sum_x - y
+            self.sum_x = t
+            if math.copysign(1.0, val) < 0:
+                self.neg_ct += 1
+            if val == self.prev_value:
+                self.num_consecutive_same_value += 1
+            else:
+                self.num_consecutive_same_value = 1
+            self.prev_value = val
+
+    def _remove(self, val):
+        if val == val:
+            self.nobs -= 1
+            y = -val - self.compensation_remove
+            t = self.sum_x + y
+            self.compensation_remove = t - self.sum_x - y
+            self.sum_x = t
+            if math.copysign(1.0, val) < 0:
+                self.neg_ct -= 1
+
+    def update(self, val):
+        val = float(val)
+        # 第一根K線（或視窗為1時的每一根）重新初始化，與pandas的視窗邊界處理相同
+        if self.count == 0 or self.window == 1:
+            self.compensation_add = self.compensation_remove = self.sum_x = 0.0
+            self.nobs = self.neg_ct = 0
+            self.prev_value = val
+            self.num_consecutive_same_value = 0
+        elif len(self.values) == self.window:
+            self._remove(self.values[0])
+
+        if len(self.values) == self.window:
+            self.values.popleft()
+        self.values.append(val)
+        self._add(val)
+        self.count += 1
+
+        if self.nobs >= self.window and self.nobs > 0:
+            result = self.sum_x / self.nobs
+            if self.num_consecutive_same_value >= self.nobs:
+                result = self.prev_value
+            elif self.neg_ct == 0 and result < 0:
+                result = 0.0
+            elif self.neg_ct == self.nobs and result > 0:
+                result = 0.0
+            return result
+        return NaN
+
+
+# 固定視窗的樣本標準差（ddof=1），與pandas rolling().std()相同的Welford演算法
+class RollingStd:
+    def __init__(self, window, ddof=1):
+        self.window = window
+        self.ddof = ddof
+        self.values = deque()
+        self.count = 0
+        self.nobs = 0.0
+        self.mean_x = 0.0
+        self.ssqdm_x = 0.0
+        self.compensation_add = 0.0
+        self.compensation_remove = 0.0
+        self.num_consecutive_same_value = 0
+        self.prev_value = NaN
+
+    def _add(self, val):
+        if val != val:
+            return
+        self.nobs += 1
+        if val == self.prev_value:
+            self.num_consecutive_same_value += 1
+        else:
+            self.num_consecutive_same_value = 1
+        self.prev_value = val
+
+        prev_mean = self.mean_x - self.compensation_add
+        y = val - self.compensation_add
+        t = y - self.mean_x
+        self.compensation_add = t + self.mean_x - y
+        self.mean_x = self.mean_x + t / self.nobs
+        self.ssqdm_x = self.ssqdm_x + (val - prev_mean) * (val - self.mean_x)
+
+    def _remove(self, val):
+        if val == val:
+            self.nobs -= 1
+            if self.nobs:
+                prev_mean = self.mean_x - self.compensation_remove
+                y = val - self.compensation_remove
+                t = y - self.mean_x
+                self.compensation_remove = t + self.mean_x - y
+                self.mean_x = self.mean_x - t / self.nobs
+                self.ssqdm_x = self.ssqdm_x - (val - prev_mean) * (val - self.mean_x)
+            else:
+                self.mean_x = 0.0
+                self.ssqdm_x = 0.0
+
+    def update(self, val):
+        val = float(val)
+        if self.count == 0 or self.window == 1:
+            self.prev_value = val
+            self.num_consecutive_same_value = 0
+            self.mean_x = self.ssqdm_x = self.nobs = 0.0
+            self.compensation_add = self.compensation_remove = 0.0
+        elif len(self.values) == self.window:
+            self._remove(self.values[0])
+
+        if len(self.values) == self.window:
+            self.values.popleft()
+        self.values.append(val)
+        self._add(val)
+        self.count += 1
+
+        if self.nobs >= max(self.window, 1) and self.nobs > self.ddof:
+            if self.nobs == 1 or self.num_consecutive_same_value >= self.nobs:
+                var = 0.0
+            else:
+                var = self.ssqdm_x / (self.nobs - self.ddof)
+        else:
+            var = NaN
+        return 0.0 if var < 0 else math.sqrt(var)
+
+
+# 固定視窗的移動最小/最大值，以單調佇列維護，攤銷O(1)更新
+class RollingExtreme:
+    def __init__(self, window, is_max):
+        self.window = window
+        self.is_max = is_max
+        self.queue = deque()    # (索引, 數值)，隊首為目前的極值
+        self.window_values = deque()
+        self.count = 0
+        self.nobs = 0
+
+    def update(self, val):
+        val = float(val)
+        i = self.count
+        is_observation = val == val
+        if is_observation:
+            self.nobs += 1
+            ai = val
+        else:
+            ai = -math.inf if self.is_max else math.inf
+
+        queue = self.queue
+        if self.is_max:
+            while queue and (ai >= queue[-1][1] or queue[-1][1] != queue[-1][1]):
+                queue.pop()
+        else:
+            while queue and (ai <= queue[-1][1] or queue[-1][1] != queue[-1][1]):
+                queue.pop()
+        queue.append((i, val))
+        self.window_values.append((i, is_observation))
+        self.count += 1
+
+        start = self.count - self.window
+        while queue and queue[0][0] <= start - 1:
+            queue.popleft()
+        while self.window_values and self.window_values[0][0] <= start - 1:
+            if self.window_values.popleft()[1]:
+                self.nobs -= 1
+
+        if queue and self.nobs >= self.window:
+            return queue[0][1]
+        return NaN
+
+
+# 指數移動平均（adjust=False），與pandas ewm(span=...).mean()逐位元一致
+class EWMMean:
+    def __init__(self, span):
+        com = (span - 1) / 2
+        self.alpha = 1.0 / (1.0 + com)
+        self.old_wt_factor = 1.0 - self.alpha
+        self.weighted = None
+        self.old_wt = 1.0
+        self.nobs = 0
+
+    def update(self, cur):
+        cur = float(cur)
+        is_observation = cur == cur
+        if self.weighted is None:
+            self.weighted = cur
+            self.nobs = int(is_observation)
+        else:
+            self.nobs += is_observation
+            if self.weighted == self.weighted:
+                self.old_wt *= self.old_wt_factor
+                if is_observation:
+                    if self.weighted != cur:
+                        self.weighted = self.old_wt * self.weighted + self.alpha * cur
+                        self.weighted /= (self.old_wt + self.alpha)
+                    self.old_wt = 1.0
+            elif is_observation:
+                self.weighted = cur
+        return self.weighted if self.nobs >= 1 else NaN
+
+
+class MAState:
+    def __init__(self, length):
+        self.name = f'ma_{length}'
+        self.mean = RollingMean(length)
+
+    def update(self, bar):
+        return {self.name: self.mean.update(bar['close'])}
+
+
+class EMAState:
+    def __init__(self, length):
+        self.name = f'ema_{length}'
+        self.ema = EWMMean(length)
+
+    def update(self, bar):
+        return {self.name: self.ema.update(bar['close'])}
+
+
+class RSIState:
+    def __init__(self, length):
+        self.gain = RollingMean(length)
+        self.loss = RollingMean(length)
+        self.prev_close = NaN
+
+    def update(self, bar):
+        close = float(bar['close'])
+        delta = close - self.prev_close
+        self.prev_close = close
+        # 與 delta.where(delta > 0, 0) 及 -delta.where(delta < 0, 0) 相同（包含-0.0）
+        gain = delta if delta > 0 else 0.0
+        loss = -(delta if delta < 0 else 0.0)
+        rs = _divide(self.gain.update(gain), self.loss.update(loss))
+        return {'rsi': 100 - _divide(100, 1 + rs)}
+
+
+class MACDState:
+    def __init__(self, fast, slow, signal):
+        self.ema_fast = EWMMean(fast)
+        self.ema_slow = EWMMean(slow)
+        self.ema_signal = EWMMean(signal)
+
+    def update(self, bar):
+        macd_line = self.ema_fast.update(bar['close']) - self.ema_slow.update(bar['close'])
+        signal_line = self.ema_signal.update(macd_line)
+        return {
+            'macd': macd_line,
+            'macd_signal': signal_line,
+            'macd_histogram': macd_line - signal_line,
+        }
+
+
+class BollingerState:
+    def __init__(self, length, std):
+        self.middle = RollingMean(length)
+        self.std_dev = RollingStd(length)
+        self.std = std
+
+    def update(self, bar):
+        middle = self.middle.update(bar['close'])
+        std_dev = self.std_dev.update(bar['close'])
+        return {
+            'bollinger_upper': middle + std_dev * self.std,
+            'bollinger_middle': middle,
+            'bollinger_lower': middle - std_dev * self.std,
+        }
+
+
+class KDState:
+    def __init__(self, k, d):
+        self.low_min = RollingExtreme(k, is_max=False)
+        self.high_max = RollingExtreme(k, is_max=True)
+        self.d_mean = RollingMean(d)
+
+    def update(self, bar):
+        low_min = self.low_min.update(bar['low'])
+        high_max = self.high_max.update(bar['high'])
+        stoch_k = 100 * _divide(float(bar['close']) - low_min, high_max - low_min)
+        return {'stoch_k': stoch_k, 'stoch_d': self.d_mean.update(stoch_k)}
+
+
+INDICATOR_STATES = {
+    'ma': MAState,
+    'ema': EMAState,
+    'rsi': RSIState,
+    'macd': MACDState,
+    'bollinger': BollingerState,
+    'kd': KDState,
+}
+
+
+# 串流會話中策略使用的指標：以增量狀態逐根更新，保留前一根K線的數值，
+# 並以與IndicatorRows相同的介面提供（前一根 + 新增K線）的指標矩陣給策略的信號函數
+class StreamIndicatorRows:
+    def __init__(self, indicators):
+        self.states = {}
+        for indicator_type, params in indicators:
+            key = (indicator_type, normalize_params(indicator_type, params))
+            if key not in self.states:
+                self.states[key] = INDICATOR_STATES[indicator_type](**dict(key[1]))
+        self.previous = {key: None for key in self.states}
+        self.window = {}
+
+    # 依序更新所有指標（bars至少一根），window保存前一根K線與新增K線的數值（ma/ema的輸出名稱與批量計算相同）
+    def update(self, bars):
+        for key, state in self.states.items():
+            columns = {}
+            for bar in bars:
+                for name, value in state.update(bar).items():
+                    columns.setdefault(name, []).append(value)
+            if key[0] in ('ma', 'ema'):
+                columns = {key[0]: next(iter(columns.values()), [])}
+            previous = self.previous[key] or {name: NaN for name in columns}
+            self.window[key] = {
+                name: np.array([previous[name]] + values, dtype=np.float64) for name, values in columns.items()
+            }
+            self.previous[key] = {name: values[-1] for name, values in columns.items()}
+
+    def arrays(self, indicator_type, params):
+        key = (indicator_type, normalize_params(indicator_type, params))
+        if key not in self.window:
+            raise StreamingError(f'策略使用了未宣告的指標: {indicator_type}')
+        return self.window[key]
+
+    def __call__(self, indicator_type, output, params_list):
+        return np.vstack([self.arrays(indicator_type, params)[output] for params in params_list])
+
+
+# 以策略註冊表的信號函數增量計算交易信號：指標逐根增量更新，新增的一批K線（加上前一根K線）
+# 一次交給策略的向量化信號函數，結果與回測的信號相同；組合策略的各子策略持倉跨批次延續
+class StrategySignalState:
+    def __init__(self, strategy_type, params):
+        try:
+            self.strategy = get_strategy(strategy_type)
+        except StrategyError as e:
+            raise StreamingError(str(e))
+        self.params = self.strategy.resolve_params(params)
+        self.rows = StreamIndicatorRows(self.strategy.indicators(self.params))
+        self.part_positions = np.zeros(len(self.strategy.parts), dtype=np.int8)
+        self.previous_bar = {column: NaN for column in WINDOW_COLUMNS}
+
+    # 策略物件含lambda無法pickle，保存會話時改存策略名稱，讀回時再從註冊表取得
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['strategy'] = self.strategy.name
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.strategy = get_strategy(state['strategy'])
+
+    def update(self, bars):
+        if not bars:
+            return np.zeros(0, dtype=np.int8)
+        self.rows.update(bars)
+        window = pd.DataFrame(
+            {column: [self.previous_bar[column]] + [bar.get(column, NaN) for bar in bars] for column in WINDOW_COLUMNS},
+            dtype=np.float64
+        )
+        self.previous_bar = {column: bars[-1].get(column, NaN) for column in WINDOW_COLUMNS}
+
+        if not self.strategy.parts:
+            return self.strategy.signal_func(window, [self.params], self.rows)[0, 1:]
+
+        # 子策略的持倉從上一批結束時的持倉延續，再依組合方式合成信號
+        positions = []
+        for i, part in enumerate(self.strategy.parts):
+            signal = part.signal_func(window, [sub_params(part, self.params)], self.rows)[0].astype(np.int8)
+            signal[0] = self.part_positions[i]
+            positions.append(signals_to_positions(signal)[1:])
+        positions = np.stack(positions)
+        self.part_positions = positions[:, -1]
+        return combine_positions(positions, self.strategy.mode)
+
+
+# 串流會話：保存指標與信號的增量狀態，新增K線時只計算新的數值
+class StreamingSession:
+    def __init__(self, indicators, strategy=None):
+        self.id = uuid.uuid4().hex
+        self.indicator_states = []
+        for indicator in indicators:
+            indicator_type = indicator.get('type', '')
+            if indicator_type not in INDICATOR_STATES:
+                raise StreamingError(f'不支援的指標類型: {indicator_type}')
+            params = dict(normalize_params(indicator_type, indicator.get('params', {})))
+            self.indicator_states.append(INDICATOR_STATES[indicator_type](**params))
+
+        self.signal_state = None
+        if strategy:
+            self.signal_state = StrategySignalState(strategy.get('type', ''), strategy.get('params', {}))
+
+        self.position = 0
+        self.last_date = None
+        self.bars = 0
+
+    # 新增K線（dates為遞增的np.datetime64陣列，bars為對應的OHLC字典），返回新K線的指標與信號；
+    # 同一會話的並行新增由 SessionStore.update 的寫入交易依序執行
+    def append(self, dates, bars):
+        if len(dates) and self.last_date is not None and dates[0] <= self.last_date:
+            raise StreamingError('新增的K線日期必須晚於會話中最後一根K線')
+        if len(dates) > 1 and (np.diff(dates) <= np.timedelta64(0)).any():
+            raise StreamingError('新增的K線日期必須遞增')
+
+        values = {}
+        signals = []
+        positions = []
+        for bar in bars:
+            for state in self.indicator_states:
+                for name, value in state.update(bar).items():
+                    values.setdefault(name, []).append(value)
+        if self.signal_state is not None:
+            signals = self.signal_state.update(bars).tolist()
+            for signal in signals:
+                if signal != 0:
+                    self.position = signal
+                positions.append(self.position)
+
+        if len(dates):
+            self.last_date = dates[-1]
+        self.bars += len(bars)
+        return values, signals, positions
+
+    def info(self):
+        return {
+            'session_id': self.id,
+            'bars': self.bars,
+            'last_date': format_dates(pd.DatetimeIndex([self.last_date]))[0] if self.last_date is not None else None,
+            'position': self.position,
+        }
+
+
+SESSION_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS stream_sessions (
+    id TEXT PRIMARY KEY,
+    state BLOB NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stream_sessions_accessed_at ON stream_sessions (accessed_at);
+'''
+
+
+# 串流會話存放區：會話的增量狀態以pickle保存在共用的狀態資料庫，多進程伺服器的任一工作進程都能讀取與新增K線；
+# 超過上限時淘汰最久未使用的會話
+class SessionStore:
+    def __init__(self, path=DEFAULT_STATE_STORE_PATH, max_sessions=MAX_SESSIONS):
+        self.db = SharedDatabase(path, SESSION_SCHEMA)
+        self.max_sessions = max_sessions
+
+    def add(self, session):
+        with self.db.transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO stream_sessions (id, state, accessed_at) VALUES (?, ?, ?)',
+                (session.id, pickle.dumps(session), time.time()),
+            )
+            excess = conn.execute('SELECT COUNT(*) FROM stream_sessions').fetchone()[0] - self.max_sessions
+            if excess > 0:
+                conn.execute(
+                    'DELETE FROM stream_sessions WHERE id IN '
+                    '(SELECT id FROM stream_sessions ORDER BY accessed_at LIMIT ?)',
+                    (excess,),
+                )
+
+    def get(self, session_id):
+        conn = self.db.connect()
+        row = conn.execute('SELECT state FROM stream_sessions WHERE id = ?', (session_id,)).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE stream_sessions SET accessed_at = ? WHERE id = ?', (time.time(), session_id))
+        return pickle.loads(row[0])
+
+    # 讀取並更新會話：在寫入交易中讀出會話，區塊正常結束時寫回；區塊拋出例外時會話不變。
+    # 同一會話的新增K線在所有進程間依序執行；會話不存在時提供None
+    @contextmanager
+    def update(self, session_id):
+        with self.db.transaction() as conn:
+            row = conn.execute('SELECT state FROM stream_sessions WHERE id = ?', (session_id,)).fetchone()
+            session = pickle.loads(row[0]) if row is not None else None
+            yield session
+            if session is not None:
+                conn.execute(
+                    'UPDATE stream_sessions SET state = ?, accessed_at = ? WHERE id = ?',
+                    (pickle.dumps(session), time.time(), session_id),
+                )
+
+    def remove(self, session_id):
+        with self.db.transaction() as conn:
+            row = conn.execute('SELECT state FROM stream_sessions WHERE id = ?', (session_id,)).fetchone()
+            if row is None:
+                return None
+            conn.execute('DELETE FROM stream_sessions WHERE id = ?', (session_id,))
+        return pickle.loads(row[0])
+
+
+session_store = SessionStore()
@@ -0,0 +1,150 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import backtest_strategy
+from serialization import columnar_to_records
+
+INITIAL_CAPITAL = 1000000
+
+CASES = [
+    ('ma_cross', {'short': 5, 'long': 20}),
+    ('ma_cross', {'short': 3, 'long': 50}),
+    ('rsi', {'period': 14, 'overbought': 70, 'oversold': 30}),
+    ('rsi', {'period': 7, 'overbought': 60, 'oversold': 40}),
+    ('bollinger', {'period': 20, 'std': 2}),
+    ('bollinger', {'period': 10, 'std': 1}),
+]
+
+
+# 固定種子的模擬日K線
+def make_prices(n, seed):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.cumprod(1 + rng.normal(0, 0.02, n))
+    dates = pd.date_range('2000-01-01', periods=n, name='date')
+    return pd.DataFrame(
+        {'open': close, 'high': close * 1.01, 'low': close * 0.99, 'close': close, 'volume': 1000.0}, index=dates
+    )
+
+
+# 改寫為NumPy引擎之前的回測實作（逐列迴圈產生交易記錄），作為對照
+def reference_backtest(df, strategy_type, params, initial_capital):
+    df_backtest = df.copy()
+    df_backtest['signal'] = 0
+
+    if strategy_type == 'ma_cross':
+        ma_short = df_backtest['close'].rolling(window=params.get('short', 5)).mean()
+        ma_long = df_backtest['close'].rolling(window=params.get('long', 20)).mean()
+        cross_above = (ma_short > ma_long) & (ma_short.shift(1) <= ma_long.shift(1))
+        cross_below = (ma_short < ma_long) & (ma_short.shift(1) >= ma_long.shift(1))
+        df_backtest.loc[cross_above, 'signal'] = 1
+        df_backtest.loc[cross_below, 'signal'] = -1
+    elif strategy_type == 'rsi':
+        period = params.get('period', 14)
+        delta = df_backtest['close'].diff()
+        gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
+        loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
+        rsi = 100 - (100 / (1 + gain / loss))
+        df_backtest.loc[rsi < params.get('oversold', 30), 'signal'] = 1
+        df_backtest.loc[rsi > params.get('overbought', 70), 'signal'] = -1
+    elif strategy_type == 'bollinger':
+        period = params.get('period', 20)
+        middle = df_backtest['close'].rolling(window=period).mean()
+        std_dev = df_backtest['close'].rolling(window=period).std()
+        df_backtest.loc[df_backtest['close'] > middle + std_dev * params.get('std', 2), 'signal'] = 1
+        df_backtest.loc[df_backtest['close'] < middle - std_dev * params.get('std', 2), 'signal'] = -1
+
+    # 與 signal.replace(to_replace=0, method='ffill') 相同
+    df_backtest['position'] = df_backtest['signal'].replace(0, np.nan).ffill().fillna(0).astype(np.int64)
+    df_backtest['returns'] = df_backtest['close'].pct_change()
+    df_backtest['strategy_returns'] = df_backtest['position'].shift(1) * df_backtest['returns']
+    df_backtest['cumulative_strategy_returns'] = (1 + df_backtest['strategy_returns']).cumprod()
+    df_backtest['equity'] = initial_capital * df_backtest['cumulative_strategy_returns']
+
+    trades = []
+    current_position = 0
+    entry_price = 0
+    for index, row in df_backtest.iterrows():
+        if row['signal'] == 1 and current_position <= 0:
+            current_position = 1
+            entry_price = row['close']
+            trades.append({
+                'date': index.strftime('%Y-%m-%d'),
+                'type': '買入',
+                'price': entry_price,
+                'shares': int(initial_capital * 0.1 / entry_price),
+                'amount': int(initial_capital * 0.1),
+                'pnl': 0
+            })
+        elif row['signal'] == -1 and current_position >= 0:
+            if current_position > 0:
+                exit_price = row['close']
+                shares = int(initial_capital * 0.1 / entry_price)
+                trades.append({
+                    'date': index.strftime('%Y-%m-%d'),
+                    'type': '賣出',
+                    'price': exit_price,
+                    'shares': shares,
+                    'amount': int(shares * exit_price),
+                    'pnl': int(shares * (exit_price - entry_price))
+                })
+            current_position = -1
+            entry_price = row['close']
+
+    total_return = df_backtest['cumulative_strategy_returns'].iloc[-1] - 1
+    days = (df_backtest.index[-1] - df_backtest.index[0]).days
+    annualized_return = (1 + total_return) ** (365 / days) - 1 if days > 0 else 0
+    peak = df_backtest['equity'].cummax()
+    max_drawdown = ((df_backtest['equity'] - peak) / peak).min()
+    std = df_backtest['strategy_returns'].std()
+    sharpe_ratio = (annualized_return - 0.02) / (std * (252 ** 0.5)) if std > 0 else 0
+    winning_trades = sum(1 for trade in trades if trade['type'] == '賣出' and trade['pnl'] > 0)
+    total_trades = sum(1 for trade in trades if trade['type'] == '賣出')
+
+    df_backtest['year_month'] = df_backtest.index.strftime('%Y-%m')
+    monthly_returns = df_backtest.groupby('year_month')['strategy_returns'].sum().reset_index()
+    return {
+        'performance_metrics': {
+            'total_return': total_return,
+            'annualized_return': annualized_return,
+            'sharpe_ratio': sharpe_ratio,
+            'max_drawdown': max_drawdown,
+            'win_rate': winning_trades / total_trades if total_trades > 0 else 0,
+            'total_trades': total_trades
+        },
+        'trades': trades,
+        'monthly_returns': [
+            {'month': row['year_month'], 'return': row['strategy_returns']} for _, row in monthly_returns.iterrows()
+        ],
+        'equity_curve': [
+            {'date': index.strftime('%Y-%m-%d'), 'equity': row['equity']} for index, row in df_backtest.iterrows()
+        ]
+    }
+
+
+# 逐值比較（NaN在欄式輸出中可能為None）
+def assert_same(expected, actual, path='result'):
+    if isinstance(expected, dict):
+        assert isinstance(actual, dict) and expected.keys() == actual.keys(), path
+        for key in expected:
+            assert_same(expected[key], actual[key], f'{path}.{key}')
+    elif isinstance(expected, list):
+        assert isinstance(actual, list) and len(expected) == len(actual), path
+        for i, (a, b) in enumerate(zip(expected, actual)):
+            assert_same(a, b, f'{path}[{i}]')
+    elif isinstance(expected, float) and math.isnan(expected):
+        assert actual is None or (isinstance(actual, float) and math.isnan(actual)), path
+    else:
+        assert expected == actual, f'{path}: {expected!r} != {actual!r}'
+
+
+@pytest.mark.parametrize('strategy_type, params', CASES)
+@pytest.mark.parametrize('n, seed', [(30, 0), (365, 1), (3000, 2)])
+def test_numpy_engine_matches_reference(strategy_type, params, n, seed):
+    df = make_prices(n, seed)
+    expected = reference_backtest(df, strategy_type, params, INITIAL_CAPITAL)
+    actual = backtest_strategy(df, strategy_type, params, INITIAL_CAPITAL)
+    actual['equity_curve'] = columnar_to_records(actual['equity_curve'], 'equity')
+    assert_same(expected, actual)
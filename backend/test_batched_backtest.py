@@ -0,0 +1,61 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import batched_backtest as batched_module
+from app import backtest_strategy
+from batched_backtest import batched_backtest
+from execution import build_execution_model
+from strategies import STRATEGIES
+from test_backtest_engine import INITIAL_CAPITAL, make_prices
+
+# 每個策略最多比對的參數組合數（組合策略的網格有數百組，等距抽樣）
+MAX_GRID = 60
+
+EXECUTIONS = {
+    'ideal': None,
+    'taiwan_lots': {'lot_size': 1000, 'odd_lots': False, 'fee_discount': 0.6},
+    'taiwan_short_close': {'allow_short': True, 'fill': 'close'},
+}
+
+
+# 策略註冊表的預設候選值組成的參數網格（排除不合法的組合）
+def strategy_grid(strategy):
+    names = list(strategy.param_ranges)
+    grid = [dict(zip(names, values)) for values in itertools.product(*strategy.param_ranges.values())]
+    grid = [params for params in grid if strategy.is_valid(params)]
+    return grid[::max(1, len(grid) // MAX_GRID)]
+
+
+# 模擬日K線，開盤價與收盤價不同，次根開盤價成交與收盤價成交的結果才有差異
+def make_ohlc(n, seed):
+    df = make_prices(n, seed)
+    rng = np.random.default_rng(seed + 100)
+    df['open'] = df['close'] * (1 + rng.normal(0, 0.005, n))
+    return df
+
+
+@pytest.mark.parametrize('execution_name', list(EXECUTIONS))
+@pytest.mark.parametrize('strategy_type', list(STRATEGIES))
+def test_batched_metrics_match_backtest_strategy(monkeypatch, strategy_type, execution_name):
+    df = make_ohlc(400, 3)
+    grid = strategy_grid(STRATEGIES[strategy_type])
+    execution = build_execution_model(EXECUTIONS[execution_name])
+
+    # 縮小區塊，讓參數網格分成多個區塊計算
+    monkeypatch.setattr(batched_module, 'MAX_BLOCK_CELLS', len(df) * 7)
+    actual = batched_backtest(df, strategy_type, grid, INITIAL_CAPITAL, execution)
+
+    assert len(actual) == len(grid)
+    for params, metrics in zip(grid, actual):
+        expected = backtest_strategy(df, strategy_type, params, INITIAL_CAPITAL, execution)['performance_metrics']
+        if execution is None:
+            assert metrics == expected, params
+        else:
+            # 撮合模型的權益收益在批量與單一回測中以不同的陣列形狀計算，容許浮點捨入誤差
+            assert metrics == pytest.approx(expected, rel=1e-12, abs=1e-12), params
+
+
+def test_batched_backtest_empty_grid():
+    assert batched_backtest(make_prices(30, 0), 'ma_cross', [], INITIAL_CAPITAL) == []
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import backtest_strategy
+from execution import TaiwanExecution, build_execution_model, run_execution_backtest
+from serialization import columnar_to_records
+from strategies import STRATEGIES
+from test_backtest_engine import INITIAL_CAPITAL
+from test_batched_backtest import make_ohlc
+
+EXECUTIONS = [
+    {'model': 'taiwan'},
+    {'lot_size': 1000, 'odd_lots': False, 'fee_discount': 0.6},
+    {'allow_short': True, 'fill': 'close'},
+    {'allow_short': True, 'min_fee': 0, 'price_limit': 0.02},
+]
+
+# 交易記錄中買入/回補增加持股，賣出/放空減少持股
+SHARE_SIGN = {'買入': 1, '回補': 1, '賣出': -1, '放空': -1}
+
+
+def run(signal, close, open_prices=None, dates=None, initial_capital=INITIAL_CAPITAL, **options):
+    if dates is None:
+        dates = pd.date_range('2024-01-01', periods=len(close), name='date')
+    return run_execution_backtest(
+        TaiwanExecution(**options), dates,
+        None if open_prices is None else np.asarray(open_prices, dtype=np.float64),
+        np.asarray(close, dtype=np.float64), np.asarray(signal), initial_capital
+    )
+
+
+# 只用交易記錄重建每日權益（現金 + 持股 × 收盤價），應與回測返回的權益曲線一致
+def replay_ledger(trades, equity_curve, close, initial_capital):
+    flows = {}
+    for trade in trades:
+        shares = SHARE_SIGN[trade['type']] * trade['shares']
+        cash, position = flows.get(trade['date'], (0.0, 0))
+        flows[trade['date']] = (cash - shares * trade['price'] - trade['fee'] - trade['tax'], position + shares)
+
+    cash = float(initial_capital)
+    position = 0
+    equity = []
+    for point, price in zip(equity_curve, close):
+        day_cash, day_shares = flows.pop(point['date'], (0.0, 0))
+        cash += day_cash
+        position += day_shares
+        equity.append(cash + position * price)
+    assert not flows
+    return equity
+
+
+@pytest.mark.parametrize('options', EXECUTIONS)
+@pytest.mark.parametrize('strategy_type', list(STRATEGIES))
+def test_ledger_reconciles_to_equity_curve(strategy_type, options):
+    df = make_ohlc(500, 5)
+    execution = build_execution_model(options)
+    result = backtest_strategy(df, strategy_type, STRATEGIES[strategy_type].defaults, INITIAL_CAPITAL, execution)
+    trades = result['trades']
+    curve = columnar_to_records(result['equity_curve'], 'equity')
+    close = df['close'].to_numpy()
+
+    replayed = replay_ledger(trades, curve, close, INITIAL_CAPITAL)
+    assert [point['equity'] for point in curve] == pytest.approx(replayed, rel=1e-12)
+
+    reconciliation = result['reconciliation']
+    assert reconciliation['final_equity'] == pytest.approx(curve[-1]['equity'], rel=1e-12)
+    assert reconciliation['difference'] == pytest.approx(0, abs=1e-6)
+    assert reconciliation['total_fees'] == sum(trade['fee'] for trade in trades)
+    assert reconciliation['total_tax'] == sum(trade['tax'] for trade in trades)
+    # 平倉損益在交易記錄中四捨五入到元
+    closing_pnl = sum(trade['pnl'] for trade in trades if trade['type'] in ('賣出', '回補'))
+    assert closing_pnl == pytest.approx(reconciliation['realized_pnl'], abs=len(trades))
+
+
+# 整股交易、次根開盤價成交：100000元以99元買入只能買1張，手續費與證交稅無條件捨去
+def test_round_lot_fee_and_tax():
+    result = run(
+        [1, 0, 0, -1, 0], close=[100, 100, 105, 108, 110], open_prices=[100, 99, 104, 110, 111],
+        lot_size=1000, odd_lots=False
+    )
+    assert result['trades'] == [
+        {'date': '2024-01-02', 'type': '買入', 'price': 99.0, 'shares': 1000, 'amount': 99000, 'fee': 141, 'tax': 0, 'pnl': 0},
+        {'date': '2024-01-05', 'type': '賣出', 'price': 111.0, 'shares': 1000, 'amount': 111000, 'fee': 158, 'tax': 333, 'pnl': 11368},
+    ]
+    assert result['equity_curve']['values']['equity'].tolist() == [1000000, 1000859, 1005859, 1008859, 1011368]
+    assert result['reconciliation']['final_equity'] == 1011368
+    assert result['reconciliation']['realized_pnl'] == 11368
+
+
+# 零股交易：折扣後的手續費低於最低手續費時收20元
+def test_odd_lots_with_min_fee():
+    result = run([1, 0, -1], close=[33, 34, 35], initial_capital=100000, fill='close', fee_discount=0.6)
+    assert [(t['type'], t['shares'], t['fee'], t['tax'], t['pnl']) for t in result['trades']] == [
+        ('買入', 303, 20, 0, 0),
+        ('賣出', 303, 20, 31, 535),
+    ]
+    assert result['reconciliation']['final_equity'] == 100535
+
+
+# 同一天買進賣出（分鐘線）以當沖稅率課稅，隔日賣出以一般稅率課稅
+@pytest.mark.parametrize('sell_bar, tax, pnl', [(2, 156, 3554), (3, 312, 3398)])
+def test_day_trade_tax(sell_bar, tax, pnl):
+    dates = pd.DatetimeIndex(['2024-01-02 09:00', '2024-01-02 09:01', '2024-01-02 09:02', '2024-01-03 09:00'], name='date')
+    signal = [1, 0, 0, 0]
+    signal[sell_bar] = -1
+    result = run(signal, close=[50, 51, 52, 52], dates=dates, fill='close')
+    buy, sell = result['trades']
+    assert (buy['shares'], buy['fee']) == (2000, 142)
+    assert (sell['date'], sell['fee'], sell['tax'], sell['pnl']) == (dates[sell_bar].strftime('%Y-%m-%dT%H:%M:%S'), 148, tax, pnl)
+
+
+# 次根開盤價觸及漲停時買不到，委託順延到下一根可成交的K線
+def test_limit_up_delays_buy():
+    result = run([1, 0, 0, 0], close=[100, 110, 112, 113], open_prices=[100, 110, 111, 112])
+    assert [(t['date'], t['price']) for t in result['trades']] == [('2024-01-03', 111.0)]
+
+
+# 放空建倉時課徵證交稅，反手做多時一筆成交先回補再買入，成本依數量分攤
+def test_short_then_reverse():
+    result = run([-1, 0, 1, 0], close=[100, 95, 90, 92], fill='close', allow_short=True)
+    short, cover = result['trades']
+    assert (short['type'], short['shares'], short['fee'], short['tax']) == ('放空', 1000, 142, 300)
+    assert (cover['type'], cover['shares'], cover['fee'], cover['tax'], cover['pnl']) == ('回補', 2111, 270, 0, 9430)
+    assert result['reconciliation']['difference'] == pytest.approx(0, abs=1e-6)
@@ -0,0 +1,77 @@
+import os
+from functools import partial
+
+import pytest
+
+from app import evaluate_param_chunk
+from execution import build_execution_model
+from parallel_search import ParallelSearchError, WorkerPool, evaluate_param_grid, resolve_workers, split_chunks
+from strategies import STRATEGIES
+from test_backtest_engine import INITIAL_CAPITAL
+from test_batched_backtest import make_ohlc, strategy_grid
+
+WORKERS = 3
+
+
+# 工作進程數不超過CPU核心數，單核心的機器上也要實際建立多個工作進程
+@pytest.fixture
+def many_cpus(monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+
+
+@pytest.mark.parametrize('strategy_type, execution', [
+    ('ma_cross', None),
+    ('macd_kd', None),
+    ('rsi', {'lot_size': 1000, 'odd_lots': False}),
+])
+def test_parallel_grid_matches_single_worker(many_cpus, strategy_type, execution):
+    df = make_ohlc(300, 7)
+    grid = strategy_grid(STRATEGIES[strategy_type])
+    evaluate_chunk = evaluate_param_chunk
+    if execution is not None:
+        evaluate_chunk = partial(evaluate_param_chunk, execution=build_execution_model(execution))
+
+    expected = evaluate_param_grid(evaluate_chunk, df, strategy_type, grid, INITIAL_CAPITAL, workers=1)
+    actual = evaluate_param_grid(evaluate_chunk, df, strategy_type, grid, INITIAL_CAPITAL, workers=WORKERS)
+    assert actual == expected
+
+
+# 同一個進程池分批評估（背景任務的進度分段、隨機搜索的每一批），合併後與一次評估整個網格相同
+def test_worker_pool_batches_match_single_worker(many_cpus):
+    df = make_ohlc(300, 8)
+    grid = strategy_grid(STRATEGIES['kd'])
+    expected = evaluate_param_chunk(df, 'kd', grid, INITIAL_CAPITAL)
+
+    with WorkerPool(evaluate_param_chunk, df, 'kd', INITIAL_CAPITAL, WORKERS) as pool:
+        assert pool.workers == WORKERS
+        actual = [metrics for start in range(0, len(grid), 7) for metrics in pool.evaluate(grid[start:start + 7])]
+    assert actual == expected
+
+
+def chunk_pids(df, strategy_type, param_chunk, initial_capital):
+    return [os.getpid()] * len(param_chunk)
+
+
+# 多進程時任務塊在工作進程中評估，不在提交任務的進程中執行
+def test_worker_pool_runs_in_worker_processes(many_cpus):
+    pids = evaluate_param_grid(chunk_pids, make_ohlc(30, 0), 'ma_cross', list(range(24)), INITIAL_CAPITAL, workers=WORKERS)
+    assert len(pids) == 24
+    assert os.getpid() not in pids
+
+
+def test_split_chunks_keeps_order():
+    grid = list(range(10))
+    chunks = split_chunks(grid, 4)
+    assert [len(chunk) for chunk in chunks] == [3, 3, 2, 2]
+    assert [value for chunk in chunks for value in chunk] == grid
+    assert split_chunks(grid[:2], 8) == [[0], [1]]
+
+
+def test_resolve_workers(many_cpus):
+    assert resolve_workers(2) == 2
+    assert resolve_workers(16) == 4
+    assert resolve_workers(0) == 4
+    assert resolve_workers('auto') == 4
+    for invalid in (True, 1.5, 'many'):
+        with pytest.raises(ParallelSearchError):
+            resolve_workers(invalid)
@@ -0,0 +1,55 @@
+import json
+
+import numpy as np
+import pytest
+
+import serialization
+from app import backtest_strategy
+from execution import build_execution_model
+from test_backtest_engine import INITIAL_CAPITAL, make_prices
+
+PAYLOAD = {
+    'nan': float('nan'),
+    'inf': float('inf'),
+    'scalars': [np.float64('-inf'), np.float32('nan'), np.int64(3), 1.5, None, '均線'],
+    'arrays': {'float': np.array([1.0, np.nan, np.inf]), 'matrix': np.array([[np.nan, 2.0]]), 'int': np.arange(3)},
+    'tuple': (1, float('nan')),
+}
+
+EXPECTED = {
+    'nan': None,
+    'inf': None,
+    'scalars': [None, None, 3, 1.5, None, '均線'],
+    'arrays': {'float': [1.0, None, None], 'matrix': [[None, 2.0]], 'int': [0, 1, 2]},
+    'tuple': [1, None],
+}
+
+
+def reject_constant(name):
+    raise ValueError(f'invalid JSON constant {name}')
+
+
+# 以嚴格模式解析（不接受NaN/Infinity）
+def strict_loads(body):
+    return json.loads(body, parse_constant=reject_constant)
+
+
+def standard_json_dumps(monkeypatch, payload):
+    monkeypatch.setattr(serialization, 'orjson', None)
+    return serialization.dumps(payload)
+
+
+def test_standard_json_writes_null_for_non_finite_floats(monkeypatch):
+    assert strict_loads(standard_json_dumps(monkeypatch, PAYLOAD)) == EXPECTED
+
+
+@pytest.mark.skipif(serialization.orjson is None, reason='orjson未安裝')
+@pytest.mark.parametrize('execution', [None, {'model': 'taiwan'}])
+def test_standard_json_matches_orjson(monkeypatch, execution):
+    result = backtest_strategy(
+        make_prices(200, 4), 'rsi', {'period': 14}, INITIAL_CAPITAL, build_execution_model(execution)
+    )
+    for payload in (PAYLOAD, result):
+        expected = strict_loads(serialization.dumps(payload))
+        assert strict_loads(standard_json_dumps(monkeypatch, payload)) == expected
+        monkeypatch.undo()
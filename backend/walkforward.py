@@ -0,0 +1,214 @@
+from functools import partial
+
+import numpy as np
+
+from backtest_engine import RISK_FREE_RATE, signals_to_positions
+from batched_backtest import batch_strategy_returns, trade_events
+from parallel_search import evaluate_param_grid
+from serialization import columnar, format_dates
+
+# 預設訓練與測試視窗長度（K線數）：約一年訓練、一季測試
+DEFAULT_TRAIN_SIZE = 252
+DEFAULT_TEST_SIZE = 63
+
+# 每個計算區塊最多容納的矩陣元素數（參數組合數 × K線數）；前綴和陣列較多，上限比批量回測小
+MAX_BLOCK_CELLS = 500000
+
+WALKFORWARD_METRICS = ('total_return', 'annualized_return', 'sharpe_ratio', 'max_drawdown', 'win_rate', 'total_trades')
+
+
+# 建立前進式視窗：[(訓練起點, 訓練終點, 測試起點, 測試終點)]，區間為左閉右開的K線索引
+# 每次向前移動一個測試視窗；anchored為True時訓練視窗固定從第一根K線開始（擴張視窗）
+def build_windows(n_bars, train_size, test_size, anchored=False):
+    if train_size < 2 or test_size < 1:
+        raise ValueError('訓練視窗至少需要2根K線，測試視窗至少需要1根K線')
+
+    windows = []
+    train_end = train_size
+    while train_end < n_bars:
+        train_start = 0 if anchored else train_end - train_size
+        windows.append((train_start, train_end, train_end, min(train_end + test_size, n_bars)))
+        train_end += test_size
+    return windows
+
+
+def _prefix_sum(values):
+    prefix = np.zeros((values.shape[0], values.shape[1] + 1))
+    np.cumsum(values, axis=1, out=prefix[:, 1:])
+    return prefix
+
+
+# 以前綴和計算每列在各區間 [a, b) 的績效指標，返回 [{指標名稱: 每列的值}]
+# 區間的收益為 strategy_returns[a:b]（持倉由完整歷史延續，不在區間起點重置）；
+# sell_events/win_events 為標記平倉與獲利平倉K線的矩陣
+def segment_metrics(day_numbers, strategy_returns, sell_events, win_events, segments):
+    valid = ~np.isnan(strategy_returns)
+    returns = np.where(valid, strategy_returns, 0.0)
+    growth = 1 + returns
+
+    count = _prefix_sum(valid)
+    sum_returns = _prefix_sum(returns)
+    sum_squares = _prefix_sum(returns * returns)
+    # 累積收益以對數前綴和計算，歸零與負值另外計數
+    with np.errstate(divide='ignore'):
+        log_growth = _prefix_sum(np.where(growth == 0, 0.0, np.log(np.abs(growth))))
+    zero_growth = _prefix_sum(growth == 0)
+    negative_growth = _prefix_sum(growth < 0)
+    sells = _prefix_sum(sell_events)
+    wins = _prefix_sum(win_events)
+
+    results = []
+    for a, b in segments:
+        n = count[:, b] - count[:, a]
+        sign = np.where((negative_growth[:, b] - negative_growth[:, a]) % 2 == 1, -1.0, 1.0)
+        total_return = np.where(
+            zero_growth[:, b] - zero_growth[:, a] > 0, 0.0, sign * np.exp(log_growth[:, b] - log_growth[:, a])
+        ) - 1
+
+        days = int(day_numbers[b - 1] - day_numbers[max(a - 1, 0)])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            annualized_return = (1 + total_return) ** (365 / days) - 1 if days > 0 else np.zeros(len(n))
+            mean = (sum_returns[:, b] - sum_returns[:, a]) / n
+            variance = ((sum_squares[:, b] - sum_squares[:, a]) - n * mean * mean) / (n - 1)
+            std = np.where(n > 1, np.sqrt(np.maximum(variance, 0.0)), np.nan)
+            sharpe_ratio = np.where(std > 0, (annualized_return - RISK_FREE_RATE) / (std * (252 ** 0.5)), 0.0)
+
+        # 最大回撤：區間起點的權益為1，逐K線累積
+        equity = np.cumprod(growth[:, a:b], axis=1)
+        peak = np.maximum(np.maximum.accumulate(equity, axis=1), 1.0)
+        max_drawdown = np.minimum(((equity - peak) / peak).min(axis=1, initial=0.0), 0.0)
+
+        total_trades = (sells[:, b] - sells[:, a]).astype(np.int64)
+        winning_trades = wins[:, b] - wins[:, a]
+        win_rate = np.where(total_trades > 0, winning_trades / np.maximum(total_trades, 1), 0.0)
+
+        results.append({
+            'total_return': total_return,
+            'annualized_return': annualized_return,
+            'sharpe_ratio': sharpe_ratio,
+            'max_drawdown': max_drawdown,
+            'win_rate': win_rate,
+            'total_trades': total_trades,
+        })
+    return results
+
+
+# 對一組參數計算完整歷史的策略收益與平倉事件矩陣
+def _strategy_rows(signal_rows, df, strategy_type, params_block, close, returns, initial_capital):
+    position = signals_to_positions(np.asarray(signal_rows(df, strategy_type, params_block), dtype=np.int8))
+    strategy_returns, _ = batch_strategy_returns(returns, position)
+
+    sell_rows, sell_cols, sell_pnl = trade_events(close, position, initial_capital)
+    sell_events = np.zeros(position.shape, dtype=np.int8)
+    sell_events[sell_rows, sell_cols] = 1
+    win_events = np.zeros(position.shape, dtype=np.int8)
+    win_events[sell_rows[sell_pnl > 0], sell_cols[sell_pnl > 0]] = 1
+    return strategy_returns, sell_events, win_events
+
+
+def _price_arrays(df):
+    close = df['close'].to_numpy(dtype=np.float64)
+    returns = np.empty_like(close)
+    returns[0] = np.nan
+    returns[1:] = close[1:] / close[:-1] - 1
+    day_numbers = df.index.values.astype('M8[D]').astype(np.int64)
+    return close, returns, day_numbers
+
+
+# 評估一組參數在所有訓練視窗的目標指標：指標與信號只對完整歷史計算一次，各視窗以前綴和取得
+# 返回與param_chunk順序一致的列表，每個元素為各視窗的目標指標值
+def evaluate_train_windows(signal_rows, windows, target_metric, df, strategy_type, param_chunk, initial_capital):
+    close, returns, day_numbers = _price_arrays(df)
+    segments = [(train_start, train_end) for train_start, train_end, _, _ in windows]
+    block_size = max(1, MAX_BLOCK_CELLS // max(1, len(close)))
+
+    values = []
+    for start in range(0, len(param_chunk), block_size):
+        block = param_chunk[start:start + block_size]
+        rows = _strategy_rows(signal_rows, df, strategy_type, block, close, returns, initial_capital)
+        window_metrics = segment_metrics(day_numbers, *rows, segments)
+        values.extend(np.column_stack([metrics[target_metric] for metrics in window_metrics]).tolist())
+    return values
+
+
+def _metrics_dict(metrics, row):
+    return {
+        name: int(metrics[name][row]) if name == 'total_trades' else float(metrics[name][row])
+        for name in WALKFORWARD_METRICS
+    }
+
+
+# 前進式分析：在每個訓練視窗選出目標指標最佳的參數，套用到緊接的測試視窗，
+# 並把各測試視窗的收益串接成樣本外權益曲線
+# signal_rows(df, strategy_type, params_list) 返回（參數組合 × K線）的信號矩陣
+def run_walkforward(df, strategy_type, param_grid, target_metric, initial_capital, signal_rows,
+                    train_size=DEFAULT_TRAIN_SIZE, test_size=DEFAULT_TEST_SIZE, anchored=False, workers=None):
+    if target_metric not in WALKFORWARD_METRICS:
+        raise ValueError(f'不支援的目標指標: {target_metric}')
+    if not param_grid:
+        raise ValueError('此策略沒有可優化的參數組合')
+
+    windows = build_windows(len(df), train_size, test_size, anchored)
+    if not windows:
+        raise ValueError('價格數據不足以建立訓練與測試視窗')
+
+    # 訓練視窗：各參數組合在所有視窗的目標指標（按參數組合分段並行評估）
+    evaluate_chunk = partial(evaluate_train_windows, signal_rows, windows, target_metric)
+    train_values = np.array(
+        evaluate_param_grid(evaluate_chunk, df, strategy_type, param_grid, initial_capital, workers), dtype=np.float64
+    ).reshape(len(param_grid), len(windows))
+
+    # 目標指標為NaN的組合視為最差；同分時取參數網格中較前面的組合
+    if target_metric == 'max_drawdown':
+        best_indices = np.argmin(np.where(np.isnan(train_values), np.inf, train_values), axis=0)
+    else:
+        best_indices = np.argmax(np.where(np.isnan(train_values), -np.inf, train_values), axis=0)
+
+    # 測試視窗：只對被選中的參數組合重新計算完整歷史的收益
+    selected = sorted(set(best_indices.tolist()))
+    selected_rows = {index: row for row, index in enumerate(selected)}
+    close, returns, day_numbers = _price_arrays(df)
+    strategy_returns, sell_events, win_events = _strategy_rows(
+        signal_rows, df, strategy_type, [param_grid[index] for index in selected], close, returns, initial_capital
+    )
+    test_segments = [(test_start, test_end) for _, _, test_start, test_end in windows]
+    test_metrics = segment_metrics(day_numbers, strategy_returns, sell_events, win_events, test_segments)
+
+    # 串接各測試視窗的收益與平倉事件，作為單一的樣本外序列
+    stitched_returns = np.full((1, len(close)), np.nan)
+    stitched_sells = np.zeros((1, len(close)), dtype=np.int8)
+    stitched_wins = np.zeros((1, len(close)), dtype=np.int8)
+    window_results = []
+    dates = df.index
+    date_labels = format_dates(dates)
+    for w, (train_start, train_end, test_start, test_end) in enumerate(windows):
+        best_index = int(best_indices[w])
+        row = selected_rows[best_index]
+        stitched_returns[0, test_start:test_end] = strategy_returns[row, test_start:test_end]
+        stitched_sells[0, test_start:test_end] = sell_events[row, test_start:test_end]
+        stitched_wins[0, test_start:test_end] = win_events[row, test_start:test_end]
+        window_results.append({
+            'train_start': date_labels[train_start],
+            'train_end': date_labels[train_end - 1],
+            'test_start': date_labels[test_start],
+            'test_end': date_labels[test_end - 1],
+            'best_params': param_grid[best_index],
+            'train_metric_value': float(train_values[best_index, w]),
+            'test_metrics': _metrics_dict(test_metrics[w], row),
+        })
+
+    oos_start = windows[0][2]
+    oos_end = windows[-1][3]
+    oos_metrics = segment_metrics(day_numbers, stitched_returns, stitched_sells, stitched_wins, [(oos_start, oos_end)])[0]
+    oos_returns = stitched_returns[0, oos_start:oos_end]
+    equity = initial_capital * np.cumprod(1 + np.where(np.isnan(oos_returns), 0.0, oos_returns))
+
+    return {
+        'target_metric': target_metric,
+        'param_count': len(param_grid),
+        'windows': window_results,
+        'out_of_sample': {
+            'performance_metrics': _metrics_dict(oos_metrics, 0),
+            'equity_curve': columnar(dates[oos_start:oos_end], {'equity': equity}, date_labels[oos_start:oos_end]),
+        },
+    }